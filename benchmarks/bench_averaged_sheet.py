@@ -0,0 +1,89 @@
+"""
+Time and peak memory of the Averaged transmission sheet of IRisF1HDF5Reader,
+compared with importing the Transmission sheet and averaging it like
+scripts/acquisition_average.py.
+
+    python benchmarks/bench_averaged_sheet.py --acquisitions 200
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+)
+from heterodyne_postprocessing.misc.syntheticData import write_synthetic_processed_file
+from orangecontrib.protospec.data import IRisF1HDF5Reader
+
+
+def import_then_average(filename):
+    data = IRisF1HDF5Reader(filename).read().copy()
+    num_acqs = int(data.get_column("Acquisition").max()) + 1
+    hypercube = data.X.reshape(
+        (num_acqs, int(data.X.shape[0] / num_acqs), data.X.shape[1])
+    )
+    return np.mean(hypercube, axis=0)
+
+
+def averaged_sheet(filename):
+    reader = IRisF1HDF5Reader(filename)
+    reader.select_sheet(IRisF1HDF5Reader.AVERAGED_TRANSMISSION)
+    return reader.read().X
+
+
+def measure(func, filename, repeat):
+    """Best time of repeat runs, then the peak memory of one traced run."""
+    func(filename)  # warm up, e.g. the imports of the processing classes
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(filename)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = func(filename)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, min(timings), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--acquisitions', type=int, default=200)
+    parser.add_argument('--lines', type=int, default=200)
+    parser.add_argument('--times', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = write_synthetic_processed_file(
+            os.path.join(tmp, 'bench_processed_data.h5'),
+            numAcq=args.acquisitions,
+            noLines=args.lines,
+            noTimes=args.times,
+        )
+        peak_import, t_import, expected = measure(
+            import_then_average, filename, args.repeat
+        )
+        peak_sheet, t_sheet, result = measure(averaged_sheet, filename, args.repeat)
+
+    np.testing.assert_allclose(result, expected, rtol=1e-5)
+    print(
+        f'{args.acquisitions} acquisitions x {args.lines} lines x {args.times} time slices'
+    )
+    print(f'import + average : peak {peak_import / 2**20:8.0f} MiB, {t_import:6.2f} s')
+    print(
+        f'averaged sheet   : peak {peak_sheet / 2**20:8.0f} MiB, {t_sheet:6.2f} s '
+        f'({t_import / t_sheet:.1f}x faster)'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Time of csv_export on a synthetic time-resolved cube: the previous np.insert and
+csv.writer row by row implementation compared with the chunked CSV exporter and
+the single-file binary exporters (misc/dataExporters.py).
+
+    python benchmarks/bench_export.py --acquisitions 200
+"""
+
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+)
+from heterodyne_postprocessing.misc.syntheticData import write_synthetic_processed_file
+from heterodyne_postprocessing.processing.postProcessor import PostProcessor
+
+
+def legacy_csv_export(proc, export):
+    """csv_export of a [time, lines, acquisitions] cube before the exporters."""
+    data = proc.complexToReal(np.array(export))
+    WNAxis = np.squeeze(proc.data['wnAxis'])
+    tsi = np.array(np.insert(proc.data['timeAxis'], 0, 0, 0))
+    for i in range(data.shape[-1]):
+        expData = np.insert(data[:, :, i], 0, WNAxis, axis=0)
+        expData = np.insert(expData, 0, tsi, axis=1)
+        filename = (
+            proc.config.filename[:-18] + '_export_acquisition' + str(i + 1) + '.csv'
+        )
+        with open(filename, 'w', newline='') as expFile:
+            wr = csv.writer(
+                expFile, dialect='excel', quoting=csv.QUOTE_NONE, escapechar='\\'
+            )
+            for v in expData:
+                wr.writerow(v)
+
+
+def best_time(func, *args, repeat=3, **kwargs):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--acquisitions', type=int, default=200)
+    parser.add_argument('--lines', type=int, default=500)
+    parser.add_argument('--times', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        proc = PostProcessor()
+        proc.load_configuration(
+            write_synthetic_processed_file(
+                os.path.join(tmp, 'tr_processed_data.h5'),
+                numAcq=args.acquisitions,
+                noLines=args.lines,
+                noTimes=args.times,
+            )
+        )
+        proc.load_transmission()
+        cube = proc.data['transientTrans']
+        print(
+            f'{args.acquisitions} acquisitions x {args.lines} lines x '
+            f'{args.times} time slices, best of {args.repeat}'
+        )
+
+        t_old = best_time(legacy_csv_export, proc, cube, repeat=args.repeat)
+        print(f'csv, np.insert and csv.writer : {t_old:7.3f} s')
+        for fileFormat in ('csv', 'npz', 'hdf5'):
+            t_new = best_time(
+                proc.csv_export, cube, fileFormat=fileFormat, repeat=args.repeat
+            )
+            print(
+                f'{fileFormat:4s}, exporter               : {t_new:7.3f} s '
+                f'({t_old / t_new:.1f}x)'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Peak memory of reading the Transmission sheet of a time-resolved file with
+IRisF1HDF5Reader, compared with the previous transpose/reshape path.
+Memory is measured with tracemalloc, which sees all numpy allocations.
+
+    python benchmarks/bench_irisf1_reader_memory.py --acquisitions 100
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import Orange.data
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+)
+from heterodyne_postprocessing.misc.syntheticData import write_synthetic_processed_file
+from heterodyne_postprocessing.processing.postProcessorHDF5 import (
+    PostProcessorHDF5Loader,
+)
+from orangecontrib.protospec.data import IRisF1HDF5Reader
+
+
+def legacy_read(filename):
+    """read() of the Transmission sheet before the direct time-resolved path."""
+    proc = PostProcessorHDF5Loader()
+    proc.load_configuration(filename)
+    proc.load_transmission()
+    features = proc.data['wnAxis']
+    time_axis = np.asarray(proc.data['timeAxis'])
+
+    X = np.asarray(proc.data['transientTrans']).transpose((2, 0, 1))  # noqa N806
+    acq_nums = np.arange(X.shape[1])
+    spectra = X.reshape((X.shape[0] * X.shape[1], X.shape[2]))
+    acq_num = np.repeat(np.arange(X.shape[0]), X.shape[1])
+    time = np.tile(np.arange(X.shape[1]), X.shape[0])
+    metas = np.array([time_axis[time], acq_nums[acq_num]]).T
+    meta_domain = Orange.data.Domain(
+        [],
+        None,
+        metas=[
+            Orange.data.ContinuousVariable.make("Time"),
+            Orange.data.ContinuousVariable.make("Acquisition"),
+        ],
+    )
+    additional_table = Orange.data.Table.from_numpy(
+        meta_domain,
+        X=np.zeros((len(spectra), 0)),
+        metas=np.asarray(metas, dtype=object),
+    )
+
+    data = np.asarray(spectra, dtype=np.float64)
+    domain = Orange.data.Domain(
+        [Orange.data.ContinuousVariable.make("%f" % f) for f in features],  # noqa: UP031
+        metas=additional_table.domain.metas,
+    )
+    return Orange.data.Table.from_numpy(domain, X=data, metas=additional_table.metas)
+
+
+def new_read(filename):
+    return IRisF1HDF5Reader(filename).read()
+
+
+def measure(func, filename):
+    tracemalloc.start()
+    start = time.perf_counter()
+    table = func(filename)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed, table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--acquisitions', type=int, default=100)
+    parser.add_argument('--lines', type=int, default=200)
+    parser.add_argument('--times', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = write_synthetic_processed_file(
+            os.path.join(tmp, 'bench_processed_data.h5'),
+            numAcq=args.acquisitions,
+            noLines=args.lines,
+            noTimes=args.times,
+        )
+        peak_legacy, t_legacy, legacy = measure(legacy_read, filename)
+        del legacy
+        peak_new, t_new, new = measure(new_read, filename)
+
+    table_mb = new.X.nbytes / 2**20
+    print(
+        f'{args.acquisitions} acquisitions x {args.lines} lines x {args.times} time slices, '
+        f'X = {table_mb:.0f} MiB'
+    )
+    print(
+        f'legacy read : peak {peak_legacy / 2**20:8.0f} MiB '
+        f'({peak_legacy / new.X.nbytes:.1f} x X), {t_legacy:6.2f} s'
+    )
+    print(
+        f'direct read : peak {peak_new / 2**20:8.0f} MiB '
+        f'({peak_new / new.X.nbytes:.1f} x X), {t_new:6.2f} s'
+    )
+
+
+if __name__ == '__main__':
+    main()
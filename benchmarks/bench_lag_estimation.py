@@ -0,0 +1,75 @@
+"""
+Time of aligning many measurements against one calibration: the previous
+np.correlate(..., 'full') + argmax of add_lag_measurement, once per
+measurement, compared with a single batched call of estimate_lag.
+
+    python benchmarks/bench_lag_estimation.py --measurements 1000 --lines 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+)
+from heterodyne_postprocessing.misc.lagEstimation import estimate_lag
+
+
+def correlate_lags(reference, signals):
+    return np.array(
+        [
+            float(np.argmax(np.correlate(reference, v, 'full'))) - len(v) + 1
+            for v in signals
+        ]
+    )
+
+
+def best_time(func, *args, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--measurements', type=int, default=1000)
+    parser.add_argument('--lines', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    reference = rng.uniform(0, 1, args.lines)
+    shifts = rng.integers(-50, 50, args.measurements)
+    signals = np.array([np.roll(reference, -v) for v in shifts])
+    signals += 0.05 * rng.standard_normal(signals.shape)
+
+    t_correlate, expected = best_time(
+        correlate_lags, reference, signals, repeat=args.repeat
+    )
+    t_fft, lags = best_time(estimate_lag, reference, signals, repeat=args.repeat)
+    t_window, lags_window = best_time(
+        lambda *a: estimate_lag(*a, maxLag=100), reference, signals, repeat=args.repeat
+    )
+
+    np.testing.assert_equal(lags, expected)
+    np.testing.assert_equal(lags_window, expected)
+    print(f'{args.measurements} measurements x {args.lines} lines')
+    print(f'np.correlate loop     : {t_correlate:7.3f} s')
+    print(f'estimate_lag          : {t_fft:7.3f} s ({t_correlate / t_fft:.0f}x faster)')
+    print(
+        f'estimate_lag, 100 lag : {t_window:7.3f} s '
+        f'({t_correlate / t_window:.0f}x faster)'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark of PostProcessorHDF5Loader.load_transmission on a synthetic
+time-resolved file, compared with the previous per-acquisition reader.
+
+    python benchmarks/bench_load_transmission.py
+
+With the default file (300 acquisitions x 100 lines x 300 time slices, best
+of 5) three runs gave 0.48 s / 0.26 s, 0.48 s / 0.31 s and 0.44 s / 0.34 s
+(legacy / single pass), i.e. 1.3x to 1.8x. The gain depends on the machine
+and on the file cache, it can be as low as 1.1x.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+)
+from heterodyne_postprocessing.misc.syntheticData import write_synthetic_processed_file
+from heterodyne_postprocessing.processing.postProcessorHDF5 import (
+    PostProcessorHDF5Loader,
+)
+
+
+def legacy_setup(filename):
+    return h5py.File(filename, 'r')
+
+
+def legacy_load(f):
+    """The reading pattern of load_transmission before the single-pass loader."""
+    with f:
+        acq_order = [
+            int(''.join(filter(str.isdigit, g.name)))
+            for g in f['transmission'].values()
+            if 'acquisition' in g.name
+        ]
+        tmp_transmission = [0] * len(acq_order)
+        for v in acq_order:
+            tmp_transmission[v] = (
+                f['transmission/acquisition' + str(v)]['amp'][()][:, :, 0]
+                + f['transmission/acquisition' + str(v)]['amp'][()][:, :, 1] * 1j
+            )
+        transmission = np.transpose(tmp_transmission)
+        tmp_normalization = [0] * len(acq_order)
+        for v in acq_order:
+            tmp_normalization[v] = (
+                f['transmission/acquisition' + str(v)]['NormalizationVector'][()][
+                    :, 0, 0
+                ]
+                + f['transmission/acquisition' + str(v)]['NormalizationVector'][()][
+                    :, 0, 1
+                ]
+                * 1j
+            )
+        tmp_stdPeak = [0] * len(acq_order)
+        for v in acq_order:
+            tmp_stdPeak[v] = f['transmission/acquisition' + str(v)]['peakstd'][()]
+        tmp_driftStd = [0] * len(acq_order)
+        for v in acq_order:
+            tmp_driftStd[v] = f['transmission/acquisition' + str(v)]['info'].attrs[
+                'driftStd'
+            ]
+    return transmission
+
+
+def new_setup(filename):
+    proc = PostProcessorHDF5Loader()
+    proc.load_configuration(filename)
+    return proc
+
+
+def new_load(proc):
+    proc.load_transmission()
+    return proc.data[proc.data_name]
+
+
+def best_of(setup, func, filename, repeat):
+    """
+    The best time of func(setup(filename)). Only func is timed: opening the
+    file (and reading the configuration) is left out for both readers, and
+    both close the file in func.
+    """
+    timings = []
+    for _ in range(repeat):
+        arg = setup(filename)
+        start = time.perf_counter()
+        result = func(arg)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--acquisitions', type=int, default=300)
+    parser.add_argument('--lines', type=int, default=100)
+    parser.add_argument('--times', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = write_synthetic_processed_file(
+            os.path.join(tmp, 'bench_processed_data.h5'),
+            numAcq=args.acquisitions,
+            noLines=args.lines,
+            noTimes=args.times,
+        )
+        t_legacy, legacy = best_of(legacy_setup, legacy_load, filename, args.repeat)
+        t_new, new = best_of(new_setup, new_load, filename, args.repeat)
+
+    np.testing.assert_array_equal(legacy, new)
+    print(
+        f'{args.acquisitions} acquisitions x {args.lines} lines x {args.times} time slices'
+    )
+    print(f'legacy reader : {t_legacy:8.3f} s')
+    print(f'single pass   : {t_new:8.3f} s  ({t_legacy / t_new:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
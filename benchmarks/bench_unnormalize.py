@@ -0,0 +1,135 @@
+"""
+Time of std_average and of utilities/unnormalize.py on synthetic cubes: the
+previous per-acquisition and per-time-slice Python loops compared with the
+broadcast implementations (in place and in chunks for unnormalizer).
+
+    python benchmarks/bench_unnormalize.py --acquisitions 1000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+)
+from heterodyne_postprocessing.misc.syntheticData import write_synthetic_processed_file
+from heterodyne_postprocessing.processing.postProcessor import PostProcessor
+from heterodyne_postprocessing.utilities.unnormalize import unnormalizer
+
+
+def legacy_std_average(proc, startIndx, stopIndx):
+    """std_average before the broadcast rewrite."""
+    temp = 0
+    if proc.is_timeintegrated():
+        for i in range(startIndx, stopIndx):
+            temp += np.power(
+                proc.data['stdPeakAcqs'][:, i]
+                * proc.complexToReal(proc.data[proc.data_name][:, i]),
+                2,
+            )
+    else:
+        for i in range(startIndx, stopIndx):
+            temp += np.power(proc.data['stdPeakAcqs'][:, i], 2)
+    return np.sqrt(temp) / (stopIndx - startIndx)
+
+
+def legacy_unnormalizer(proc):
+    """unnormalizer before the broadcast rewrite (time resolved)."""
+    unnormalized = []
+    for i in range(proc.data['transientTrans'].shape[-1]):
+        ratio = [
+            np.multiply(v, proc.data['normalizationVector'][..., i])
+            for v in proc.data['transientTrans'][..., i]
+        ]
+        unnormalized.append(np.array(ratio))
+    return np.moveaxis(np.array(unnormalized), [0, 1, 2], [2, 0, 1])
+
+
+def best_time(func, *args, repeat=3, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def load(filename):
+    proc = PostProcessor()
+    proc.load_configuration(filename)
+    proc.load_transmission()
+    return proc
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--acquisitions', type=int, default=1000)
+    parser.add_argument('--lines', type=int, default=200)
+    parser.add_argument('--times', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tr = load(
+            write_synthetic_processed_file(
+                os.path.join(tmp, 'tr_processed_data.h5'),
+                numAcq=args.acquisitions,
+                noLines=args.lines,
+                noTimes=args.times,
+            )
+        )
+        ti = load(
+            write_synthetic_processed_file(
+                os.path.join(tmp, 'ti_processed_data.h5'),
+                numAcq=args.acquisitions,
+                noLines=args.lines,
+                configuration='PSC',
+            )
+        )
+    n = args.acquisitions
+    print(
+        f'{n} acquisitions x {args.lines} lines x {args.times} time slices, '
+        f'best of {args.repeat}'
+    )
+
+    for name, proc in (('time resolved', tr), ('time integrated', ti)):
+        t_old, expected = best_time(legacy_std_average, proc, 0, n, repeat=args.repeat)
+        t_new, (result, _) = best_time(proc.std_average, 0, n, repeat=args.repeat)
+        np.testing.assert_allclose(result, expected, rtol=1e-5)
+        print(
+            f'std_average, {name:15s}: {t_old * 1e3:7.2f} ms -> {t_new * 1e3:7.2f} ms'
+        )
+
+    t_old, expected = best_time(legacy_unnormalizer, tr, repeat=args.repeat)
+    t_new, result = best_time(unnormalizer, tr, repeat=args.repeat)
+    np.testing.assert_equal(result, expected)
+    t_chunk, result = best_time(
+        lambda p: unnormalizer(p, batchSize=64), tr, repeat=args.repeat
+    )
+    np.testing.assert_equal(result, expected)
+    original = tr.data['transientTrans']
+
+    def reset():
+        tr.data['transientTrans'] = original.copy()
+
+    t_inplace, result = best_time(
+        lambda p: unnormalizer(p, inplace=True), tr, repeat=args.repeat, setup=reset
+    )
+    np.testing.assert_allclose(result, expected, rtol=1e-6)
+    print(f'unnormalizer loops          : {t_old:7.3f} s')
+    print(f'unnormalizer broadcast      : {t_new:7.3f} s ({t_old / t_new:.0f}x faster)')
+    print(f'unnormalizer, 64 acq chunks : {t_chunk:7.3f} s')
+    print(f'unnormalizer, in place      : {t_inplace:7.3f} s')
+
+
+if __name__ == '__main__':
+    main()
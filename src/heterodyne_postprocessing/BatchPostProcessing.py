@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2018 - present, IRsweep AG
+MIT license
+
+Batch version of EvaluatePostProcessing.py: runs load_configuration -> load_transmission ->
+calibrateWNaxisOfMeasurement -> acquisition_average -> spectral_smoothing -> csv_export on many
+_processed_data.h5 files with a pool of processes. The CSV files are written next to the measurements.
+
+    python BatchPostProcessing.py C:\\measurements\\2023-03-30 parameters.json
+    python BatchPostProcessing.py "C:\\measurements\\*\\*_processed_data.h5" parameters.json --workers 4
+
+The parameter file is a JSON file with the sections below. Every entry is optional, missing ones take the
+values of DEFAULT_PARAMETERS. Without a calibration filename the wnAxis of the files is kept. With "sidecar", the
+averaged calibration is stored next to the calibration file and reused by the next batches (see read_calibration).
+
+    {
+        "calibration": {"calibFilename": "C:\\\\xxxxx\\\\XXXX_calibrated_processed_data.h5",
+                        "specHalfWidth": 0, "start": null, "stop": null, "sidecar": false},
+        "average": {"startIndx": null, "stopIndx": null, "batchSize": null,
+                    "ASC_phase_drift_correction": false},
+        "smoothing": {"gaussianConvolve": true, "gaussianWNsigma": 0.6, "spectralHalfWidth": 0, "threshold": 1},
+        "export": {"data": "SpectralAvgOfFiles", "ToReal": true, "transpose": false, "format": "csv"}
+    }
+
+"data" is the suffix of the exported array after proc.data_name: "" for the individual acquisitions,
+"AvgOfFiles" or "SpectralAvgOfFiles" for the averages. "format" is the exporter of csv_export: "csv", or a single
+"npz", "hdf5" or "parquet" file per measurement.
+"""
+
+import os,sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import copy
+import glob
+import json
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+
+from heterodyne_postprocessing.processing.postProcessor import PostProcessor
+
+
+DEFAULT_PARAMETERS = {
+    'calibration': {'calibFilename': None, 'specHalfWidth': 0, 'start': None, 'stop': None, 'sidecar': False},
+    'average': {'startIndx': None, 'stopIndx': None, 'batchSize': None, 'ASC_phase_drift_correction': False},
+    'smoothing': {'gaussianConvolve': True, 'gaussianWNsigma': 0.6, 'spectralHalfWidth': 0, 'threshold': 1},
+    'export': {'data': 'SpectralAvgOfFiles', 'ToReal': True, 'transpose': False, 'format': 'csv'},
+}
+
+FILE_PATTERN = '*_processed_data.h5'
+
+BatchResult = namedtuple('BatchResult', ['filename', 'ok', 'seconds', 'error'])
+
+# calibration of the worker processes, set once per process by _init_worker
+_calibration = None
+
+
+def read_parameters(filename=None):
+    """
+    Read a JSON parameter file on top of DEFAULT_PARAMETERS.
+
+    Input   :   filename(str) the path of the parameter file. If None, the defaults are returned.
+    Output  :   parameters(dict) with the sections of DEFAULT_PARAMETERS
+    """
+    parameters = copy.deepcopy(DEFAULT_PARAMETERS)
+    if filename is None:
+        return parameters
+    with open(filename) as f:
+        user = json.load(f)
+    for section, values in user.items():
+        if section not in parameters:
+            raise ValueError('unknown section ' + repr(section) + ' in ' + filename)
+        unknown = set(values) - set(parameters[section])
+        if unknown:
+            raise ValueError('unknown parameters ' + ', '.join(sorted(unknown)) + ' in section ' + repr(section))
+        parameters[section].update(values)
+    return parameters
+
+
+def find_measurements(paths, exclude=()):
+    """
+    List the measurements given as files, folders or glob patterns. Folders are searched for
+    *_processed_data.h5 files, not recursively.
+
+    Input   :   paths(list of str) files, folders or glob patterns
+                exclude(list of str) files to leave out, e.g. the calibration measurement
+    Output  :   filenames(list of str) sorted absolute paths without duplicates
+    """
+    exclude = {os.path.abspath(v) for v in exclude if v is not None}
+    filenames = set()
+    for path in paths:
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(path, FILE_PATTERN))
+        else:
+            matches = glob.glob(path)
+        filenames.update(os.path.abspath(v) for v in matches if os.path.isfile(v))
+    return sorted(filenames - exclude)
+
+
+def load_calibration(parameters):
+    """
+    Read the calibrated calibration measurement once, to be shared by all files.
+
+    Input   :   parameters(dict) as returned by read_parameters
+    Output  :   calibration(dict) as returned by PostProcessor.read_calibration, or None without calibration file
+    """
+    calib = parameters['calibration']
+    if calib['calibFilename'] is None:
+        return None
+    return PostProcessor().read_calibration(calib['calibFilename'], calib['specHalfWidth'], calib['start'], calib['stop'],
+                                            sidecar=calib['sidecar'])
+
+
+def process_file(filename, parameters, calibration=None):
+    """
+    Run the pipeline of EvaluatePostProcessing.py on a single measurement and export the result
+    next to it.
+
+    Input   :   filename(str) the path of the _processed_data.h5 file
+                parameters(dict) as returned by read_parameters
+                calibration(dict) as returned by load_calibration, None to keep the wnAxis of the file
+    Output  :   proc(PostProcessor) the processor of the measurement
+    """
+    avg = dict(parameters['average'])
+    export = parameters['export']
+
+    proc = PostProcessor()
+    proc.load_configuration(filename)
+    proc.load_transmission()
+    if calibration is not None:
+        proc.calibrateWNaxisOfMeasurement(calibration=calibration, plotOn=False, debug=False)
+
+    proc.ASC_phase_drift_correction = avg.pop('ASC_phase_drift_correction')
+    proc.acquisition_average(plotOn=False, **avg)
+    proc.spectral_smoothing(plotOn=False, **parameters['smoothing'])
+    proc.csv_export(proc.data[proc.data_name+export['data']], ToReal=export['ToReal'], transpose=export['transpose'],
+                    fileFormat=export['format'])
+    return proc
+
+
+def _init_worker(calibration, headless=False):
+    """
+    Set the calibration of the process. headless switches matplotlib to Agg, which is done in the
+    CLI and in the pool processes only, the pipeline runs without plots.
+    """
+    global _calibration
+    _calibration = calibration
+    if headless:
+        matplotlib.use('Agg')
+
+
+def _run(filename, parameters):
+    """
+    Worker of process_files: process_file with the calibration of the process, the time it took and
+    the error instead of an exception.
+    """
+    start = time.perf_counter()
+    try:
+        process_file(filename, parameters, _calibration)
+    except Exception as e:
+        error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+        return BatchResult(filename, False, time.perf_counter()-start, error)
+    return BatchResult(filename, True, time.perf_counter()-start, None)
+
+
+def process_files(filenames, parameters, workers=None, calibration=None, report=print):
+    """
+    Process many measurements with a pool of processes. A failing file does not stop the others.
+
+    Input   :   filenames(list of str) the measurements
+                parameters(dict) as returned by read_parameters
+                workers(int) the number of processes, os.cpu_count() if None. With 1, the files are
+                processed in this process.
+                calibration(dict) as returned by load_calibration
+                report(callable) called with a progress line after each file, None for no output
+    Output  :   results(list of BatchResult) in the order of filenames
+    """
+    results = {}
+
+    def done(result):
+        results[result.filename] = result
+        if report is not None:
+            status = 'ok' if result.ok else 'FAILED: ' + result.error
+            report('[%d/%d] %s  %.2f s  %s' % (len(results), len(filenames), os.path.basename(result.filename),
+                                               result.seconds, status))
+
+    if workers == 1 or len(filenames) <= 1:
+        _init_worker(calibration)
+        for filename in filenames:
+            done(_run(filename, parameters))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(calibration, True)) as pool:
+            futures = [pool.submit(_run, filename, parameters) for filename in filenames]
+            for future in as_completed(futures):
+                done(future.result())
+    return [results[filename] for filename in filenames]
+
+
+def summary(results, seconds):
+    """
+    Text report of process_files.
+
+    Input   :   results(list of BatchResult)
+                seconds(float) the wall time of the batch
+    Output  :   report(str)
+    """
+    failed = [v for v in results if not v.ok]
+    cpu = sum(v.seconds for v in results)
+    lines = ['%d files processed in %.1f s (%.1f s of processing), %d ok, %d failed'
+             % (len(results), seconds, cpu, len(results)-len(failed), len(failed))]
+    for v in failed:
+        lines.append('  ' + v.filename + ': ' + v.error)
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help='measurement files, folders or glob patterns')
+    parser.add_argument('parameters', help='JSON parameter file')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of processes (default: all CPUs)')
+    args = parser.parse_args(argv)
+    matplotlib.use('Agg') # the pipeline runs without plots
+
+    parameters = read_parameters(args.parameters)
+    filenames = find_measurements(args.paths, exclude=[parameters['calibration']['calibFilename']])
+    if not filenames:
+        print('no ' + FILE_PATTERN + ' file found')
+        return 1
+
+    start = time.perf_counter()
+    calibration = load_calibration(parameters)
+    if calibration is not None:
+        print('calibration read from ' + calibration['calibMeasurementName'])
+    results = process_files(filenames, parameters, workers=args.workers, calibration=calibration)
+    print(summary(results, time.perf_counter()-start))
+    return 0 if all(v.ok for v in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,6 +10,7 @@ import h5py
 import numpy as np
 import re
 import warnings
+from contextlib import nullcontext
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 from heterodyne_postprocessing.misc.hdf5Class import HDF5Class
@@ -254,10 +255,14 @@ class Configuration(HDF5Class):
         """
         self._backgroundIntegrationSamples = self._sampleRate * self._backgroundIntegrationTime
 
-    def load_configuration(self, filename=None):
+    def load_configuration(self, filename=None, keepOpen=False):
         """
-        Load the information from measurement file.
+        Load the information from measurement file. The file is opened once and the same handle is used by the
+        whole version chain (read_base_data, read_from_h5_vX_X_X).
         :param filename: file name
+        :param keepOpen: if True, the opened h5py.File is returned instead of being closed, so that the caller can
+        read the data without opening the file again. The caller has to close it.
+        :return: the h5py.File if keepOpen is True, None otherwise
         """
 
         # If no filename is given, open a dir tab
@@ -268,7 +273,8 @@ class Configuration(HDF5Class):
 
         # Test file name extension
         if re.search(r"\.h5\Z", self.filename):  # it's a HDF5 file
-            with h5py.File(self.filename, 'r') as f:
+            f = h5py.File(self.filename, 'r')
+            try:
                 # Get the version to know how to load stuff
                 try:
                     self.version = np.bytes_(f['info'].attrs['SoftwareVersion'][0]).decode()
@@ -281,19 +287,36 @@ class Configuration(HDF5Class):
 
                 # Use the function corresponding to the version
                 if (3, 2, 3) <= self.version < (3, 3, 0):
-                    self.read_from_h5_v3_2_3()
+                    self.read_from_h5_v3_2_3(f)
                 elif (3, 3, 0) <= self.version < (4, 1, 0):
-                    self.read_from_h5_v3_3_0()
+                    self.read_from_h5_v3_3_0(f)
                 elif (4, 1, 0) <= self.version < (5, 0, 0):
-                    self.read_from_h5_v4_1_0()
+                    self.read_from_h5_v4_1_0(f)
                 elif self.version >= (5, 0, 0):
-                    self.read_from_h5_v5_0_0()
+                    self.read_from_h5_v5_0_0(f)
                 else:
                     raise RuntimeError('in Configuration.load_configuration : software version not compatible.')
+            except BaseException:
+                f.close()
+                raise
+
+            if keepOpen:
+                return f
+            f.close()
 
-    def read_base_data(self):
+    def _open_h5(self, f=None):
+        """
+        Context manager giving the file f opened by load_configuration, or opening self.filename (and closing it
+        afterwards) when the methods of the version chain are called on their own.
+        :param f: h5py.File or None
+        """
+        if f is not None:
+            return nullcontext(f)
+        return h5py.File(self.filename, 'r')
 
-        with h5py.File(self.filename, 'r') as f:
+    def read_base_data(self, f=None):
+
+        with self._open_h5(f) as f:
             self.dirpath = os.path.dirname(self.filename)
             if re.search(r"-_processed_data\.h5", self.filename):
                 self.splitName = os.path.basename(re.sub(r"-_processed_data\.h5", "", self.filename))
@@ -334,108 +357,100 @@ class Configuration(HDF5Class):
             # Coefficient for wavelength calibration
             self.centralWn = info.attrs['CentralWaveNumber'][0]
 
-    def read_from_h5_v3_2_3(self):
+    def read_from_h5_v3_2_3(self, f=None):
         """
         Read the metadata for the version release 3.2.3 of the server
         """
 
-        self.read_base_data()
-        f = h5py.File(self.filename, 'r')
-
-        info = f['info']
+        with self._open_h5(f) as f:
+            self.read_base_data(f)
 
-        self.measureOnTrigger = info.attrs['MeasureOnTrigger'][0]
-        self.numDaqAcq = info.attrs['NumberDaqAcquisitions'][0]
+            info = f['info']
 
-        if 2 ** self.pow2fftLength < 2 ** self.pow2interleave:
-            raise TypeError(
-                "in Configuration.read_from_h5_v3_2_3 : the pow2length and interleave parameters must respect "
-                "2**pow2length>=2**(interleave-1)")
+            self.measureOnTrigger = info.attrs['MeasureOnTrigger'][0]
+            self.numDaqAcq = info.attrs['NumberDaqAcquisitions'][0]
 
-        f.close()
+            if 2 ** self.pow2fftLength < 2 ** self.pow2interleave:
+                raise TypeError(
+                    "in Configuration.read_from_h5_v3_2_3 : the pow2length and interleave parameters must respect "
+                    "2**pow2length>=2**(interleave-1)")
 
-    def read_from_h5_v3_3_0(self):
+    def read_from_h5_v3_3_0(self, f=None):
         """
         Read the metadata for the version release 3.3.0 of the server
         """
 
-        self.read_base_data()
-        f = h5py.File(self.filename, 'r')
+        with self._open_h5(f) as f:
+            self.read_base_data(f)
 
-        info = f['info']
-
-        self.measureOnTrigger = info.attrs['MeasureOnTrigger'][0]
-        self.driver = info.attrs['Driver'][0]
+            info = f['info']
 
-        self.numDaqAcq = info.attrs['NumberOfMeasurementsSample'][0]
-        self.totalSampleAcquisitions = info.attrs['TotalSampleAcquisitions'][0]
+            self.measureOnTrigger = info.attrs['MeasureOnTrigger'][0]
+            self.driver = info.attrs['Driver'][0]
 
-        if 2 ** self.pow2fftLength < 2 ** self.pow2interleave:
-            raise TypeError(
-                "in Configuration.read_from_h5_v3_3_0 : the pow2length and interleave parameters must respect "
-                "2**pow2length>=2**(interleave-1)")
+            self.numDaqAcq = info.attrs['NumberOfMeasurementsSample'][0]
+            self.totalSampleAcquisitions = info.attrs['TotalSampleAcquisitions'][0]
 
-        f.close()
+            if 2 ** self.pow2fftLength < 2 ** self.pow2interleave:
+                raise TypeError(
+                    "in Configuration.read_from_h5_v3_3_0 : the pow2length and interleave parameters must respect "
+                    "2**pow2length>=2**(interleave-1)")
 
-    def read_from_h5_v4_1_0(self):
+    def read_from_h5_v4_1_0(self, f=None):
         """
         Read the metadata for the version release 4.0.0 of the server
         """
 
-        self.read_base_data()
-        f = h5py.File(self.filename, 'r')
-        info = f['info']
-
-        self.measureOnTrigger = info.attrs['MeasureOnTrigger'][0]
-        self.measureOnSingleTrigger = info.attrs['MeasureOnSingleTrigger'][0]
-        self.driver = info.attrs['Driver'][0]
+        with self._open_h5(f) as f:
+            self.read_base_data(f)
+            info = f['info']
 
-        self.numDaqAcq = info.attrs['NumberOfMeasurementsSample'][0]
-        self.totalSampleAcquisitions = info.attrs['TotalSampleAcquisitions'][0]
+            self.measureOnTrigger = info.attrs['MeasureOnTrigger'][0]
+            self.measureOnSingleTrigger = info.attrs['MeasureOnSingleTrigger'][0]
+            self.driver = info.attrs['Driver'][0]
 
-        if 2 ** self.pow2fftLength < 2 ** self.pow2interleave:
-            raise TypeError(
-                "in Configuration.read_from_h5_v4_1_0 : the pow2length and interleave parameters must respect "
-                "2**pow2length>=2**(interleave-1)")
+            self.numDaqAcq = info.attrs['NumberOfMeasurementsSample'][0]
+            self.totalSampleAcquisitions = info.attrs['TotalSampleAcquisitions'][0]
 
-        self.model = np.bytes_(info.attrs['Model'][0]).decode()
-        self.manufacturer = np.bytes_(info.attrs['Manufacturer'][0]).decode()
-        self.H5Version = info.attrs['H5Version'][0]
+            if 2 ** self.pow2fftLength < 2 ** self.pow2interleave:
+                raise TypeError(
+                    "in Configuration.read_from_h5_v4_1_0 : the pow2length and interleave parameters must respect "
+                    "2**pow2length>=2**(interleave-1)")
 
-        self._useBackgroundIntegrationTime = info.attrs['UseBackgroundIntegrationTime'][0]
-        self._backgroundIntegrationTime = info.attrs['BackgroundIntegrationTime'][0]
-        self._preTriggerTime = info.attrs['PretriggerTime'][0]
-        self.pretriggerAcquisitions = info.attrs['PretriggerAcquisitions'][0]
+            self.model = np.bytes_(info.attrs['Model'][0]).decode()
+            self.manufacturer = np.bytes_(info.attrs['Manufacturer'][0]).decode()
+            self.H5Version = info.attrs['H5Version'][0]
 
-        f.close()
+            self._useBackgroundIntegrationTime = info.attrs['UseBackgroundIntegrationTime'][0]
+            self._backgroundIntegrationTime = info.attrs['BackgroundIntegrationTime'][0]
+            self._preTriggerTime = info.attrs['PretriggerTime'][0]
+            self.pretriggerAcquisitions = info.attrs['PretriggerAcquisitions'][0]
 
-    def read_from_h5_v5_0_0(self):
+    def read_from_h5_v5_0_0(self, f=None):
         """
         Read the metadata for the version release 4.0.0 of the server
         """
 
-        self.read_base_data()
-        f = h5py.File(self.filename, 'r')
-        info = f['info']
-
-        self.numDaqAcq = info.attrs['NumberOfMeasurementsSample'][0]
-        self.totalSampleAcquisitions = info.attrs['TotalSampleAcquisitions'][0]
+        with self._open_h5(f) as f:
+            self.read_base_data(f)
+            info = f['info']
 
-        if 2 ** self.pow2fftLength < 2 ** self.pow2interleave:
-            raise TypeError(
-                "in Configuration.read_from_h5_v4_1_0 : the pow2length and interleave parameters must respect "
-                "2**pow2length>=2**(interleave-1)")
+            self.numDaqAcq = info.attrs['NumberOfMeasurementsSample'][0]
+            self.totalSampleAcquisitions = info.attrs['TotalSampleAcquisitions'][0]
 
-        self.model = np.bytes_(info.attrs['Model'][0]).decode()
-        self.manufacturer = np.bytes_(info.attrs['Manufacturer'][0]).decode()
-        self.H5Version = info.attrs['H5Version'][0]
+            if 2 ** self.pow2fftLength < 2 ** self.pow2interleave:
+                raise TypeError(
+                    "in Configuration.read_from_h5_v4_1_0 : the pow2length and interleave parameters must respect "
+                    "2**pow2length>=2**(interleave-1)")
 
-        self._useBackgroundIntegrationTime = info.attrs['UseBackgroundIntegrationTime'][0]
-        self._backgroundIntegrationTime = info.attrs['BackgroundIntegrationTime'][0]
-        self._preTriggerTime = info.attrs['PretriggerTime'][0]
-        self.pretriggerAcquisitions = info.attrs['PretriggerAcquisitions'][0]
+            self.model = np.bytes_(info.attrs['Model'][0]).decode()
+            self.manufacturer = np.bytes_(info.attrs['Manufacturer'][0]).decode()
+            self.H5Version = info.attrs['H5Version'][0]
 
-        f.close()
+            self._useBackgroundIntegrationTime = info.attrs['UseBackgroundIntegrationTime'][0]
+            self._backgroundIntegrationTime = info.attrs['BackgroundIntegrationTime'][0]
+            self._preTriggerTime = info.attrs['PretriggerTime'][0]
+            self.pretriggerAcquisitions = info.attrs['PretriggerAcquisitions'][0]
 
     def require_metadata(self, list_needed):
         """
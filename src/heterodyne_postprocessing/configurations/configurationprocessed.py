@@ -6,7 +6,6 @@ MIT license
 
 import sys
 import os
-import h5py
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 from heterodyne_postprocessing.configurations.configuration import Configuration
@@ -21,53 +20,58 @@ class ConfigurationProcessed(Configuration):
 
         super().__init__()
 
-    def read_from_h5(self):
-        f = h5py.File(self.filename, 'r')
-        info = f['info']
-        self.noLines = info.attrs['NumberOfLines']
-        try:
-            self.maxPeakNo = int(info.attrs['MaxPeakC'][0])
-        except:
-            infodatagroup = f['transmission/info']
-            self.maxPeakNo = int(infodatagroup.attrs['MaxPeakC'][0])
-
-        self.numSamp = 0
-        for g in f['transmission'].values():
-            if 'acquisition' in g.name:
-                self.numSamp += 1
-
-    def read_from_h5_v3_2_3(self):
+    def read_from_h5(self, f=None):
+        """
+        Read the metadata of processed files, from the file f opened by load_configuration if given.
+        """
+        with self._open_h5(f) as f:
+            info = f['info']
+            self.noLines = info.attrs['NumberOfLines']
+            try:
+                self.maxPeakNo = int(info.attrs['MaxPeakC'][0])
+            except:
+                infodatagroup = f['transmission/info']
+                self.maxPeakNo = int(infodatagroup.attrs['MaxPeakC'][0])
+
+            # the names are enough to count the acquisitions, the groups are not opened
+            self.numSamp = sum('acquisition' in name for name in f['transmission'].keys())
+
+    def read_from_h5_v3_2_3(self, f=None):
         """
         Add the loading of metadata specific to raw data.
         """
 
-        super().read_from_h5_v3_2_3()
+        with self._open_h5(f) as f:
+            super().read_from_h5_v3_2_3(f)
 
-        self.read_from_h5()
+            self.read_from_h5(f)
 
-    def read_from_h5_v3_3_0(self):
+    def read_from_h5_v3_3_0(self, f=None):
         """
         Add the loading of metadata specific to raw data.
         """
 
-        super().read_from_h5_v3_3_0()
+        with self._open_h5(f) as f:
+            super().read_from_h5_v3_3_0(f)
 
-        self.read_from_h5()
+            self.read_from_h5(f)
 
-    def read_from_h5_v4_1_0(self):
+    def read_from_h5_v4_1_0(self, f=None):
         """
         Add the loading of metadata specific to raw data.
         """
 
-        super().read_from_h5_v4_1_0()
+        with self._open_h5(f) as f:
+            super().read_from_h5_v4_1_0(f)
 
-        self.read_from_h5()
+            self.read_from_h5(f)
 
-    def read_from_h5_v5_0_0(self):
+    def read_from_h5_v5_0_0(self, f=None):
         """
         Add the loading of metadata specific to raw data.
         """
 
-        super().read_from_h5_v5_0_0()
+        with self._open_h5(f) as f:
+            super().read_from_h5_v5_0_0(f)
 
-        self.read_from_h5()
+            self.read_from_h5(f)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2018 - present, IRsweep AG
+MIT license
+"""
+
+import re
+
+import numpy as np
+
+
+class AcquisitionIndex:
+    """
+    Index of the numbered entries of an HDF5 group, e.g. the acquisitionN
+    groups of 'transmission'. The names are parsed once, the entries are sorted
+    by number and their handles are opened at most once, so that the loaders
+    do not scan the keys or look up 'transmission/acquisition' + str(v) again.
+    """
+
+    _number = re.compile(r'\d+')
+
+    def __init__(self, group, prefix=''):
+        """
+        Input   :   group(h5py.Group) the group holding the entries
+                    prefix(str) only the names containing prefix are indexed, all
+                    names with a number if empty
+        """
+        self.group = group
+        numbers, names = [], []
+        for name in group.keys():
+            match = self._number.search(name)
+            if match is not None and prefix in name:
+                numbers.append(int(match.group(0)))
+                names.append(name)
+        order = np.argsort(numbers, kind='stable')
+        self.numbers = np.array(numbers, dtype=int)[order]
+        self.names = [names[i] for i in order]
+        self._position = {v: i for i, v in enumerate(self.numbers.tolist())}
+        self._handles = [None] * len(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, number):
+        return number in self._position
+
+    def __iter__(self):
+        """
+        Iterate over (number, handle) in increasing number.
+        """
+        for i, v in enumerate(self.numbers.tolist()):
+            yield v, self.at(i)
+
+    def __getitem__(self, number):
+        """
+        Handle of the entry with the given number, e.g. index[3] is the group acquisition3.
+        """
+        return self.at(self._position[number])
+
+    def at(self, position):
+        """
+        Handle of the entry at the given position in the sorted order.
+        """
+        if self._handles[position] is None:
+            self._handles[position] = self.group[self.names[position]]
+        return self._handles[position]
+
+    def number(self, position):
+        """
+        Number of the entry at the given position in the sorted order, 0 for an empty group.
+        """
+        if len(self) == 0:
+            return 0
+        return int(self.numbers[position])
+
+    def position(self, number):
+        return self._position[number]
+
+    def is_valid(self, group):
+        """
+        Whether the index was built from this group and its file is still open.
+        """
+        return self.group.id.valid and self.group == group
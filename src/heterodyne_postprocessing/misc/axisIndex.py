@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2018 - present, IRsweep AG
+MIT license
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from heterodyne_postprocessing.misc.bandedWeights import fingerprint
+
+
+class AxisIndex:
+    """
+    Nearest-index lookups on an axis, e.g. wnAxis or timeAxis, for arrays of
+    targets at once. The nearest index is the same as np.argmin(np.abs(axis-v)),
+    the first one on ties. Increasing and decreasing (flipped) axes are searched
+    with np.searchsorted, other axes fall back to argmin in chunks.
+    """
+
+    def __init__(self, axis, chunkSize=4096):
+        """
+        Input   :   axis(ndarray) the axis, [points] or [1, points]
+                    chunkSize(int) the number of targets compared at once for a non-monotonic axis
+        """
+        self.axis = np.ravel(axis)
+        self.state = fingerprint(self.axis)
+        self.chunkSize = chunkSize
+
+        steps = np.diff(self.axis)
+        if len(self.axis) > 1 and np.all(steps > 0):
+            self.direction = 1
+        elif len(self.axis) > 1 and np.all(steps < 0):
+            self.direction = -1
+        else:
+            self.direction = 0
+        # negating is exact, so |(-axis)-(-v)| is |axis-v| and a decreasing axis is searched as an increasing one
+        self._increasing = self.axis*self.direction if self.direction else None
+
+    def __len__(self):
+        return len(self.axis)
+
+    def matches(self, axis):
+        """
+        Whether the index was built on an axis with the same values.
+        """
+        return fingerprint(np.ravel(axis)) == self.state
+
+    def nearest(self, values):
+        """
+        Index of the element of the axis nearest to each value.
+
+        Input   :   values(float or ndarray) the targets
+        Output  :   index(int or ndarray) of the shape of values
+        """
+        values = np.asarray(values)
+        flat = values.ravel()
+        if len(self.axis) < 2:
+            index = np.zeros(flat.shape, dtype=np.intp)
+        elif self.direction:
+            index = self._nearest_increasing(self._increasing, flat*self.direction)
+        else:
+            index = np.empty(flat.shape, dtype=np.intp)
+            for first in range(0, len(flat), self.chunkSize):
+                chunk = flat[first:first+self.chunkSize]
+                index[first:first+self.chunkSize] = np.argmin(np.abs(self.axis[np.newaxis]-chunk[:, np.newaxis]),
+                                                              axis=-1)
+        return index.reshape(values.shape)[()]
+
+    def range(self, first, last):
+        """
+        Slice bounds of the elements between the values first and last (in any order, on any axis
+        direction): the nearest indices of both, sorted, the stop being one past the last included element.
+
+        Input   :   first(float or ndarray) one end of the range(s)
+                    last(float or ndarray) the other end
+        Output  :   start(int or ndarray) the first index
+                    stop(int or ndarray) the index after the last one
+        """
+        start = self.nearest(first)
+        stop = self.nearest(last)
+        return np.minimum(start, stop), np.maximum(start, stop)+1
+
+    @staticmethod
+    def _nearest_increasing(axis, values):
+        right = np.clip(np.searchsorted(axis, values), 1, len(axis)-1)
+        left = right-1
+        distance = np.abs(axis[left]-values)
+        index = np.where(np.abs(axis[right]-values) < distance, right, left)
+        # the differences are rounded, neighbours at the same distance come before
+        distance = np.abs(axis[index]-values)
+        tied = (index > 0) & (np.abs(axis[index-1]-values) == distance)
+        while np.any(tied):
+            index[tied] -= 1
+            tied[tied] = (index[tied] > 0) & (np.abs(axis[index[tied]-1]-values[tied]) == distance[tied])
+        return index
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2018 - present, IRsweep AG
+MIT license
+"""
+
+import hashlib
+
+import numpy as np
+import scipy.sparse
+
+
+def fingerprint(array):
+    """
+    Short digest of the content of an array, used to detect that an array
+    changed without keeping a copy of it.
+
+    Input   :   array(ndarray or None)
+    Output  :   fingerprint(tuple) shape, dtype and digest of the data
+    """
+    if array is None:
+        return None
+    array = np.ascontiguousarray(array)
+    digest = hashlib.blake2b(array.view(np.uint8), digest_size=16).hexdigest()
+    return array.shape, array.dtype.str, digest
+
+
+class BandedWeights:
+    """
+    Normalised weights of the spectral smoothing for all lines at once. Row i
+    holds the weights of the lines of the filter window of line i, as returned
+    by PostProcessorAvg.weights for that line.
+
+    When the same weight is used for every spectrum (weight of shape [lines] or
+    [lines, 1]) everything is folded into a single sparse matrix and applying
+    the weights is one matrix product. Weights that differ for each spectrum
+    ([lines, n]) are normalised when applied.
+    """
+
+    def __init__(self, kernel, weight):
+        """
+        Input   :   kernel(scipy.sparse matrix) the banded filter [lines, lines]
+                    weight(ndarray) the inverse variance [lines], [lines, 1] or [lines, n]
+        """
+        weight = np.asarray(weight, dtype=np.float64)
+        if weight.ndim == 1:
+            weight = weight[:, np.newaxis]
+        kernel = scipy.sparse.csr_matrix(kernel)
+
+        norm = kernel @ weight
+        band = (kernel != 0).astype(np.float64)
+        # if all the lines of a window have zero weight, the line in the middle of the window is taken
+        noWeight = (band @ (weight != 0).astype(np.float64)) == 0
+        first, last = band.indices[band.indptr[:-1]], band.indices[band.indptr[1:] - 1] + 1
+        half = first + np.round((last - first) / 2).astype(int)
+
+        self.shape = kernel.shape
+        if weight.shape[1] == 1:
+            invNorm = np.divide(1, norm[:, 0], out=np.zeros(norm.shape[0]), where=~noWeight[:, 0])
+            matrix = scipy.sparse.diags(invNorm) @ kernel @ scipy.sparse.diags(weight[:, 0])
+            rows = np.flatnonzero(noWeight[:, 0])
+            fallback = scipy.sparse.csr_matrix((np.ones(rows.size), (rows, half[rows])), shape=kernel.shape)
+            self.matrix = (matrix + fallback).tocsr()
+            self.kernel = self.weight = self.invNorm = self.noWeight = self.half = None
+        else:
+            self.matrix = None
+            self.kernel = kernel
+            self.weight = weight
+            with np.errstate(divide='ignore'):
+                self.invNorm = 1 / norm
+            self.noWeight = noWeight
+            self.half = half
+
+    def apply(self, data, separateMagnitude=False):
+        """
+        Weighted average of the lines of data.
+
+        Input   :   data(ndarray) complex data [lines, n]
+                    separateMagnitude(bool) if True, magnitude and phase are averaged separately
+        Output  :   avg(ndarray) complex [lines, n]
+        """
+        if self.matrix is not None:
+            weightedSum = self.matrix @ data
+            if separateMagnitude:
+                return (self.matrix @ np.abs(data)) * np.exp(1j * np.angle(weightedSum))
+            return weightedSum
+
+        weightedSum = self.kernel @ (self.weight * data)
+        with np.errstate(invalid='ignore'):
+            if separateMagnitude:
+                avg = (self.kernel @ (self.weight * np.abs(data))) * self.invNorm * np.exp(1j * np.angle(weightedSum))
+            else:
+                avg = weightedSum * self.invNorm
+        if np.any(self.noWeight):
+            avg = np.where(self.noWeight, data[self.half], avg)
+        return avg
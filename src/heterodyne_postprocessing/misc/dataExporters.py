@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2018 - present, IRsweep AG
+MIT license
+"""
+
+import csv
+
+import h5py
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    _pyarrow = True
+except ImportError:
+    _pyarrow = False
+
+
+class _Table:
+    """
+    The table [header; values] with column prepended, i.e. the result of the np.insert calls of the former
+    csv_export, without building it: blocks of it are assembled on demand in the dtype of values.
+    """
+
+    def __init__(self, values, header=None, column=None):
+        """
+        Input   :   values(ndarray) [rows, cols]
+                    header(ndarray) [cols] the first row (wnAxis), None for none
+                    column(ndarray) [rows(+1 with a header)] the first column (time axis), None for none
+        """
+        self.values = values
+        self.header = header
+        self.column = column
+        self._hasHeader = int(header is not None)
+        self._hasColumn = int(column is not None)
+        self.shape = (values.shape[0]+self._hasHeader, values.shape[1]+self._hasColumn)
+
+    def block(self, rows, cols):
+        """
+        The block [rows, cols] (two slices) of the table.
+        """
+        r0, r1, _ = rows.indices(self.shape[0])
+        c0, c1, _ = cols.indices(self.shape[1])
+        block = np.empty((r1-r0, c1-c0), dtype=self.values.dtype)
+        dr = int(r0 == 0 and self._hasHeader)
+        dc = int(c0 == 0 and self._hasColumn)
+        v0 = r0+dr-self._hasHeader
+        w0 = c0+dc-self._hasColumn
+        block[dr:, dc:] = self.values[v0:r1-self._hasHeader, w0:c1-self._hasColumn]
+        if dr:
+            block[0, dc:] = self.header[w0:c1-self._hasColumn]
+        if dc:
+            # the column was inserted after the header, it also holds the corner
+            block[:, 0] = self.column[r0:r1]
+        return block
+
+
+def _write_table(filename, table, transpose=False, chunkRows=4096, **fmtparams):
+    """
+    Write the table with csv.writer(dialect='excel', quoting=csv.QUOTE_NONE), chunkRows rows (or columns if
+    transpose) at a time. The rows are handed to the writer as numpy arrays, so the values are printed exactly
+    as before (str of the numpy scalars).
+    """
+    with open(filename, 'w', newline='') as exptData:
+        wr = csv.writer(exptData, dialect='excel', quoting=csv.QUOTE_NONE, **fmtparams)
+        if transpose:
+            for first in range(0, table.shape[1], chunkRows):
+                wr.writerows(table.block(slice(None), slice(first, first+chunkRows)).T)
+        else:
+            for first in range(0, table.shape[0], chunkRows):
+                wr.writerows(table.block(slice(first, first+chunkRows), slice(None)))
+
+
+def _matching(axis, length, name):
+    """
+    The axis if it has the given length, otherwise None, with the message of the former csv_export.
+    """
+    if axis is not None and np.ndim(axis) == 1 and len(axis) == length:
+        return axis
+    print(name+' and data dimensions do not match')
+    return None
+
+
+def export_csv(basename, data, wnAxis=None, timeAxis=None, timeName='timeAxis', transpose=False, chunkRows=4096):
+    """
+    CSV files with the same content as the former csv_export, written in chunks of chunkRows lines.
+    1-D: basename_export.csv with the wnAxis row above the data.
+    2-D ([time, lines]): basename_export.csv with the wnAxis row and the time axis column (preceded by 0).
+    3-D ([time, lines, acquisitions]): one basename_export_acquisitionN.csv per acquisition, as the 2-D case.
+    transpose writes the transposed table. All the values are printed in the dtype of data, as before.
+
+    Input   :   basename(str) the path of the measurement without _processed_data.h5
+                data(ndarray) the data to export
+                wnAxis(ndarray) [lines] the wavenumber axis, None for none
+                timeAxis(ndarray) [time] the time axis (or the time stamps), None for none
+                timeName(str) the key of the time axis in proc.data (not used in the CSV files)
+                transpose(bool) export the transposed tables
+                chunkRows(int) the number of lines formatted at once
+    Output  :   filenames(list) the written files
+    """
+    if data.ndim == 1:
+        table = _Table(data[np.newaxis], header=_matching(wnAxis, len(data), 'wnAxis'))
+        filename = basename+'_export.csv'
+        _write_table(filename, table, transpose, chunkRows)
+        return [filename]
+
+    header = _matching(wnAxis, data.shape[1], 'wnAxis')
+    column = None
+    if timeAxis is not None:
+        column = _matching(np.insert(np.ravel(timeAxis), 0, 0), data.shape[0]+(header is not None), 'timeAxis')
+    if data.ndim == 2:
+        filename = basename+'_export.csv'
+        _write_table(filename, _Table(data, header, column), transpose, chunkRows)
+        return [filename]
+
+    filenames = []
+    for i in range(data.shape[-1]):
+        filename = basename+'_export_acquisition'+str(i+1)+'.csv'
+        _write_table(filename, _Table(data[:, :, i], header, column), transpose, chunkRows, escapechar='\\')
+        filenames.append(filename)
+    return filenames
+
+
+def export_npz(basename, data, wnAxis=None, timeAxis=None, timeName='timeAxis', transpose=False, chunkRows=4096):
+    """
+    A single basename_export.npz with the data (all the acquisitions of a 3-D cube) under 'data' and the axes under
+    'wnAxis' and timeName. The data is stored as it is, transpose only applies to the CSV tables.
+    """
+    arrays = {'data': data}
+    if wnAxis is not None:
+        arrays['wnAxis'] = wnAxis
+    if timeAxis is not None:
+        arrays[timeName] = timeAxis
+    filename = basename+'_export.npz'
+    np.savez(filename, **arrays)
+    return [filename]
+
+
+def export_hdf5(basename, data, wnAxis=None, timeAxis=None, timeName='timeAxis', transpose=False, chunkRows=4096):
+    """
+    A single basename_export.h5 with the data (all the acquisitions of a 3-D cube) under 'data' and the axes under
+    'wnAxis' and timeName. The data is stored as it is, transpose only applies to the CSV tables.
+    """
+    filename = basename+'_export.h5'
+    with h5py.File(filename, 'w') as f:
+        f.create_dataset('data', data=data)
+        if wnAxis is not None:
+            f.create_dataset('wnAxis', data=wnAxis)
+        if timeAxis is not None:
+            f.create_dataset(timeName, data=timeAxis)
+    return [filename]
+
+
+def export_parquet(basename, data, wnAxis=None, timeAxis=None, timeName='timeAxis', transpose=False,
+                   chunkRows=4096):
+    """
+    A single basename_export.parquet with one column per line, named by its wavenumber, preceded by the time axis
+    column (timeName) and, for a 3-D cube, by the number of the acquisition. Each acquisition is a row group
+    written on its own. Requires pyarrow, complex data must be exported with ToReal=True.
+    """
+    if not _pyarrow:
+        raise ImportError('in export_parquet : the parquet export requires pyarrow (pip install pyarrow).')
+    if np.iscomplexobj(data):
+        raise ValueError('in export_parquet : complex data cannot be stored in parquet, export it with ToReal=True.')
+
+    values = data[np.newaxis] if data.ndim == 1 else data
+    lines = values.shape[1]
+    if wnAxis is not None and np.ndim(wnAxis) == 1 and len(wnAxis) == lines:
+        names = [str(wn) for wn in np.asarray(wnAxis).tolist()]
+    else:
+        names = [str(i) for i in range(lines)]
+    if data.ndim == 1 or timeAxis is None or len(np.ravel(timeAxis)) != values.shape[0]:
+        timeAxis = None
+    else:
+        timeAxis = np.ravel(timeAxis)
+
+    def table(block, acquisition=None):
+        columns, fields = [], []
+        if acquisition is not None:
+            columns.append(pa.array(np.full(block.shape[0], acquisition)))
+            fields.append('acquisition')
+        if timeAxis is not None:
+            columns.append(pa.array(timeAxis))
+            fields.append(timeName)
+        columns += [pa.array(block[:, j]) for j in range(lines)]
+        return pa.table(columns, names=fields+names)
+
+    filename = basename+'_export.parquet'
+    if data.ndim == 3:
+        writer = None
+        try:
+            for i in range(data.shape[-1]):
+                chunk = table(data[:, :, i], i+1)
+                if writer is None:
+                    writer = pq.ParquetWriter(filename, chunk.schema)
+                writer.write_table(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        pq.write_table(table(values), filename)
+    return [filename]
+
+
+# the exporters of csv_export, by format. An exporter is called as
+# exporter(basename, data, wnAxis, timeAxis, timeName, transpose, chunkRows) and returns the written files
+EXPORTERS = {
+    'csv': export_csv,
+    'npz': export_npz,
+    'hdf5': export_hdf5,
+    'parquet': export_parquet,
+}
+
+
+def register_exporter(name, exporter):
+    """
+    Add (or replace) the exporter of the format name, e.g. register_exporter('mat', export_mat).
+    """
+    EXPORTERS[name] = exporter
+
+
+def get_exporter(name):
+    """
+    The exporter of the format name, see EXPORTERS.
+    """
+    try:
+        return EXPORTERS[name]
+    except KeyError:
+        raise ValueError('in get_exporter : unknown export format '+repr(name)+', use one of '
+                         + ', '.join(sorted(EXPORTERS))+'.')
@@ -14,8 +14,9 @@ except:
 
 import sys
 import os
-import re
-import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from heterodyne_postprocessing.misc.acquisitionIndex import AcquisitionIndex
 
 
 class HDF5Class:
@@ -24,7 +25,8 @@ class HDF5Class:
     """
 
     def __init__(self):
-        pass
+        # index of the last group passed to get_name_from_index or get_entries
+        self._index = None
 
     def _get_dir(self):
         """
@@ -46,6 +48,17 @@ class HDF5Class:
 
         return path
 
+    def acquisition_index(self, group):
+        """
+        The AcquisitionIndex of group. It is built once and reused as long as
+        the same group is asked for and its file is open.
+        Input   :   group(HDF5Group) an hdf5 group
+        Output  :   index(AcquisitionIndex) the numbered entries of group
+        """
+        if self._index is None or not self._index.is_valid(group):
+            self._index = AcquisitionIndex(group)
+        return self._index
+
     def get_name_from_index(self, group, acq_num):
         """
         From the number of the acquisition, we can deduce the real name of the
@@ -55,18 +68,7 @@ class HDF5Class:
                     to the total number of acquisitions
         Output  :   index(int) the index in the name of the corresponding acquisition
         """
-        index = []
-        for name in group.keys():
-            tmp = re.search('\d+', name)
-            if tmp is not None:
-                index.append(int(tmp.group(0)))
-
-        index = np.sort(index)
-
-        if index.size == 0:
-            return 0
-        else:
-            return int(index[int(acq_num)])
+        return self.acquisition_index(group).number(int(acq_num))
 
     def get_entries(self, group):
         """
@@ -75,13 +77,4 @@ class HDF5Class:
         Input   :   group(HDF5Group) an hdf5 group 
         Output  :   entryNo(int) how many entries are in group
         """
-        index = []
-        for name in group.keys():
-            tmp = re.search('\d+', name)
-            if tmp is not None:
-                index.append(int(tmp.group(0)))
-
-        if len(index) == 0:
-            return 0
-        else:
-            return int(len(index))
+        return len(self.acquisition_index(group))
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2018 - present, IRsweep AG
+MIT license
+"""
+
+import numpy as np
+import scipy.fft
+
+
+def cross_correlation(reference, signals, maxLag=None):
+    """
+    Cross-correlation of reference with one or many signals, computed with FFTs.
+    corr[..., k] is sum_n reference[n+lags[k]]*signals[..., n], i.e. the values of
+    np.correlate(reference, signal, 'full') at the lags of the window.
+
+    Input   :   reference(ndarray) [lines] e.g. peakMeanAmpCalib
+                signals(ndarray) [lines] or [measurements, lines] e.g. peakMeanAmp
+                maxLag(int) if given, only the lags -maxLag..maxLag are returned
+    Output  :   lags(ndarray of int) [lags] the lag of each correlation value
+                corr(ndarray) [lags] or [measurements, lags]
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    signals = np.asarray(signals, dtype=np.float64)
+    noRef, noSig = reference.shape[-1], signals.shape[-1]
+
+    lags = np.arange(-(noSig-1), noRef)
+    if maxLag is not None:
+        lags = lags[np.abs(lags) <= maxLag]
+        if lags.size == 0:
+            raise ValueError('maxLag must be at least 0')
+
+    # no circular wrap-around with at least noRef+noSig-1 points
+    nfft = scipy.fft.next_fast_len(noRef+noSig-1, real=True)
+    spectrum = scipy.fft.rfft(reference, nfft) * np.conj(scipy.fft.rfft(signals, nfft, axis=-1))
+    corr = scipy.fft.irfft(spectrum, nfft, axis=-1)
+    return lags, corr[..., lags % nfft]
+
+
+def estimate_lag(reference, signals, maxLag=None, subsample=False):
+    """
+    Lag of the maximum of the cross-correlation of reference with one or many
+    signals, as float(np.argmax(np.correlate(reference, signal, 'full')))-len(signal)+1.
+    All signals are aligned in a single vectorised call.
+
+    Input   :   reference(ndarray) [lines] e.g. peakMeanAmpCalib
+                signals(ndarray) [lines] or [measurements, lines] e.g. peakMeanAmp
+                maxLag(int) if given, the maximum is searched among the lags -maxLag..maxLag only
+                subsample(bool) if True, the lag is refined below one line by fitting a
+                parabola through the maximum and its two neighbours
+    Output  :   lag(float) or lags(ndarray) [measurements]
+    """
+    lags, corr = cross_correlation(reference, signals, maxLag)
+    peak = np.argmax(corr, axis=-1)
+    lag = lags[peak].astype(np.float64)
+
+    if subsample:
+        inner = np.clip(peak, 1, corr.shape[-1]-2)
+        neighbours = np.take_along_axis(corr, (inner[..., np.newaxis] + np.arange(-1, 2)), axis=-1)
+        before, center, after = np.moveaxis(neighbours, -1, 0)
+        curvature = before - 2*center + after
+        # no refinement at the edges of the window or when the maximum is flat
+        valid = (peak == inner) & (curvature < 0)
+        shift = np.divide(0.5*(before-after), curvature, out=np.zeros(np.shape(curvature)), where=valid)
+        lag = lag + np.clip(shift, -0.5, 0.5)
+
+    return lag[()] if np.ndim(lag) == 0 else lag
+
+
+def lagged_wn_axis(wnAxisCalib, lag, noLines):
+    """
+    Wavenumber axis of measurements shifted by lag lines with respect to the
+    calibrated axis, as computed by PostProcessorCalibration.add_lag_measurement.
+
+    Input   :   wnAxisCalib(ndarray) [lines] the calibrated axis
+                lag(float or ndarray) [measurements] as returned by estimate_lag
+                noLines(int) the number of lines of the measurements
+    Output  :   wnAxis(ndarray) [lines] or [measurements, lines]
+    """
+    wnAxisCalib = np.squeeze(wnAxisCalib)
+    spacing = np.mean(np.gradient(wnAxisCalib))
+    lag = np.asarray(lag, dtype=np.float64)
+    if lag.ndim:
+        lag = lag[:, np.newaxis]
+    return np.arange(noLines)*spacing + wnAxisCalib[0] + lag*spacing
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2018 - present, IRsweep AG
+MIT license
+"""
+
+from collections import OrderedDict
+import numbers
+
+import numpy as np
+
+
+class _BlockCache(OrderedDict):
+    """
+    Least recently used cache of the blocks read by a LazyAcquisitionCube and
+    all of its views.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.nbytes = 0
+
+    def add(self, key, block, maxBytes):
+        self[key] = block
+        self.nbytes += block.nbytes
+        while self.nbytes > maxBytes:
+            _, dropped = self.popitem(last=False)
+            self.nbytes -= dropped.nbytes
+
+
+class LazyAcquisitionCube:
+    """
+    Array-like proxy for the transmission of all acquisitions of a processed
+    file, backed by the HDF5 datasets of each acquisition. It has the same
+    shape as the array created by PostProcessorHDF5Loader.load_transmission,
+    [time, lines, acquisitions] for time resolved measurements and
+    [lines, acquisitions] for time integrated ones, but nothing is read before
+    it is needed.
+
+    Slicing with slices only returns a new lazy view. Any other indexing, and
+    the conversion to a numpy array, reads only the acquisitions, time slices
+    and lines that are selected. Index arrays select along each axis
+    independently, like in h5py. mean() is computed by streaming through the
+    acquisitions, one at a time. The blocks read from the file are kept in a
+    least recently used cache bounded to cacheBytes.
+    """
+
+    def __init__(self, datasets, timeResolved, cacheBytes=128 * 2 ** 20, _selection=None, _cache=None):
+        """
+        Input   :   datasets(list of h5py.Dataset) the 'amp' (time resolved) or 'y'
+                    (time integrated) dataset of each acquisition, indexed by the
+                    acquisition number
+                    timeResolved(bool) whether the datasets are time resolved
+                    cacheBytes(int) the maximum size of the block cache in bytes
+        """
+        self._datasets = datasets
+        self._timeResolved = timeResolved
+        self.cacheBytes = cacheBytes
+
+        first = datasets[0]
+        if first.ndim == 1:
+            self.dtype = np.dtype(np.complex128)
+        else:
+            self.dtype = np.result_type(first.dtype, np.complex64)
+
+        if _selection is None:
+            if timeResolved:
+                base_shape = (first.shape[1], first.shape[0])
+            else:
+                base_shape = (first.shape[0],)
+            _selection = tuple(range(n) for n in base_shape) + (range(len(datasets)),)
+        self._selection = _selection
+
+        self._cache = _BlockCache() if _cache is None else _cache
+
+    # Array interface ---------------------
+    @property
+    def shape(self):
+        return tuple(len(s) for s in self._selection)
+
+    @property
+    def ndim(self):
+        return len(self._selection)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return '<LazyAcquisitionCube shape={} dtype={}>'.format(self.shape, self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        data = self._read_selection(self._selection)
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        return data
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, key):
+        key = self._expand_key(key)
+
+        if all(isinstance(k, slice) for k in key):
+            selection = tuple(s[k] for s, k in zip(self._selection, key))
+            return LazyAcquisitionCube(self._datasets, self._timeResolved, self.cacheBytes,
+                                       _selection=selection, _cache=self._cache)
+
+        # Integers and index arrays: read the selected box and index it in memory
+        selection = []
+        post_index = []
+        for s, k in zip(self._selection, key):
+            if isinstance(k, slice):
+                selection.append(s[k])
+                post_index.append(slice(None))
+            elif isinstance(k, numbers.Integral):
+                selection.append(range(s[k], s[k] + 1))
+                post_index.append(0)
+            else:
+                k = np.asarray(k)
+                if k.dtype == bool:
+                    k = np.flatnonzero(k)
+                if k.ndim != 1:
+                    raise IndexError('LazyAcquisitionCube only supports one dimensional index arrays')
+                selection.append([s[i] for i in k])
+                post_index.append(slice(None))
+        return self._read_selection(tuple(selection))[tuple(post_index)]
+
+    def mean(self, axis=None, dtype=None, out=None, keepdims=False, **kwargs):
+        """
+        Mean of the cube along an axis, computed by streaming through the
+        acquisitions so that only one acquisition is in memory at a time.
+        """
+        if out is not None or keepdims or kwargs:
+            return np.mean(np.asarray(self), axis=axis, dtype=dtype, out=out, keepdims=keepdims, **kwargs)
+
+        res_dtype = np.dtype(dtype) if dtype is not None else self.dtype
+        acquisitions = self._selection[-1]
+        if axis is not None:
+            axis = axis + self.ndim if axis < 0 else axis
+        if len(acquisitions) == 0:
+            return np.mean(np.asarray(self), axis=axis, dtype=dtype)
+
+        if axis is None:
+            total = 0
+            for a in acquisitions:
+                total = total + np.sum(self._read_block(a, self._selection[:-1]), dtype=np.complex128)
+            return res_dtype.type(total / self.size)
+        elif axis == self.ndim - 1:
+            # sum the acquisitions as they are stored in the file, without the conversion to complex
+            total = None
+            for a in acquisitions:
+                raw = self._read_raw(a, self._selection[:-1])
+                if total is None:
+                    # old files store complex 1-D datasets, which must not be summed into a real array
+                    total = raw.astype(np.result_type(raw.dtype, np.float64))
+                else:
+                    total += raw
+            total = self._raw_to_block(total, np.complex128)
+            return (total / len(acquisitions)).astype(res_dtype, copy=False)
+        else:
+            result = None
+            for j, a in enumerate(acquisitions):
+                block_mean = np.mean(self._read_block(a, self._selection[:-1]), axis=axis, dtype=np.complex128)
+                if result is None:
+                    result = np.empty(block_mean.shape + (len(acquisitions),), dtype=res_dtype)
+                result[..., j] = block_mean
+            return result
+
+    def iter_acquisitions(self, batchSize=1):
+        """
+        Iterate over the acquisitions of the cube in batches. The batches are
+        read directly from the file and bypass the block cache, so that a
+        full pass over a large file does not evict the cached blocks.
+
+        Input   :   batchSize(int) the number of acquisitions per batch
+        Output  :   generator of arrays of shape [..., batch size]
+        """
+        acquisitions = self._selection[-1]
+        for j in range(0, len(acquisitions), batchSize):
+            batch = acquisitions[j:j + batchSize]
+            # each acquisition is contiguous in memory, the acquisition axis is moved last in a view
+            out = np.empty((len(batch),) + self.shape[:-1], dtype=self.dtype)
+            for k, a in enumerate(batch):
+                out[k] = self._read_from_file(a, self._selection[:-1])
+            yield np.moveaxis(out, 0, -1)
+
+    # Reading ---------------------
+    def _expand_key(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = [j for j, k in enumerate(key) if k is Ellipsis][0]
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1:]
+        if len(key) > self.ndim:
+            raise IndexError('too many indices for LazyAcquisitionCube: cube is {}-dimensional, but {} were '
+                             'indexed'.format(self.ndim, len(key)))
+        return key + (slice(None),) * (self.ndim - len(key))
+
+    def _read_selection(self, selection):
+        out = np.empty(tuple(len(s) for s in selection), dtype=self.dtype)
+        for j, a in enumerate(selection[-1]):
+            out[..., j] = self._read_block(a, selection[:-1])
+        return out
+
+    def _read_block(self, acquisition, selection):
+        """
+        Read the selected time slices and lines of one acquisition, through the
+        block cache.
+        """
+        selection = tuple(s if isinstance(s, range) else tuple(s) for s in selection)
+        key = (acquisition,) + selection
+        try:
+            block = self._cache[key]
+        except KeyError:
+            pass
+        else:
+            self._cache.move_to_end(key)
+            return block
+
+        block = self._read_from_file(acquisition, selection)
+        if block.nbytes <= self.cacheBytes:
+            self._cache.add(key, block, self.cacheBytes)
+        return block
+
+    def _read_from_file(self, acquisition, selection):
+        return self._raw_to_block(self._read_raw(acquisition, selection), self.dtype)
+
+    def _read_raw(self, acquisition, selection):
+        """
+        Read the selected time slices and lines of one acquisition as they are stored in the file: [lines, time, 2]
+        for time resolved, [lines, 2] (or [lines] for old files) for time integrated datasets.
+        """
+        dset = self._datasets[acquisition]
+        if self._timeResolved:
+            time_sel, line_sel = selection
+            return self._read_planes(dset, (line_sel, time_sel))
+        else:
+            line_sel, = selection
+            if dset.ndim == 1:
+                return self._read_planes(dset, (line_sel,), planes=False)
+            return self._read_planes(dset, (line_sel,), fixed=(0,))
+
+    def _raw_to_block(self, raw, dtype):
+        """
+        Convert data read by _read_raw to the layout of the cube, [time, lines] or [lines].
+        """
+        if self._timeResolved:
+            return (raw[..., 0] + raw[..., 1] * 1j).T.astype(dtype, copy=False)
+        elif raw.ndim == 1:
+            return raw.astype(dtype)
+        return (raw[..., 0] + raw[..., 1] * 1j).astype(dtype, copy=False)
+
+    @staticmethod
+    def _read_planes(dset, selection, fixed=(), planes=True):
+        """
+        Read a dataset with one selection (range or list of indices) per leading
+        axis. Each selection is read through its bounding slice, the
+        remaining indexing is done in memory.
+        """
+        file_key = []
+        mem_key = []
+        for s in selection:
+            if len(s) == 0:
+                file_key.append(slice(0, 0))
+                mem_key.append(slice(None))
+                continue
+            if isinstance(s, range) and s.step > 0:
+                file_key.append(slice(s.start, s.stop, s.step))
+                mem_key.append(slice(None))
+            else:
+                lo, hi = min(s), max(s) + 1
+                file_key.append(slice(lo, hi))
+                mem_key.append(np.asarray(s) - lo)
+        data = dset[tuple(file_key) + fixed + ((slice(None),) if planes else ())]
+        if all(isinstance(k, slice) for k in mem_key):
+            return data
+        # index one axis at a time so that index arrays are not broadcast together
+        for axis, k in enumerate(mem_key):
+            if not isinstance(k, slice):
+                data = np.take(data, k, axis=axis)
+        return data
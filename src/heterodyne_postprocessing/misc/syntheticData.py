@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2018 - present, IRsweep AG
+MIT license
+"""
+
+import numpy as np
+import h5py
+
+
+def write_synthetic_processed_file(filename, numAcq=10, noLines=100, noTimes=None, configuration='ASC',
+                                   version='7.0.0', seed=0):
+    """
+    Write a small IRis-F1 style _processed_data.h5 file filled with random
+    data. It is used by the benchmarks and the tests, so that the loading
+    chain can be exercised without a real measurement.
+
+    Input   :   filename(str) the path of the file to create
+                numAcq(int) the number of acquisitions
+                noLines(int) the number of spectral lines
+                noTimes(int) the number of time slices. If None, a long term
+                (time integrated) file is written, otherwise a time resolved one.
+                configuration(str) 'ASC' or 'PSC'
+                version(str) the software version written in the metadata
+                seed(int) the seed of the random generator
+    Output  :   filename(str) the path of the created file
+    """
+    rng = np.random.default_rng(seed)
+    timeResolved = noTimes is not None
+
+    with h5py.File(filename, 'w') as f:
+        info = f.create_group('info')
+        str_attrs = {'Processor': 'TimeResolved' if timeResolved else 'LongTerm',
+                     'ModuleID': '01719.' + configuration + '.1650\r\n',
+                     'SoftwareVersion': version,
+                     'Model': 'IRis-F1',
+                     'Manufacturer': 'IRsweep'}
+        for key, value in str_attrs.items():
+            info.attrs[key] = np.array([value.encode()])
+
+        num_attrs = {'DataProcessing': np.array([1], dtype=np.int32),
+                     'NumberOfAveragesBackground': np.array([40], dtype=np.uint64),
+                     'NumberOfAveragesTransfer': np.array([10], dtype=np.uint64),
+                     'NumberOfAveragesSample': np.array([1], dtype=np.uint64),
+                     'AcquisitionFrequency': np.array([1.], dtype=np.float32),
+                     'SampleRate': np.array([2e9]),
+                     'PreTrigSamples': np.array([0], dtype=np.uint64),
+                     'FftLength': np.array([2 ** 15], dtype=np.uint64),
+                     'Samples': np.array([2 ** 25], dtype=np.uint64),
+                     'Interleaving': np.array([2], dtype=np.uint64),
+                     'ZeroPadding': np.array([1], dtype=np.uint64),
+                     'CentralWaveNumber': np.array([1650.]),
+                     'NumberOfMeasurementsSample': np.array([numAcq], dtype=np.uint64),
+                     'TotalSampleAcquisitions': np.array([numAcq], dtype=np.uint64),
+                     'MeasureOnTrigger': np.array([0], dtype=np.int32),
+                     'MeasureOnSingleTrigger': np.array([0], dtype=np.int32),
+                     'Driver': np.array([0], dtype=np.int32),
+                     'H5Version': np.array([8], dtype=np.int32),
+                     'UseBackgroundIntegrationTime': np.array([0], dtype=np.int32),
+                     'BackgroundIntegrationTime': np.array([0.]),
+                     'PretriggerTime': np.array([0.]),
+                     'PretriggerAcquisitions': np.array([0], dtype=np.uint64),
+                     'NumberOfLines': np.array([noLines], dtype=np.uint64),
+                     'MaxPeakC': np.array([noLines // 2], dtype=np.float64)}
+        for key, value in num_attrs.items():
+            info.attrs[key] = value
+
+        f['info/first_wn_axis'] = 1600. + 0.3 * np.arange(noLines)
+
+        f.create_group('transmission/info')
+        for v in range(numAcq):
+            acq = f.create_group('transmission/acquisition' + str(v))
+            if timeResolved:
+                amp = 1 + 0.01 * rng.standard_normal((noLines, noTimes, 2))
+                amp[:, :, 1] -= 1
+                acq['amp'] = amp.astype(np.float32)
+                acq['time'] = (np.arange(noTimes) - noTimes // 10) * 4.096e-6
+            else:
+                y = 1 + 0.01 * rng.standard_normal((noLines, 1, 2))
+                y[:, :, 1] -= 1
+                acq['y'] = y.astype(np.float32)
+                acq['x'] = f['info/first_wn_axis'][()].astype(np.float32)
+            norm = rng.uniform(0.5, 1.5, (noLines, 1, 2))
+            acq['NormalizationVector'] = norm.astype(np.float32)
+            acq['peakmeanamp'] = rng.uniform(0, 1, noLines).astype(np.float32)
+            acq['peakstd'] = rng.uniform(0.001, 0.05, noLines).astype(np.float32)
+            acq_info = acq.create_group('info')
+            acq_info.attrs['TimeStamp'] = np.array([70216718681 + v * 1000000], dtype=np.uint64)
+            acq_info.attrs['driftStd'] = np.array([rng.uniform(1e5, 1e6)])
+
+    return filename
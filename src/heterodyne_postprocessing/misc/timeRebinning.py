@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2018 - present, IRsweep AG
+MIT license
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from heterodyne_postprocessing.misc.axisIndex import AxisIndex
+
+
+def nearest_index(axis, values):
+    """
+    Index of the element of axis nearest to each value, the first one on ties, i.e. the same as
+    np.argmin(np.abs(axis-value)) for every value, see AxisIndex.
+
+    Input   :   axis(ndarray) [points] the axis, e.g. the time axis
+                values(float or ndarray) the values to look up
+    Output  :   index(int or ndarray) of the shape of values
+    """
+    return AxisIndex(axis).nearest(values)
+
+
+def lin_time_bins(time, averaging, interleave):
+    """
+    The bins of PostProcessorTimeResolved.getTransientWithLinTime: floor(len(time)/averaging) bins of
+    averaging points starting every averaging points, widened by the interleave so that each point is used
+    in interleave bins.
+
+    Input   :   time(ndarray) [time] the time axis
+                averaging(int) the number of points averaged per bin
+                interleave(float) the overlap of the bins
+    Output  :   starts(ndarray) [bins] the first index of each bin
+                stops(ndarray) [bins] the last index of each bin (included)
+    """
+    time = np.asarray(time)
+    timeIndex = AxisIndex(time)
+    averaging = int(averaging)
+    deltatime = np.abs(np.mean(np.gradient(time)))*averaging
+    noSteps = int(np.floor(len(time)/averaging))
+
+    starts = timeIndex.nearest(np.min(time)+np.arange(0, noSteps)*deltatime-deltatime*(interleave-1))
+    ends = time[np.minimum(starts+(averaging-1), len(time)-1)]
+    stops = timeIndex.nearest(ends+2*deltatime*(interleave-1))
+    return np.atleast_1d(starts), np.atleast_1d(stops)
+
+
+def log_time_bins(time, noSteps, interleave):
+    """
+    The bins of PostProcessorTimeResolved.getTransientWithLogTime on an increasing, positive time axis.
+    Bin i ends at the time nearest to interleave times the i-th of noSteps logarithmically spaced times and
+    the next bin starts at the time nearest to the geometric center of bin i. The stops are looked up at
+    once, the starts follow a recurrence of one binary search per bin.
+
+    Input   :   time(ndarray) [time] the increasing, positive time axis
+                noSteps(int) the number of bins
+                interleave(float) the overlap of the bins
+    Output  :   starts(ndarray) [bins] the first index of each bin
+                stops(ndarray) [bins] the last index of each bin (included)
+                logtime(ndarray) [bins] the geometric center of each bin
+    """
+    time = np.asarray(time)
+    noSteps = int(noSteps)
+    logtime = np.logspace(np.log10(time[0]), np.log10(time[-1]), noSteps)
+    timeIndex = AxisIndex(time)
+    stops = np.atleast_1d(timeIndex.nearest(logtime*interleave))
+
+    starts = np.zeros(noSteps, dtype=np.intp)
+    start = 0
+    for i in range(noSteps):
+        starts[i] = start
+        logtime[i] = np.sqrt(time[start]*time[stops[i]])
+        start = timeIndex.nearest(logtime[i])
+    return starts, stops, logtime
+
+
+def rebin(values, starts, stops):
+    """
+    Mean of values[start:stop+1] along the first axis for every bin, computed for the whole array from a
+    single cumulative sum. Empty bins (stop < start) are NaN.
+
+    Input   :   values(ndarray) [time, ...] e.g. a transient or a [time, lines] cube
+                starts(ndarray) [bins] the first index of each bin
+                stops(ndarray) [bins] the last index of each bin (included)
+    Output  :   rebinned(ndarray) [bins, ...] in double precision
+    """
+    values = np.asarray(values)
+    dtype = np.complex128 if np.iscomplexobj(values) else np.float64
+    cumsum = np.zeros((values.shape[0]+1,)+values.shape[1:], dtype=dtype)
+    np.cumsum(values, axis=0, dtype=dtype, out=cumsum[1:])
+
+    starts = np.asarray(starts)
+    stops = np.asarray(stops)+1
+    counts = stops-starts
+    empty = counts <= 0
+    counts = np.where(empty, 1, counts).reshape((-1,)+(1,)*(values.ndim-1))
+    rebinned = (cumsum[np.maximum(stops, starts)]-cumsum[starts])/counts
+    rebinned[empty] = np.nan
+    return rebinned
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2018 - present, IRsweep AG
+MIT license
+"""
+
+import numpy as np
+
+
+class TimeWindowIndex:
+    """
+    Prefix sums over the time axis of a [time, lines] cube, so that the mean of
+    the complex transmission and the standard deviation of the real one over
+    any window of time slices start:stop are computed in O(lines), whatever the
+    length of the window.
+
+    The sums are accumulated in double precision relative to the mean of each
+    line, which keeps the variance accurate for long axes. The index keeps a
+    read-only copy of the cube to detect that the cube was changed, also in
+    place (see matches).
+    """
+
+    def __init__(self, cube, realCube):
+        """
+        Input   :   cube(ndarray) [time, lines] the complex transmission
+                    realCube(ndarray) [time, lines] its real transmission (complexToReal)
+        """
+        cube = np.array(cube)
+        cube.flags.writeable = False
+        self._copy = cube
+        self.dtype = cube.dtype
+        self.realDtype = realCube.dtype
+        self.shape = cube.shape
+
+        self._offset = np.mean(cube, axis=0, dtype=np.complex128)
+        self._realOffset = np.mean(realCube, axis=0, dtype=np.float64)
+        self._sum = self._prefix_sum(cube-self._offset, np.complex128)
+        centered = realCube-self._realOffset
+        self._realSum = self._prefix_sum(centered, np.float64)
+        self._squareSum = self._prefix_sum(np.square(centered), np.float64)
+
+    @staticmethod
+    def _prefix_sum(values, dtype):
+        prefix = np.zeros((values.shape[0]+1,)+values.shape[1:], dtype=dtype)
+        np.cumsum(values, axis=0, dtype=dtype, out=prefix[1:])
+        return prefix
+
+    @staticmethod
+    def _bytes(cube):
+        return np.ascontiguousarray(cube).view(np.uint8)
+
+    def matches(self, cube):
+        """
+        Whether the index holds the sums of cube, i.e. cube has the content of the copy kept by the index. This
+        is checked on every query, so that writing into the cube (e.g. unnormalizer(proc, inplace=True)) is
+        noticed. The bytes are compared, which costs about one np.mean over the whole cube, but no hash and no
+        conversion to the real transmission.
+        """
+        cube = np.asarray(cube)
+        if cube.shape != self.shape or cube.dtype != self.dtype:
+            return False
+        return np.array_equal(self._bytes(cube), self._bytes(self._copy))
+
+    def mean(self, start, stop):
+        """
+        Mean of the complex transmission over the time slices start:stop, as np.mean(cube[start:stop], axis=0).
+        """
+        mean = (self._sum[stop]-self._sum[start])/(stop-start)+self._offset
+        return mean.astype(self.dtype, copy=False)
+
+    def std(self, start, stop):
+        """
+        Standard deviation of the real transmission over the time slices start:stop, as
+        np.std(realCube[start:stop], axis=0).
+        """
+        count = stop-start
+        if count == 1:
+            return np.zeros(self.shape[1:], dtype=self.realDtype)
+        mean = (self._realSum[stop]-self._realSum[start])/count
+        variance = (self._squareSum[stop]-self._squareSum[start])/count-np.square(mean)
+        return np.sqrt(np.maximum(variance, 0)).astype(self.realDtype, copy=False)
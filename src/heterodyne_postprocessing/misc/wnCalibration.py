@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2018 - present, IRsweep AG
+MIT license
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import scipy.optimize
+
+
+def calibration_axis(noLines, center, spacing, flipped=False):
+    """
+    Wavenumber axis of the manual calibration: noLines lines spaced by spacing
+    around center, reversed if flipped.
+
+    Input   :   noLines(int) the number of lines
+                center(float) the center wavenumber
+                spacing(float) the spacing of the lines
+                flipped(bool) whether the lines are in the reversed order
+    Output  :   wnAxis(ndarray) [lines]
+    """
+    wn = (np.arange(0, noLines)-np.round(noLines)/2)*spacing+center
+    if flipped:
+        wn = np.flip(wn, axis=0)
+    return wn
+
+
+def scaled_transmission(transmission, offset, amplitude):
+    """
+    Transmission of the calibration measurement scaled around its mean by
+    amplitude and shifted by offset, as by the sliders of the manual calibration.
+    """
+    mean = np.nanmean(transmission)
+    return (transmission-mean)*amplitude+mean+offset
+
+
+class CalibrationFit(namedtuple('CalibrationFit', ['wnAxis', 'center', 'spacing', 'offset', 'amplitude', 'flipped',
+                                                   'rms', 'r2', 'correlation', 'overlap', 'stdErrors', 'success'])):
+    """
+    Result of fit_wn_calibration.
+
+    wnAxis is the calibrated axis, center, spacing, offset, amplitude and flipped the
+    parameters of the manual calibration. The quality of the fit is given by the rms of the
+    residual, its coefficient of determination r2 and the correlation of the scaled
+    transmission with the reference, computed on the fraction overlap of the lines which
+    are inside the reference. stdErrors holds the standard errors of center, spacing,
+    offset and amplitude.
+    """
+
+    def report(self):
+        errors = dict(zip(('center', 'spacing', 'offset', 'amplitude'), self.stdErrors))
+        return '\n'.join([
+            'Wavenumber calibration ' + ('converged' if self.success else 'did not converge'),
+            '    center    : %.4f +- %.4f cm-1' % (self.center, errors['center']),
+            '    spacing   : %.6f +- %.6f cm-1' % (self.spacing, errors['spacing']),
+            '    offset    : %.4f +- %.4f' % (self.offset, errors['offset']),
+            '    amplitude : %.4f +- %.4f' % (self.amplitude, errors['amplitude']),
+            '    flipped   : %s' % self.flipped,
+            '    rms %.4g, r2 %.4f, correlation %.4f, %.0f%% of the lines inside the reference'
+            % (self.rms, self.r2, self.correlation, 100*self.overlap)])
+
+
+def _masked_correlation(x, Y, valid):
+    """
+    Pearson correlation of x [lines] with every row of Y [n, lines] on the valid lines only.
+    """
+    n = valid.sum(axis=-1)
+    x = np.where(valid, x, 0)
+    Y = np.where(valid, Y, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        xMean, yMean = x.sum(axis=-1)/n, Y.sum(axis=-1)/n
+        cov = (x*Y).sum(axis=-1)/n-xMean*yMean
+        xVar = (x*x).sum(axis=-1)/n-xMean**2
+        yVar = (Y*Y).sum(axis=-1)/n-yMean**2
+        return cov/np.sqrt(xVar*yVar)
+
+
+def correlation_search(transmission, wnReference, transmissionReference, centers, spacing, flipped=False,
+                       minOverlap=0.5, chunkSize=512):
+    """
+    Correlation of the calibration transmission with the reference interpolated on the calibration axes of
+    many centers.
+
+    Input   :   transmission(ndarray) [lines] the real transmission of the calibration measurement
+                wnReference(ndarray) [points] the increasing wavenumbers of the reference
+                transmissionReference(ndarray) [points] the transmission of the reference
+                centers(ndarray) [centers] the center wavenumbers to try
+                spacing(float) the spacing of the lines
+                flipped(bool) whether the lines are in the reversed order
+                minOverlap(float) the fraction of the lines that have to be inside the reference,
+                the correlation of the other centers is NaN
+                chunkSize(int) the number of centers interpolated at once
+    Output  :   correlation(ndarray) [centers]
+    """
+    noLines = len(transmission)
+    valid = np.isfinite(transmission)
+    offsets = calibration_axis(noLines, 0., spacing, flipped)
+    correlation = np.empty(len(centers))
+    for first in range(0, len(centers), chunkSize):
+        chunk = centers[first:first+chunkSize]
+        ref = np.interp(chunk[:, np.newaxis]+offsets, wnReference, transmissionReference, left=np.nan, right=np.nan)
+        inside = valid & np.isfinite(ref)
+        corr = _masked_correlation(transmission, ref, inside)
+        corr[inside.sum(axis=-1) < minOverlap*noLines] = np.nan
+        correlation[first:first+chunkSize] = corr
+    return correlation
+
+
+def fit_wn_calibration(wnAxis, transmission, wnReference, transmissionReference, flipped=None, centerRange=50,
+                       spacingRange=(0.75, 1.5), searchStep=None, seeds=3, minOverlap=0.5):
+    """
+    Automatic version of the manual calibration: fits the center, the spacing, the offset and the
+    amplitude of the calibration measurement (and whether it is flipped) to the reference.
+    The center is first found by a correlation search over +-centerRange cm-1 for both orders of
+    the lines, the best seeds are then refined with scipy.optimize.least_squares on the
+    difference between the scaled transmission and the reference interpolated on the axis.
+    A line outside the reference counts as a mismatch of the spread (std) of the reference, so that
+    the cost does not fall when the axis slides out of the reference.
+
+    Input   :   wnAxis(ndarray) [lines] the uncalibrated axis, which gives the initial center and spacing
+                transmission(ndarray) [lines] the real transmission of the calibration measurement
+                wnReference(ndarray) [points] the wavenumbers of the reference
+                transmissionReference(ndarray) [points] the transmission of the reference
+                flipped(bool) the order of the lines, both orders are tried if None
+                centerRange(float) the range of the center search in cm-1 around the initial center,
+                the tunable range of the lasers
+                spacingRange(tuple) the bounds of the spacing relative to the initial spacing
+                searchStep(float) the step of the center search, a tenth of the spacing if None
+                seeds(int) the number of maxima of the correlation refined for each order
+                minOverlap(float) the fraction of the lines that have to be inside the reference,
+                fits with a smaller overlap are rejected
+    Output  :   fit(CalibrationFit)
+    """
+    wnAxis = np.squeeze(np.asarray(wnAxis, dtype=np.float64))
+    transmission = np.asarray(transmission, dtype=np.float64).ravel()
+    order = np.argsort(np.ravel(wnReference))
+    wnReference = np.ravel(wnReference).astype(np.float64)[order]
+    transmissionReference = np.ravel(transmissionReference).astype(np.float64)[order]
+    noLines = len(transmission)
+
+    center0 = np.mean(wnAxis)
+    spacing0 = np.mean(np.gradient(wnAxis))
+    if searchStep is None:
+        searchStep = abs(spacing0)/10
+    centers = np.arange(center0-centerRange, center0+centerRange+searchStep/2, searchStep)
+    spacingBounds = sorted((spacing0*spacingRange[0], spacing0*spacingRange[1]))
+    lower = [center0-centerRange, spacingBounds[0], -1., 0.]
+    upper = [center0+centerRange, spacingBounds[1], 1., 4.]
+
+    valid = np.isfinite(transmission)
+    # residual of the lines outside the reference
+    penalty = np.std(transmissionReference)
+
+    def reference(params, flip):
+        center, spacing = params[:2]
+        return np.interp(calibration_axis(noLines, center, spacing, flip), wnReference, transmissionReference,
+                         left=np.nan, right=np.nan)
+
+    def residual(params, flip):
+        ref = reference(params, flip)
+        diff = scaled_transmission(transmission, *params[2:])-ref
+        return np.where(valid, np.where(np.isfinite(ref), diff, penalty), 0.)
+
+    best = None
+    for flip in ((False, True) if flipped is None else (bool(flipped),)):
+        correlation = correlation_search(transmission, wnReference, transmissionReference, centers, spacing0, flip,
+                                         minOverlap)
+        if np.all(np.isnan(correlation)):
+            continue
+        # local maxima of the correlation, the largest first
+        corr = np.nan_to_num(correlation, nan=-np.inf)
+        peaks = np.flatnonzero((corr >= np.roll(corr, 1)) & (corr >= np.roll(corr, -1)) & np.isfinite(corr))
+        for peak in peaks[np.argsort(corr[peaks])[::-1][:seeds]]:
+            x0 = np.clip([centers[peak], spacing0, 0., 1.], lower, upper)
+            result = scipy.optimize.least_squares(residual, x0, bounds=(lower, upper), x_scale='jac', args=(flip,))
+            if np.sum(valid & np.isfinite(reference(result.x, flip))) < minOverlap*noLines:
+                continue
+            if best is None or result.cost < best[0].cost:
+                best = (result, flip)
+
+    if best is None:
+        raise ValueError('The calibration measurement does not overlap with the reference')
+    result, flip = best
+
+    center, spacing, offset, amplitude = result.x
+    wn = calibration_axis(noLines, center, spacing, flip)
+    ref = np.interp(wn, wnReference, transmissionReference, left=np.nan, right=np.nan)
+    inside = valid & np.isfinite(ref)
+    model = scaled_transmission(transmission, offset, amplitude)[inside]
+    res = model-ref[inside]
+    ssRes = np.sum(res**2)
+    ssTot = np.sum((ref[inside]-np.mean(ref[inside]))**2)
+    dof = max(inside.sum()-len(result.x), 1)
+    jac = result.jac[inside]
+    stdErrors = np.sqrt(np.abs(np.diag(np.linalg.pinv(jac.T @ jac))*ssRes/dof))
+
+    return CalibrationFit(wnAxis=wn, center=center, spacing=spacing, offset=offset, amplitude=amplitude,
+                          flipped=flip, rms=np.sqrt(ssRes/inside.sum()), r2=1-ssRes/ssTot,
+                          correlation=np.corrcoef(model, ref[inside])[0, 1], overlap=inside.mean(),
+                          stdErrors=stdErrors, success=result.success)
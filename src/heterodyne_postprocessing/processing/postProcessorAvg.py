@@ -8,19 +8,27 @@ import os,sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
 from heterodyne_postprocessing.processing.postProcessorConfigurationMethods import PostProcessorConfigurationMethods
+from heterodyne_postprocessing.misc.lazyAcquisitionCube import LazyAcquisitionCube
+from heterodyne_postprocessing.misc.bandedWeights import BandedWeights, fingerprint
 
 import numpy as np
+import scipy.sparse
 import copy as copy
+from collections import OrderedDict
 import matplotlib.pyplot as plt
 
 
 class PostProcessorAvg(PostProcessorConfigurationMethods):
     def __init__(self):
         super().__init__()
+        #least recently used cache of the smoothing weights, see smoothing_weights
+        self.smoothingCacheSize = 16
+        self._smoothingCache = OrderedDict()
+        self._smoothingCacheState = None
         
         
         
-    def acquisition_average(self, startIndx=None, stopIndx=None, plotOn=False):
+    def acquisition_average(self, startIndx=None, stopIndx=None, plotOn=False, batchSize=None):
         """
         Function to average acquisitions together. Saves the data under 
         proc.data_name+'AvgOfFiles'.
@@ -30,6 +38,9 @@ class PostProcessorAvg(PostProcessorConfigurationMethods):
                     plotOnt(bool) boolean to plot or not data before/after
                     ASC_robust(bool) set to True if there is suspicion that path length changes occurred between
                     background and sample measurements.
+                    batchSize(int) if given, the average and its standard deviation are computed in a single
+                    streaming pass over batches of batchSize acquisitions (see streaming_average). This is
+                    always the case when the transmission was loaded lazily.
         """
         if startIndx is None:
             startIndx = 0
@@ -38,9 +49,13 @@ class PostProcessorAvg(PostProcessorConfigurationMethods):
         else:
             stopIndx = stopIndx+1
 
-        tmp_avg = self.averageConfiguration(startIndx, stopIndx)
+        if batchSize is not None or isinstance(self.data[self.data_name], LazyAcquisitionCube):
+            tmp_avg, std_mean, stdIsAbsolute = self.streaming_average(startIndx, stopIndx,
+                                                                      batchSize=batchSize or 16)
+        else:
+            tmp_avg = self.averageConfiguration(startIndx, stopIndx)
 
-        std_mean, stdIsAbsolute = self.std_average(startIndx=startIndx, stopIndx=stopIndx)
+            std_mean, stdIsAbsolute = self.std_average(startIndx=startIndx, stopIndx=stopIndx)
 
         if stdIsAbsolute:
             std_mean = std_mean/self.complexToReal(tmp_avg)
@@ -93,34 +108,108 @@ class PostProcessorAvg(PostProcessorConfigurationMethods):
                     ax_phase.set_xlabel('Wavenumber [cm$^{-1}$]')
                     ax_phase.set_ylabel('Phase angle of complex transmission / rad')
     
-    def std_average(self, startIndx, stopIndx):
+    def std_average(self, startIndx, stopIndx, batchSize=64):
         '''
         Method to average the standard deviation via squared sums. As the standard deviation saved in stdPeakAcqs is normalized by its mean value,
         it must first multiplied with its value. Carful, the return is not anymore a relative standard deviation.
+        The squared sums are computed batchSize acquisitions at a time, so that at most one batch of the real
+        transmission is held in memory besides the transmission itself.
         '''
-        temp=0
-        
         #checks if the standard deviation for each acquisition is in the dic data. If not (old procsessor) the stdpeak is returnd
-        if 'stdPeakAcqs' in self.data.keys():            
-            if self.is_timeintegrated(): 
-                for i in range(startIndx,stopIndx):
-                    temp+=np.power(self.data['stdPeakAcqs'][:,i]*self.complexToReal(self.data[self.data_name][:,i]),2)
-                std_mean = np.sqrt(temp)/(stopIndx-startIndx)
+        if 'stdPeakAcqs' in self.data.keys():
+            stdAcqs = self.data['stdPeakAcqs']
+            temp = 0
+            if self.is_timeintegrated():
+                for first, batch in self._iter_acquisition_batches(self.data[self.data_name], startIndx, stopIndx,
+                                                                   batchSize):
+                    absolute = self.complexToReal(batch)*stdAcqs[:, first:first+batch.shape[-1]]
+                    temp = temp+np.einsum('ij,ij->i', absolute, absolute)
                 stdIsAbsolute = True
-                
+
             if self.is_timeresolved(): #in the time resolved case the transient trans over the background is 1, so no transformation from rel to absolute is required.
-                for i in range(startIndx,stopIndx):
-                    temp+=np.power(self.data['stdPeakAcqs'][:,i],2)    
-                std_mean = np.sqrt(temp)/(stopIndx-startIndx)
+                batch = stdAcqs[:, startIndx:stopIndx]
+                temp = np.einsum('ij,ij->i', batch, batch)
                 stdIsAbsolute = False
-                
+            std_mean = np.sqrt(temp)/(stopIndx-startIndx)
+
         else:
             std_mean = self.data['stdPeak']
             stdIsAbsolute = False
-            
+
         return std_mean, stdIsAbsolute
+
+
+    def streaming_average(self, startIndx, stopIndx, batchSize=16):
+        """
+        Average the acquisitions startIndx:stopIndx and their standard deviation in a single pass, reading
+        batchSize acquisitions at a time. Only the running sums are kept in memory, so files with more
+        acquisitions than fit into memory can be averaged when the transmission was loaded lazily.
+        The averaging follows the same rules as averageConfiguration (complex average, except for PSC
+        time integrated measurements where magnitude and phase are averaged separately) and the standard
+        deviation the same squared sums as std_average.
         
-    
+        Input   :   startIndx(int) the first acquisition to take
+                    stopIndx(int) the acquisition after the last one to take
+                    batchSize(int) the number of acquisitions read at once
+        Output  :   tmp_avg(ndarray) the averaged transmission
+                    std_mean(ndarray) the standard deviation of the average
+                    stdIsAbsolute(bool) whether std_mean is absolute (as returned by std_average)
+        """
+        data = self.data[self.data_name]
+        separateMagnitude = self.config.read_ASC_PSC_configuration() == 'PSC' and self.is_timeintegrated()
+        hasStdAcqs = 'stdPeakAcqs' in self.data.keys()
+        stdNeedsData = hasStdAcqs and self.is_timeintegrated()
+        numAvg = stopIndx-startIndx
+
+        complexSum = 0
+        magnitudeSum = 0
+        stdSquaredSum = 0
+        if isinstance(data, LazyAcquisitionCube) and not (separateMagnitude or stdNeedsData):
+            # only the complex sum is needed, which the cube computes without converting each acquisition
+            complexSum = data[..., startIndx:stopIndx].mean(axis=-1, dtype=np.complex128)*numAvg
+            batches = ()
+        else:
+            batches = self._iter_acquisition_batches(data, startIndx, stopIndx, batchSize)
+        for first, batch in batches:
+            complexSum = complexSum + np.sum(batch, axis=-1, dtype=np.complex128)
+            if separateMagnitude:
+                magnitudeSum = magnitudeSum + np.sum(np.abs(batch), axis=-1, dtype=np.float64)
+            if stdNeedsData:
+                stdAcqs = self.data['stdPeakAcqs'][:, first:first+batch.shape[-1]]
+                stdSquaredSum = stdSquaredSum + np.sum(np.power(stdAcqs*self.complexToReal(batch), 2),
+                                                       axis=-1, dtype=np.float64)
+
+        if separateMagnitude:
+            tmp_avg = magnitudeSum/numAvg*np.exp(1j*np.angle(complexSum))
+        else:
+            tmp_avg = complexSum/numAvg
+        tmp_avg = tmp_avg.astype(data.dtype, copy=False)
+
+        if stdNeedsData:
+            std_mean = (np.sqrt(stdSquaredSum)/numAvg).astype(self.data['stdPeakAcqs'].dtype, copy=False)
+            stdIsAbsolute = True
+        elif hasStdAcqs:
+            # in the time resolved case the std does not depend on the transmission, see std_average
+            std_mean, stdIsAbsolute = self.std_average(startIndx=startIndx, stopIndx=stopIndx)
+        else:
+            std_mean = self.data['stdPeak']
+            stdIsAbsolute = False
+
+        return tmp_avg, std_mean, stdIsAbsolute
+
+    @staticmethod
+    def _iter_acquisition_batches(data, startIndx, stopIndx, batchSize):
+        """
+        Yield (index of the first acquisition, batch) for the acquisitions startIndx:stopIndx of a
+        transmission array or of a LazyAcquisitionCube, batchSize acquisitions at a time.
+        """
+        if isinstance(data, LazyAcquisitionCube):
+            for j, batch in enumerate(data[..., startIndx:stopIndx].iter_acquisitions(batchSize)):
+                yield startIndx+j*batchSize, batch
+        else:
+            for first in range(startIndx, stopIndx, batchSize):
+                yield first, data[..., first:min(first+batchSize, stopIndx)]
+
     def gaussian(self,x, mu, sig):
         return (1./(np.sqrt(2.*np.pi)*sig)*np.exp(-np.power((x - mu)/sig, 2.)/2))
     
@@ -141,13 +230,8 @@ class PostProcessorAvg(PostProcessorConfigurationMethods):
                     treshold filters the standqrd deviation peaks above it's value
                     
         """
-        old_avg = np.copy(self.data[self.data_name+'AvgOfFiles'])
-        new_avg = np.copy(self.data[self.data_name+'AvgOfFiles'])
+        old_avg = self.data[self.data_name+'AvgOfFiles']
         
-        if self.is_timeintegrated():
-            old_avg_indiv= np.copy(self.data[self.data_name])
-            new_avg_indiv = np.copy(self.data[self.data_name])
-            
         if writeParameters:
             self.gaussianConvolve=gaussianConvolve
             self.gaussianWNsigma=gaussianWNsigma
@@ -155,26 +239,29 @@ class PostProcessorAvg(PostProcessorConfigurationMethods):
         
         if gaussianConvolve is False:
             spectralHalfWidth = int(spectralHalfWidth)
-            for i in np.arange(0,old_avg.shape[-1]):
-                start = np.max([0,i-spectralHalfWidth])
-                stop = np.min([i+spectralHalfWidth+1,old_avg.shape[-1]])
-                if self.is_timeresolved():
-                        new_avg[:,i] = self.smoothingAvg(old_avg, start, stop, self.weights(start,stop,threshold))
-                elif self.is_timeintegrated():
-                        new_avg[i] = self.smoothingAvg(old_avg, start, stop,self.weights(start,stop,threshold))
-                        new_avg_indiv[i,:] = self.smoothingAvgIndiv(old_avg_indiv, start, stop, self.weights(start,stop,threshold,individual=True))  
+            gaussianWNsigma = None
+            windowThreshold = 1 #the window filter has never applied the std threshold
         elif gaussianConvolve is True: 
-             gaussianWNsigma=abs(gaussianWNsigma/(self.data['wnAxis'][1]-self.data['wnAxis'][0])) #calculate from cm^-1 to line numbers
-             spectralHalfWidth = int(np.ceil(gaussianWNsigma))*3 #calculates the considered points
-             for i in np.arange(0,old_avg.shape[-1]):
-                start = np.max([0,i-spectralHalfWidth])
-                stop = np.min([i+spectralHalfWidth+1,old_avg.shape[-1]])
-                if self.is_timeresolved():
-                        new_avg[:,i] = self.smoothingAvg(old_avg, start, stop, self.weights(start,stop,i,gaussianWNsigma,threshold)) 
-                elif self.is_timeintegrated():
-                        new_avg[i] = self.smoothingAvg(old_avg, start, stop,self.weights(start,stop,i,gaussianWNsigma,threshold))      
-                        new_avg_indiv[i,:] = self.smoothingAvgIndiv(old_avg_indiv, start, stop,self.weights(start,stop,i,gaussianWNsigma,threshold,individual=True))  
-                    
+            gaussianWNsigma=abs(gaussianWNsigma/(self.data['wnAxis'][1]-self.data['wnAxis'][0])) #calculate from cm^-1 to line numbers
+            spectralHalfWidth = int(np.ceil(gaussianWNsigma))*3 #calculates the considered points
+            windowThreshold = threshold
+        
+        #the weights of all lines are applied at once with a banded (sparse) matrix
+        noLines = old_avg.shape[-1]
+        separateMagnitude = self.config.read_ASC_PSC_configuration() == 'PSC' and self.is_timeintegrated()
+        
+        new_avg = np.empty_like(old_avg)
+        weights = self.smoothing_weights(noLines, spectralHalfWidth, gaussianWNsigma, windowThreshold)
+        if self.is_timeresolved():
+            new_avg[...] = weights.apply(old_avg.T, separateMagnitude).T
+        elif self.is_timeintegrated():
+            new_avg[...] = weights.apply(old_avg[:, np.newaxis], separateMagnitude)[:, 0]
+            
+            old_avg_indiv = np.asarray(self.data[self.data_name])
+            new_avg_indiv = np.empty_like(old_avg_indiv)
+            weights = self.smoothing_weights(noLines, spectralHalfWidth, gaussianWNsigma, windowThreshold,
+                                             individual=True)
+            new_avg_indiv[...] = weights.apply(old_avg_indiv, separateMagnitude)
                     
         self.data.update({self.data_name+'SpectralAvgOfFiles':new_avg})
         self.last_data_type = 'SpectralAvgOfFiles'
@@ -198,6 +285,74 @@ class PostProcessorAvg(PostProcessorConfigurationMethods):
                 ax.set_ylabel('Transmission') 
             ax.legend()
             
+    def smoothing_kernel(self, noLines, spectralHalfWidth, gaussianWNsigma=None):
+        """
+        Banded matrix of the spectral filter used by spectral_smoothing: row i holds the filter of line i over the
+        lines i-spectralHalfWidth:i+spectralHalfWidth+1, like the norm of weights().
+        
+        Input   :   noLines(int) the number of lines
+                    spectralHalfWidth(int) the half width of the filter in lines
+                    gaussianWNsigma(float) the Gaussian sigma in lines. When None, a window (box) filter is used
+        Output  :   kernel(scipy.sparse.csr_matrix) a noLines x noLines matrix
+        """
+        offsets = np.arange(-spectralHalfWidth, spectralHalfWidth+1)
+        offsets = offsets[np.abs(offsets) < noLines]
+        if gaussianWNsigma is not None:
+            values = self.gaussian(offsets, 0, gaussianWNsigma)
+        else:
+            values = np.ones(offsets.size)
+        return scipy.sparse.diags(values, offsets, shape=(noLines, noLines), format='csr')
+    
+    def smoothing_weights(self, noLines, spectralHalfWidth, gaussianWNsigma=None, threshold=1, individual=False):
+        """
+        Normalised weights of spectral_smoothing for all lines. They are kept in a least recently used cache of
+        smoothingCacheSize entries, keyed by the smoothing parameters and a fingerprint of the standard deviation they
+        are computed from, so that smoothing again with the same parameters only costs the matrix product. The cache
+        is cleared when stdAvgOfFiles or wnAxis change.
+        
+        Input   :   noLines(int) the number of lines
+                    spectralHalfWidth(int) the half width of the filter in lines
+                    gaussianWNsigma(float) the Gaussian sigma in lines. When None, a window (box) filter is used
+                    treshold(int) the std tresholding value, only applied if 0<threshold<1
+                    individual(bool) If True, the std of each acquisition is used when available
+        Output  :   weights(BandedWeights)
+        """
+        state = (fingerprint(self.data.get('stdAvgOfFiles')), fingerprint(self.data.get('wnAxis')))
+        if state != self._smoothingCacheState:
+            self._smoothingCache.clear()
+            self._smoothingCacheState = state
+        
+        stdPeak = self.smoothing_std(individual)
+        key = (noLines, spectralHalfWidth, gaussianWNsigma, threshold, individual, fingerprint(stdPeak))
+        if key in self._smoothingCache:
+            self._smoothingCache.move_to_end(key)
+            return self._smoothingCache[key]
+        
+        weight = 1/stdPeak**2
+        if 0<threshold<1:
+            weight[stdPeak>threshold] = 0
+        weights = BandedWeights(self.smoothing_kernel(noLines, spectralHalfWidth, gaussianWNsigma), weight)
+        
+        self._smoothingCache[key] = weights
+        while len(self._smoothingCache) > self.smoothingCacheSize:
+            self._smoothingCache.popitem(last=False)
+        return weights
+    
+    def smoothing_std(self, individual=False):
+        """
+        Standard deviation of every line used to weight the spectral smoothing.
+        
+        Input   :   individual(bool) If True, the std of each acquisition is used when available
+        Output  :   stdPeak(ndarray) [lines] or [lines, acquisitions] if individual is True. When the std of each
+                    acquisition is not available, the shape is [lines, 1].
+        """
+        if individual and 'stdPeakAcqs' in self.data.keys():
+            return self.data['stdPeakAcqs']
+        stdPeak = self.getStdAxis()
+        if individual:
+            stdPeak = stdPeak[:, np.newaxis]
+        return stdPeak
+    
     def weights(self,start,stop,index=0,gaussianWNsigma=None,threshold=1,individual=False):
         """
         Function to generate the weights either from stdPeak or from the
@@ -5,10 +5,10 @@ MIT license
 """
 
 import os,sys
-import csv
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
 from heterodyne_postprocessing.processing.postProcessorAvg import PostProcessorAvg
+from heterodyne_postprocessing.misc.dataExporters import get_exporter
 
 import numpy as np
 
@@ -19,6 +19,8 @@ from PyQt5 import QtWidgets
 class PostProcessorCSVSaver(PostProcessorAvg):
     def __init__(self):
         super().__init__()
+        # file format of csv_export, see misc/dataExporters.py
+        self.exportFormat = 'csv'
         
         
     def avg_to_csv(self):
@@ -31,11 +33,12 @@ class PostProcessorCSVSaver(PostProcessorAvg):
         
         np.savetxt(filename,np.transpose(data),header=header,delimiter=',')
         
-    def csv_export(self,export,ToReal=True, transpose = False):
+    def csv_export(self,export,ToReal=True, transpose = False, fileFormat = None, chunkRows = 4096):
         '''
         It exports the data "export" in a CSV file in the same directory as the file is.
         Depending on the data, the time axis, WN axis, or TimeSteps axis is added.
-    
+        The files are written by the exporter of fileFormat (misc/dataExporters.py), without building
+        copies of the data with the axes inserted.
 
         Parameters
         ----------
@@ -47,92 +50,40 @@ class PostProcessorCSVSaver(PostProcessorAvg):
         ToReal : boolean, optional
             Transforms the data to real values. The default is True.
         transpose : boolean, optional
-            Export the transposed data. The default is False.
+            Export the transposed data (CSV only). The default is False.
+        fileFormat : str, optional
+            'csv' (one file per acquisition for 3d data), or a single file
+            with the data and the axes: 'npz', 'hdf5' or 'parquet' (requires
+            pyarrow). The default is proc.exportFormat ('csv').
+        chunkRows : int, optional
+            The number of CSV lines formatted at once. The default is 4096.
 
         Returns
         -------
-        None.
+        filenames : list
+            The written files.
 
         '''
-        
+        exporter = get_exporter(self.exportFormat if fileFormat is None else fileFormat)
+
         if ToReal:
-            data = self.complexToReal(np.array(export))
-    
+            data = self.complexToReal(np.asarray(export))
         else:
-            data = np.array(export)
-     
-            
-        if data.ndim == 1:
-            #insert wnAxis
-            try:
-                WNAxis=np.squeeze(self.data['wnAxis']) 
-                data = np.insert([data],[0],[WNAxis],axis=0)
-            except:
-                print('wnAxis and data dimentions do not match')        
-            
-            if transpose == True:
-                # transpose data to make the result more readable for some programs
-                data = np.transpose(data)
-            
-            with open(self.config.filename[:-18]+'_export.csv', 'w', newline='') as exptData:
-                wr = csv.writer(exptData, dialect='excel', quoting=csv.QUOTE_NONE)
-                for v in data:
-                    wr.writerow(v)        
-        
-        elif data.ndim == 2:
-            #insert wnAxis
-       
-            try:
-                WNAxis=np.squeeze(self.data['wnAxis'])
-                #get shape
-                (row,col)=data.shape
-                if row == len(WNAxis):
-                    data=data.T
-                data = np.insert(data,0,WNAxis,0)
-            except:
-                print('wnAxis and data dimentions do not match')
+            data = np.asarray(export)
 
-            try:
-                tsi = np.array(np.insert(self.data['timeAxis'], 0,0,0))
-            except:
-                tsi = np.array(np.insert(self.data['timeStamp'], 0,0,0))
-            try:
-                data = np.insert(data,0,tsi,1)
-            except:
-                print('timeAxis and data dimensions do not match')
-                
-            if transpose == True:
-                # transpose data to make the result more readable for some programs
-                data = np.transpose(data)
+        if data.ndim not in (1, 2, 3):
+            print('sorry, your data input is not supported')
+            return []
 
-            with open(self.config.filename[:-18]+'_export.csv', 'w', newline='') as exptData:
-                wr = csv.writer(exptData, dialect='excel', quoting=csv.QUOTE_NONE)
-                for v in data:
-                    wr.writerow(v)
-                    
-        elif data.ndim == 3: #dim=3 time resolved, more files to generate
-            for i in range(data.shape[-1]):
+        WNAxis = np.squeeze(self.data['wnAxis']) if 'wnAxis' in self.data else None
+        timeName = 'timeAxis'
+        timeAxis = self.data.get('timeAxis')
+        if data.ndim == 2:
+            if timeAxis is None:
+                timeName = 'timeStamp'
+                timeAxis = self.data.get('timeStamp')
+            if WNAxis is not None and np.ndim(WNAxis) == 1 and data.shape[0] == len(WNAxis):
+                # lines along the columns, as for the time resolved data
+                data = data.T
 
-                #insert wnAxis
-                try:
-                    WNAxis=np.squeeze(self.data['wnAxis'])
-                    expData = np.insert(data[:,:,i],0,WNAxis,axis=0)
-                except:
-                    print('wnAxis and data dimensions do not match')
-                #insert timeAxis
-                tsi = np.array(np.insert(self.data['timeAxis'], 0,0,0))
-                try: 
-                    expData = np.insert(expData,0,tsi,axis=1)
-                except:
-                    print('timeAxis and data dimensions do not match')
-                
-                if transpose == True:
-                    # transpose data to make the result more readable for some programs
-                    data = np.transpose(data)
-                
-                with open(self.config.filename[:-18]+'_export_acquisition'+str(i+1)+'.csv', 'w', newline='') as expFile:
-                    wr = csv.writer(expFile, dialect='excel', quoting=csv.QUOTE_NONE, escapechar='\\')
-                    for v in expData:
-                        wr.writerow(v)
-        else:
-            print('sorry, your data input is not supported')    
\ No newline at end of file
+        return exporter(self.config.filename[:-18], data, WNAxis, timeAxis, timeName, transpose, chunkRows)
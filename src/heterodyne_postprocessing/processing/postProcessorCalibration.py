@@ -8,11 +8,14 @@ import os,sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
 from heterodyne_postprocessing.processing.postProcessorCSVSaver import PostProcessorCSVSaver
+from heterodyne_postprocessing.misc.lagEstimation import estimate_lag, lagged_wn_axis
+from heterodyne_postprocessing.misc.wnCalibration import fit_wn_calibration, scaled_transmission
 
 import numpy as np
 import h5py
 import warnings
 import copy 
+from collections import OrderedDict
 
 import scipy.io
 import matplotlib.pyplot as plt
@@ -25,6 +28,10 @@ from shutil import copy2
 
 
 class PostProcessorCalibration(PostProcessorCSVSaver):
+    # calibrations read by read_calibration, shared by all processors of the session
+    calibrationCacheSize = 8
+    _calibrationCache = OrderedDict()
+    
     def __init__(self):
         super().__init__()
         
@@ -33,6 +40,10 @@ class PostProcessorCalibration(PostProcessorCSVSaver):
         
         self.calibMeasurementName = None
         self.calibReferenceName = None
+        self.calibrationSidecar = False
+        self.lagWindow = None
+        self.subsampleLag = False
+        self.calibrationFit = None
         
                 
     def read_calibMeasurement(self,measurement=None,specHalfWidth=0,start=None,stop=None,plotOn=False):
@@ -98,25 +109,29 @@ class PostProcessorCalibration(PostProcessorCSVSaver):
                    
         
 
-    def calibration(self, plotOn=False):
+    def calibration(self, plotOn=False, manual=True):
         """
         Performs a calibration of the static measurement with respect to the 
-        reference one if manualCalib is True. Otherwise loads the precalibrated static measurements.
+        reference one, automatically and then manually if manual is True.
         Then modifies the actual measurement(TR or static) with the correct wavenumber axis.
         Inputs:
-            manualCalib: boolean saying, if manual calibration should be performed.
+            manual: boolean saying, if the automatic calibration should be refined manually.
             plotOn: boolean saying, if the calibrated measurement is to be plotted.
         """
         
-        self.manual_calibration()
+        self.fit_calibration(manual=manual)
         
         self.save_new_calibration()
         
         self.add_lag_measurement(plotOn)
         
-    def calibrateWNaxisOfCalibration(self, calibFilename=None, refFilename=None, specHalfWidth=0, start=None, stop=None, plotOn=False):
+    def calibrateWNaxisOfCalibration(self, calibFilename=None, refFilename=None, specHalfWidth=0, start=None, stop=None, plotOn=False,
+                                     manual=True):
         '''
-        Method that let's the user manually calibrate the wavenumber axis of a calibration measurement and saves the calibrated measurement with the new wn axis.
+        Method that calibrates the wavenumber axis of a calibration measurement and saves the calibrated measurement with the new wn axis.
+        The axis is fitted to the reference (automatic_calibration), then the user can refine it manually, starting from the fit
+        (or from the uncalibrated axis if the fit failed, see fit_calibration).
+        With manual=False, no figure is shown, e.g. to calibrate on a server.
         Inputs:
             - calibFilename: full address and filename of the calibration measurement (xxxx.h5)
             - refFilename: full address and filename of the reference spectrum (xxxx.mat)
@@ -124,14 +139,16 @@ class PostProcessorCalibration(PostProcessorCSVSaver):
             - start: start index from where to average calibration measurements
             - stop: stop index up to where to average calibration measurements
             - plotOn: whether or not to plot the calibrated data
+            - manual: whether or not to refine the automatic calibration with the manual calibration figure
         '''
         
         self.read_calibReference(reference = refFilename)
         self.read_calibMeasurement(measurement=calibFilename, specHalfWidth=specHalfWidth, start=start, stop=stop, plotOn=plotOn)
-        self.manual_calibration()
+        self.fit_calibration(plotOn=plotOn and not manual, manual=manual)
         self.save_new_calibration()
 
-    def calibrateWNaxisOfMeasurement(self, calibFilename=None, specHalfWidth=0, start=None, stop=None, plotOn=False, debug = False):
+    def calibrateWNaxisOfMeasurement(self, calibFilename=None, specHalfWidth=0, start=None, stop=None, plotOn=False, debug = False,
+                                     calibration=None):
         '''
         Method that calibrates the wn-axis of a measurement using a previously manually calibrated calibration measurement.
 
@@ -141,9 +158,21 @@ class PostProcessorCalibration(PostProcessorCSVSaver):
             - start: start index from where to average calibration measurements
             - stop: stop index up to where to average calibration measurements
             - plotOn: whether or not to plot the cross-correlated peak amplitudes
+            - calibration: the calibration measurement already read, as returned by calibration_data(). When given,
+              calibFilename, specHalfWidth, start and stop are ignored and the file is not read again
+        
+        The calibration measurement is read through read_calibration, so calibrating many measurements against the
+        same file only reads it once.
         '''
         
-        self.read_preCalibratedMeasurement(measurement=calibFilename, specHalfWidth=specHalfWidth, start=start, stop=stop, plotOn=False)
+        if calibration is None and calibFilename is None:
+            self.read_preCalibratedMeasurement(measurement=calibFilename, specHalfWidth=specHalfWidth, start=start, stop=stop, plotOn=False)
+        else:
+            if calibration is None:
+                calibration = self.read_calibration(calibFilename, specHalfWidth, start, stop)
+            self.data.update({key: calibration[key] for key in ('transmissionCalib', 'wnAxisCalib', 'peakMeanAmpCalib')})
+            self.flipped = calibration['flipped']
+            self.calibMeasurementName = calibration['calibMeasurementName']
         self.add_lag_measurement(plotOn=plotOn)
             
         if debug == False:
@@ -152,24 +181,124 @@ class PostProcessorCalibration(PostProcessorCSVSaver):
             del self.data['transmissionCalib']
             del self.data['wnAxisCalib']
 
+    def calibration_data(self):
+        '''
+        Returns the calibration measurement read by read_preCalibratedMeasurement, so that it can be passed to
+        calibrateWNaxisOfMeasurement(calibration=...) of other processors without reading the file again.
+
+        Output : calibration(dict) with the keys transmissionCalib, wnAxisCalib, peakMeanAmpCalib, flipped and
+                 calibMeasurementName
+        '''
+        calibration = {key: self.data[key] for key in ('transmissionCalib', 'wnAxisCalib', 'peakMeanAmpCalib')}
+        calibration.update({'flipped': self.flipped, 'calibMeasurementName': self.calibMeasurementName})
+        return calibration
+
+    def read_calibration(self, calibFilename, specHalfWidth=0, start=None, stop=None, sidecar=None):
+        '''
+        Reads a calibrated calibration measurement like read_preCalibratedMeasurement, through a cache.
+        The calibrations are kept in memory in a least recently used cache of calibrationCacheSize entries shared by
+        all processors, keyed by the absolute path, the modification time and the size of the file and by the
+        averaging parameters. Recalibrating the file (save_new_calibration) changes its modification time, so the
+        cached calibration is not used anymore.
+        With sidecar, the calibration is also stored next to the file in <calibFilename without .h5>.calibcache.h5
+        and read from there by later sessions, as long as the calibration file does not change.
+
+        Inputs:
+            - calibFilename: full address and filename of the calibration measurement
+            - specHalfWidth: smoothing width applied to the calibration measurement
+            - start: start index from where to average calibration measurements
+            - stop: stop index up to where to average calibration measurements
+            - sidecar: whether or not to use the sidecar file, self.calibrationSidecar if None
+        Output : calibration(dict) as returned by calibration_data, with arrays which are not shared with the cache
+        '''
+        if sidecar is None:
+            sidecar = self.calibrationSidecar
+        filename = os.path.abspath(calibFilename)
+        stat = os.stat(filename)
+        key = (filename, stat.st_mtime_ns, stat.st_size, specHalfWidth, start, stop)
+        
+        cache = PostProcessorCalibration._calibrationCache
+        if key in cache:
+            cache.move_to_end(key)
+            calibration = cache[key]
+        else:
+            calibration = self._read_calibration_sidecar(key) if sidecar else None
+            if calibration is None:
+                proc = PostProcessorCalibration()
+                proc.data = {}
+                proc.read_preCalibratedMeasurement(filename, specHalfWidth, start, stop, plotOn=False)
+                calibration = proc.calibration_data()
+                if sidecar:
+                    self._write_calibration_sidecar(key, calibration)
+            cache[key] = calibration
+            while len(cache) > self.calibrationCacheSize:
+                cache.popitem(last=False)
+        return {key: np.copy(value) if isinstance(value, np.ndarray) else value for key, value in calibration.items()}
+    
+    @staticmethod
+    def _calibration_sidecar(key):
+        '''
+        Name of the sidecar file and of the group of a read_calibration cache key
+        '''
+        filename, _, _, specHalfWidth, start, stop = key
+        return os.path.splitext(filename)[0]+'.calibcache.h5', 'specHalfWidth=%r,start=%r,stop=%r' % (specHalfWidth, start, stop)
+    
+    @classmethod
+    def _read_calibration_sidecar(cls, key):
+        '''
+        The calibration stored in the sidecar file for key, None if it is missing or was computed from another version
+        of the calibration file
+        '''
+        sidecarName, group = cls._calibration_sidecar(key)
+        if not os.path.exists(sidecarName):
+            return None
+        try:
+            with h5py.File(sidecarName, 'r') as f:
+                if group not in f:
+                    return None
+                g = f[group]
+                if (g.attrs['mtime_ns'], g.attrs['size']) != key[1:3]:
+                    return None
+                calibration = {name: g[name][()] for name in ('transmissionCalib', 'wnAxisCalib', 'peakMeanAmpCalib')}
+                calibration.update({'flipped': g.attrs['flipped'], 'calibMeasurementName': key[0]})
+        except (OSError, KeyError):
+            warnings.warn('The calibration cache '+sidecarName+' could not be read, the calibration is read again')
+            return None
+        return calibration
+    
+    @classmethod
+    def _write_calibration_sidecar(cls, key, calibration):
+        '''
+        Stores the calibration in the sidecar file for key, replacing an older version
+        '''
+        sidecarName, group = cls._calibration_sidecar(key)
+        try:
+            with h5py.File(sidecarName, 'a') as f:
+                if group in f:
+                    del f[group]
+                g = f.create_group(group)
+                for name in ('transmissionCalib', 'wnAxisCalib', 'peakMeanAmpCalib'):
+                    g[name] = calibration[name]
+                g.attrs['mtime_ns'] = key[1]
+                g.attrs['size'] = key[2]
+                g.attrs['flipped'] = calibration['flipped']
+        except OSError:
+            warnings.warn('The calibration cache '+sidecarName+' could not be written')
+
             
     def add_lag_measurement(self,plotOn):
         """
         Compares the peak mean amp of the current measurement with the calibration
         one and deduce a lag which is introduced in the wnAxisCalib to create
-        the correct wnAxis
+        the correct wnAxis.
+        The lag is the maximum of the FFT cross-correlation (misc/lagEstimation.py),
+        searched among -self.lagWindow..self.lagWindow lines if lagWindow is not None.
+        If self.subsampleLag is True, it is refined below one line.
         """
         
-        first_wn = self.data['wnAxisCalib'][0]
-        wn_spacing_calibrated = np.mean(np.gradient(np.squeeze(self.data['wnAxisCalib'])))
-        corr = np.correlate(self.data['peakMeanAmpCalib'],self.data['peakMeanAmp'],'full')        
-        lag = float(np.argmax(corr))-self.config.noLines+1
-        
-        new_wn = np.arange(0,self.config.noLines)*wn_spacing_calibrated
-        new_wn = new_wn + first_wn
-        new_wn = new_wn + lag*wn_spacing_calibrated
-        
-        self.data['wnAxis']=new_wn
+        lag = estimate_lag(self.data['peakMeanAmpCalib'], self.data['peakMeanAmp'], maxLag=self.lagWindow,
+                           subsample=self.subsampleLag)
+        self.data['wnAxis'] = lagged_wn_axis(self.data['wnAxisCalib'], lag, int(np.squeeze(self.config.noLines)))
         
         if plotOn:
             fig,ax = plt.subplots()
@@ -202,15 +331,69 @@ class PostProcessorCalibration(PostProcessorCSVSaver):
         
         
         
-    def manual_calibration(self):
+    def fit_calibration(self, plotOn=False, manual=True):
+        """
+        automatic_calibration, refined with manual_calibration if manual is True.
+        If the automatic calibration fails (e.g. the calibration measurement does
+        not overlap with the reference), a warning is given and the manual
+        calibration starts from the uncalibrated axis. Without manual
+        calibration the error is raised.
+        
+        Input   :   plotOn(bool) boolean to plot or not the fitted calibration measurement
+                    manual(bool) refine the automatic calibration manually
+        """
+        try:
+            self.automatic_calibration(plotOn=plotOn)
+        except ValueError as error:
+            if not manual:
+                raise
+            warnings.warn('The automatic calibration failed ('+str(error)+'), the manual calibration starts from the uncalibrated axis')
+            self.calibrationFit = None
+        if manual:
+            self.manual_calibration(self.calibrationFit)
+        
+    def automatic_calibration(self, plotOn=False, **kwargs):
+        """
+        Fits the wavenumber axis of the calibration measurement to the reference
+        without user interaction (misc/wnCalibration.py): the center, the spacing,
+        the offset and the amplitude of the manual calibration and whether the
+        lines are flipped. The fit and its quality are stored under
+        self.calibrationFit and printed.
+        
+        Input   :   plotOn(bool) boolean to plot or not the fitted calibration measurement
+                    kwargs are passed to fit_wn_calibration, e.g. flipped or centerRange
+        Output  :   fit(CalibrationFit)
+        """
+        transmission = self.complexToReal(self.data['transmissionCalib'])
+        fit = fit_wn_calibration(self.data['wnAxisCalib'], transmission, self.data['wnAxisReference'],
+                                 self.data['transmissionReference'], **kwargs)
+        print(fit.report())
+        
+        self.calibrationFit = fit
+        self.data['wnAxisCalib'] = fit.wnAxis
+        self.flipped = fit.flipped
+        
+        if plotOn:
+            fig,ax = plt.subplots()
+            ax.plot(np.squeeze(self.data['wnAxisReference']), np.squeeze(self.data['transmissionReference']), '#808282', label='Reference')
+            ax.plot(fit.wnAxis, scaled_transmission(transmission, fit.offset, fit.amplitude), '#EE2125', label='Calibration')
+            ax.set_xlabel(r'Wavenumber [$\mathrm{cm}^{-1}$]')
+            ax.set_ylabel('Transmission')
+            ax.legend()
+            ax.set_title('Automatic calibration, r2 = %.4f' % fit.r2)
+        return fit
+        
+    def manual_calibration(self, fit=None):
         """
         Generate a figure where you can slide the measurement so that it fits
         the reference measurement.
         
-        Input   :   plotOn(bool) boolean to plot or not the calibrate measurements
+        Input   :   fit(CalibrationFit) the result of automatic_calibration the
+                    figure starts from. If None, it starts from wnAxisCalib.
         """
         
         wnSpacing = np.mean(np.gradient(np.squeeze(self.data['wnAxisCalib'])))
+        flippedBefore = self.flipped
         
         #Tunable range fixed to +-50wn due to actual performance of the lasers
         minWn = np.mean(self.data['wnAxisCalib'])-50
@@ -218,6 +401,12 @@ class PostProcessorCalibration(PostProcessorCSVSaver):
         
         init_transmission = self.complexToReal(self.data['transmissionCalib'])
         init_wn = self.data['wnAxisCalib']
+        init_center_wn = np.mean(self.data['wnAxisCalib'])
+        init_offset, init_amp = 0., 1.
+        if fit is not None:
+            init_wn, init_center_wn, wnSpacing = fit.wnAxis, fit.center, fit.spacing
+            init_offset, init_amp = fit.offset, fit.amplitude
+            self.flipped = fit.flipped
         
         last_indx = 14
         fig = plt.figure('IRsweep - Manual Calibration',figsize=(12,7))
@@ -238,21 +427,19 @@ class PostProcessorCalibration(PostProcessorCSVSaver):
         ax1.set_xlabel(r'Wavenumber [$\mathrm{cm}^{-1}$]')
         ax1.set_ylabel('Transmission')
         ax1.plot(self.data['wnAxisReference'],self.data['transmissionReference'],'#808282')
-        p, = ax1.plot(init_wn,init_transmission,'#EE2125')
+        p, = ax1.plot(init_wn,scaled_transmission(init_transmission,init_offset,init_amp),'#EE2125')
         ax1.set_ylim([-0.05,1.1])
 
-        init_center_wn=np.mean(self.data['wnAxisCalib'])
-        
         wn_slider = Slider(ax_wnslider,'Fine-tune WN',-0.5,+0.5,valinit=0.,valstep=1E-4,color='#808282')
         spacing_slider = Slider(ax_spaceslider,'Fine-tune Spacing',-0.05,+0.05,valinit=0.,valstep=1E-5,color='#808282')
 
         self.offset_text = init_center_wn
         self.offset_text2 = wnSpacing
 
-        text_box = TextBox(ax_box, 'WN Manual Input',initial=str(np.format_float_positional(np.float(init_center_wn),3)))
+        text_box = TextBox(ax_box, 'WN Manual Input',initial=str(np.format_float_positional(float(init_center_wn),3)))
         text_box2 = TextBox(ax_box2, 'Spacing Manual Input',initial=str(self.offset_text2))
-        offset_slider = Slider(ax_offslider,'Amplitude Offset',-1,1,valinit=0,color='#808282')
-        amp_slider = Slider(ax_ampslider,'Amplitude Scale',0.,4.,valinit=1,color='#808282')
+        offset_slider = Slider(ax_offslider,'Amplitude Offset',-1,1,valinit=init_offset,color='#808282')
+        amp_slider = Slider(ax_ampslider,'Amplitude Scale',0.,4.,valinit=init_amp,color='#808282')
         
         button_reset = Button(ax_button_reset,'Reset',hovercolor='0.975')
         button_save = Button(ax_button_save,'Save axis')
@@ -261,10 +448,10 @@ class PostProcessorCalibration(PostProcessorCSVSaver):
         button_text = Button(ax_button_text,'Apply values',hovercolor='0.975')
 
         def update_it(event=None):  #update textbox
-            self.offset_text=np.float(text_box.text)
+            self.offset_text=float(text_box.text)
             wn_center = copy.copy(self.offset_text)
 
-            self.offset_text2=np.float(text_box2.text)
+            self.offset_text2=float(text_box2.text)
             spacing = self.offset_text2
 
             wn = (np.arange(0,len(init_wn))-np.round(len(init_wn))/2)*spacing+wn_center
@@ -275,13 +462,13 @@ class PostProcessorCalibration(PostProcessorCSVSaver):
     
         def update(val,axis): #update slider
             if axis==0:
-                slider_wn_center = np.float(wn_slider.val)
-                display_wn_center = np.format_float_positional(np.float(self.offset_text+slider_wn_center), 3)
+                slider_wn_center = float(wn_slider.val)
+                display_wn_center = np.format_float_positional(float(self.offset_text+slider_wn_center), 3)
                 text_box.set_val(display_wn_center)
                 wn_center = self.offset_text + slider_wn_center
 
-                slider_spacing = np.float(spacing_slider.val)
-                display_spacing = np.format_float_positional(np.float(self.offset_text2+slider_spacing), 3)
+                slider_spacing = float(spacing_slider.val)
+                display_spacing = np.format_float_positional(float(self.offset_text2+slider_spacing), 3)
                 text_box2.set_val(display_spacing)
                 spacing = self.offset_text2 + slider_spacing
 
@@ -293,8 +480,8 @@ class PostProcessorCalibration(PostProcessorCSVSaver):
 
             elif axis==1:
 
-                slider_yoffset = np.float(offset_slider.val)
-                amp = np.float(amp_slider.val)
+                slider_yoffset = float(offset_slider.val)
+                amp = float(amp_slider.val)
                 diff = init_transmission-np.nanmean(init_transmission)
                 diff = diff*amp
                 transmission = diff+np.nanmean(init_transmission)
@@ -313,8 +500,8 @@ class PostProcessorCalibration(PostProcessorCSVSaver):
             spacing_slider.reset()
             offset_slider.reset()
             amp_slider.reset()
-            text_box.set_val(np.format_float_positional(np.float(init_center_wn),3))
-            text_box2.set_val(np.format_float_positional(np.float(wnSpacing),3))
+            text_box.set_val(np.format_float_positional(float(init_center_wn),3))
+            text_box2.set_val(np.format_float_positional(float(wnSpacing),3))
             update_it()
             
         def flip(val):
@@ -327,10 +514,14 @@ class PostProcessorCalibration(PostProcessorCSVSaver):
             print('Wavenumber axis saved !')
             self.data['wnAxisCalib'] = p.get_xdata()
             self.running = False
+            fig.canvas.stop_event_loop()
             
         def handle_close(event):
-            print('Figure closed without saving wavenumber axis!')
+            if self.running:
+                print('Figure closed without saving wavenumber axis!')
+                self.flipped = flippedBefore
             self.running = False
+            fig.canvas.stop_event_loop()
 
 
         closeid = fig.canvas.mpl_connect('close_event',handle_close)
@@ -340,9 +531,11 @@ class PostProcessorCalibration(PostProcessorCSVSaver):
         button_flip.on_clicked(flip)
         button_text.on_clicked(update_it)
         
+        # wait in the event loop of the figure until the axis is saved or the figure closed
         self.running = True
+        plt.show(block=False)
         while self.running:
-            plt.pause(0.001)
+            fig.canvas.start_event_loop(timeout=0)
             
         fig.canvas.mpl_disconnect(closeid)
         plt.close(fig.number)
@@ -11,7 +11,10 @@ import h5py
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 from heterodyne_postprocessing.configurations.configurationprocessed import ConfigurationProcessed
+from heterodyne_postprocessing.misc.acquisitionIndex import AcquisitionIndex
+from heterodyne_postprocessing.misc.axisIndex import AxisIndex
 from heterodyne_postprocessing.misc.hdf5Class import HDF5Class
+from heterodyne_postprocessing.misc.lazyAcquisitionCube import LazyAcquisitionCube
 
 
 class PostProcessorHDF5Loader:
@@ -29,97 +32,279 @@ class PostProcessorHDF5Loader:
 
         self.hdf5Help = HDF5Class()
 
+        # file opened by load_configuration, kept open by the lazy loading mode
+        self._h5file = None
+        # AcquisitionIndex of the transmission group of _h5file, shared by the loaders
+        self.acqIndex = None
+        # AxisIndex of the axes of self.data, e.g. wnAxis and timeAxis, see axis_index
+        self._axisIndex = {}
+
     def load_configuration(self, filename=None):
+        """
+        Load the configuration of a processed file. The file stays open for the
+        next load_transmission, so that it is opened only once. It is closed by
+        load_transmission, close(), at the end of a with block on the processor
+        or when the processor is deleted.
+        """
+        self.close()
         self.config = ConfigurationProcessed()
-        self.config.load_configuration(filename)
+        self._h5file = self.config.load_configuration(filename, keepOpen=True)
+
+    def load_transmission(self, lazy=False, cacheBytes=128 * 2 ** 20):
+        """
+        Load the transmission of all acquisitions and their metadata.
 
-    def load_transmission(self):
+        Input   :   lazy(bool) if True, proc.data[proc.data_name] is a
+                    LazyAcquisitionCube backed by the file instead of an array
+                    loaded in memory. The file stays open until close() is called
+                    or the next file is loaded.
+                    cacheBytes(int) size of the block cache of the lazy cube in bytes
+        """
         if self.config is None:
             raise RuntimeError('in PostProcessor.load_transmission : config not yet loaded.')
 
-        f = h5py.File(self.config.filename, 'r')
-        transInfoKeys = f['transmission/info'].keys()
-        self.data = {}
-        self.data.update({'wnAxis': f['info/first_wn_axis'][()]})
-
-        if 'peakstd' in transInfoKeys:
-            self.data.update({'stdPeak': f['transmission/info/peakstd'][()]})
+        f = self._open_file()
+        loaded = False
+        try:
+            transInfoKeys = f['transmission/info'].keys()
+            self.data = {}
+            self.data.update({'wnAxis': f['info/first_wn_axis'][()]})
 
-        if self.is_timeresolved():
-            self.data_name = 'transientTrans'
-            first_acq = 'acquisition' + str(self.hdf5Help.get_name_from_index(f['transmission'], 0))
-            self.data.update({'timeAxis': f['transmission/' + first_acq + '/time'][()]})
-        elif self.is_timeintegrated():
-            self.data_name = 'transmission'
+            if 'peakstd' in transInfoKeys:
+                self.data.update({'stdPeak': f['transmission/info/peakstd'][()]})
 
-        self.last_data_type = ''
+            if self.is_timeresolved():
+                self.data_name = 'transientTrans'
+                self.data.update({'timeAxis': self.acquisition_index(f).at(0)['time'][()]})
+            elif self.is_timeintegrated():
+                self.data_name = 'transmission'
+
+            self.last_data_type = ''
+
+            # the acquisitions in the order in which they were acquired
+            acqIndex = self.acquisition_index(f)
+            acq_order = acqIndex.numbers.tolist()
+            self._acq_order = acq_order
+
+            self._initiateArraysInPostProcH5()
+
+            # single traversal of the acquisitions, every dataset is read once straight into its final slice
+            arrays = self._load_acquisitions(f, acqIndex, lazy, cacheBytes)
+
+            time_stamp = np.divide(arrays['timeStamp'], 1e6)  # convert to seconds
+            time_stamp_diff = time_stamp - time_stamp[0]  # shift t = 0 to the first acquisition
+
+            self.data.update({self.data_name: arrays[self.data_name]})
+            self.data.update({'numAcq': len(acq_order)})
+            self.data.update({'timeStamp': time_stamp_diff})
+            self.data.update({'time_UTC': time_stamp})
+
+            if self.is_timeintegrated():
+                try:
+                    offset = self.data['timeStamp'][self.config.pretriggerAcquisitions]
+                except:
+                    offset = 0
+                    print(
+                        'No pretrigger acquisitions or too many pretrigger acquisitions found. The first value of timeAxis may not start at the correct time.')
+                self.data.update({'timeAxis': time_stamp_diff - offset})
+
+            for key in ('normalizationVector', 'stdPeakAcqs', 'driftStd'):
+                if key in arrays:
+                    self.data.update({key: arrays[key]})
+            loaded = True
+        finally:
+            # only a lazy cube needs the file, it is closed otherwise (also on errors)
+            if lazy and loaded:
+                self._h5file = f
+            else:
+                f.close()
+                self._h5file = None
 
-        acq_order = []
+    def acquisition_index(self, f=None):
+        """
+        The AcquisitionIndex of the acquisitions of the transmission group. It
+        is built once per file and cached on the processor, so that the loaders
+        share the sorted acquisition numbers and the opened group handles.
+
+        Input   :   f(h5py.File) the opened processed file, the file of the
+                    configuration if None. That file then stays open until
+                    close() is called (or the with block of the processor ends)
+        Output  :   acqIndex(AcquisitionIndex)
+        """
+        if f is None:
+            f = self._open_file()
+            self._h5file = f
+        group = f['transmission']
+        if self.acqIndex is None or not self.acqIndex.is_valid(group):
+            self.acqIndex = AcquisitionIndex(group, prefix='acquisition')
+        return self.acqIndex
+
+    def axis_index(self, name):
+        """
+        The AxisIndex of the axis self.data[name], e.g. 'wnAxis' or 'timeAxis',
+        for nearest-index and range lookups. It is cached on the processor and
+        built again when the values of the axis change (e.g. after the
+        wavenumber calibration).
 
-        # first define the order in which the acquisitions were acquired
-        for g in f['transmission'].values():
-            if 'acquisition' in g.name:
-                acq_order.append(int(''.join(filter(str.isdigit,
-                                                    g.name))))  # this can break if acquisitions are re-named at some point in the future
-        self._acq_order = acq_order
+        Input   :   name(str) the key of the axis in self.data
+        Output  :   axisIndex(AxisIndex)
+        """
+        axis = self.data[name]
+        index = self._axisIndex.get(name)
+        if index is None or not index.matches(axis):
+            index = self._axisIndex[name] = AxisIndex(axis)
+        return index
 
-        tmp_transmission = [0] * len(acq_order)
-        time_stamp = [0] * len(acq_order)
+    def _open_file(self):
+        """
+        The file of the configuration: the handle of load_configuration (or of
+        a previous lazy load_transmission) if it is still open, otherwise the
+        file is opened again.
+        """
+        f = self._h5file
+        if f is not None and f.id.valid and os.path.abspath(f.filename) == os.path.abspath(self.config.filename):
+            return f
+        self.close()
+        return h5py.File(self.config.filename, 'r')
 
-        self._initiateArraysInPostProcH5()
+    def close(self):
+        """
+        Close the file opened by load_configuration or kept open by a lazy
+        load_transmission. The lazy cube cannot be read anymore afterwards.
+        """
+        if self._h5file is not None:
+            self._h5file.close()
+            self._h5file = None
+        self.acqIndex = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        # a lazy cube may outlive the processor, h5py closes its file with the last dataset reference
+        if isinstance((self.data or {}).get(self.data_name), LazyAcquisitionCube):
+            return
+        try:
+            self.close()
+        except Exception:
+            # the interpreter may be shutting down, h5py is already gone
+            pass
+
+    def _load_acquisitions(self, f, acqIndex, lazy=False, cacheBytes=None):
+        """
+        Reads all the acquisitions of the file in a single pass. The final
+        arrays are allocated once and every dataset is read directly into the
+        slice of its acquisition, so that no intermediate list of arrays and
+        no transposed copy is created. The transmission, the normalization
+        vector, the peak std, the drift std and the time stamps are filled in
+        the same traversal.
+
+        Input   :   f(h5py.File) the opened processed file
+                    acqIndex(AcquisitionIndex) the acquisitions of the file
+                    lazy(bool) if True, the transmission is not read but wrapped
+                    in a LazyAcquisitionCube
+                    cacheBytes(int) size of the block cache of the lazy cube
+        Output  :   arrays(dict) the loaded arrays, with the acquisitions on the
+                    last axis
+        """
+        numAcq = len(acqIndex)
+        first_acq = acqIndex.at(0)
+        first_info_attrs = first_acq['info'].attrs.keys()
 
-        # use the above-found order to loop through and index correctly
-        for i, v, in enumerate(acq_order):
+        # The arrays are allocated acquisition first, so that each acquisition is a contiguous block. The
+        # transposed views have the [..., acquisitions] layout used everywhere else in the processor.
+        if self.is_timeresolved():
+            first_trans = first_acq['amp']
+            trans_shape = first_trans.shape[:2]
+        else:
+            first_trans = first_acq['y']
+            trans_shape = first_trans.shape[:1]
+        if first_trans.ndim == 1:
+            trans_dtype = np.complex128
+        else:
+            trans_dtype = np.result_type(first_trans.dtype, np.complex64)
+        if lazy:
+            trans_datasets = [None] * numAcq
+        else:
+            transmission = np.zeros((numAcq,) + trans_shape, dtype=trans_dtype)
+            transmission_planes = self._complex_planes(transmission)
+
+        load_normalization = (self.config.version >= (4, 1, 0) and self.is_timeresolved()) or (
+                self.config.version >= (5, 0, 0))
+        if load_normalization:
+            first_norm = first_acq['NormalizationVector']
+            normalization = np.zeros((numAcq, first_norm.shape[0]),
+                                     dtype=np.result_type(first_norm.dtype, np.complex64))
+            normalization_planes = self._complex_planes(normalization)
+
+        load_peakStd = 'peakstd' in first_acq.keys()
+        if load_peakStd:
+            stdPeak = np.zeros((numAcq,) + first_acq['peakstd'].shape, dtype=first_acq['peakstd'].dtype)
+
+        load_driftStd = 'driftStd' in first_info_attrs
+        driftStd = [0] * numAcq
+        time_stamp = [0] * numAcq
+
+        for i, (v, acq) in enumerate(acqIndex):
+            acq_info_attrs = acq['info'].attrs
             if i == 0:
-                self.data.update({'peakMeanAmp': f['transmission/acquisition' + str(v)]['peakmeanamp'][()]})
+                self.data.update({'peakMeanAmp': acq['peakmeanamp'][()]})
 
             self._fillArraysInPostProcH5(f, v)
-            if self.is_timeresolved():
-                tmp_transmission[v] = (f['transmission/acquisition' + str(v)]['amp'][()][:, :, 0] +
-                                       f['transmission/acquisition' + str(v)]['amp'][()][:, :, 1] * 1j)
+            if lazy:
+                trans_datasets[i] = acq['amp'] if self.is_timeresolved() else acq['y']
+
+            elif self.is_timeresolved():
+                acq['amp'].read_direct(transmission_planes, dest_sel=np.s_[i])
 
             elif self.is_timeintegrated():
-                transmission = f['transmission/acquisition' + str(v)]['y'][()]
+                dset = acq['y']
                 # old python processor saves transmission as a complex array,
                 # old server processor saves transmission as real array but
                 # both have dimension 1
-                if transmission.ndim == 1:
-                    tmp_transmission[v] = transmission.astype(np.complex128)
+                if dset.ndim == 1:
+                    transmission[i] = dset[()]
                 # new python and new server processor save transmission as a 3D matrix
                 # containing real and imaginary part separetely
-                elif transmission.ndim == 3:
-                    tmp_transmission[v] = (transmission[:, 0, 0] + transmission[:, 0, 1] * 1j)
-
-            try:
-                f['transmission/acquisition' + str(v)]['info'].attrs['TimeStamp']
-            except:  # maybe an exception is not the best solution here; consider hasattr if revised
-                pass
-            else:
-                time_stamp[v] = (f['transmission/acquisition' + str(v)]['info'].attrs['TimeStamp'][0])
-
-        time_stamp = np.divide(time_stamp, 1e6)  # convert to seconds
-        time_stamp_diff = np.array([v - time_stamp[0] for v in time_stamp])  # shift t = 0 to the first acquisition
-        tmp_transmission = np.transpose(tmp_transmission)
-
-        self.data.update({self.data_name: tmp_transmission})
-        self.data.update({'numAcq': len(acq_order)})
-        self.data.update({'timeStamp': time_stamp_diff})
-        self.data.update({'time_UTC': time_stamp})
-
-        if self.is_timeintegrated():
-            try:
-                offset = self.data['timeStamp'][self.config.pretriggerAcquisitions]
-            except:
-                offset = 0
-                print(
-                    'No pretrigger acquisitions or too many pretrigger acquisitions found. The first value of timeAxis may not start at the correct time.')
-            self.data.update({'timeAxis': time_stamp_diff - offset})
-
-        self.load_normalization(f, acq_order)
-        self.load_peakStd(f, acq_order)
-        self.load_driftStd(f, acq_order)
-
-        f.close()
+                elif dset.ndim == 3:
+                    dset.read_direct(transmission_planes, source_sel=np.s_[:, 0, :], dest_sel=np.s_[i])
+
+            if load_normalization:
+                acq['NormalizationVector'].read_direct(normalization_planes, source_sel=np.s_[:, 0, :],
+                                                       dest_sel=np.s_[i])
+            if load_peakStd:
+                acq['peakstd'].read_direct(stdPeak, dest_sel=np.s_[i])
+            if load_driftStd:
+                driftStd[i] = acq_info_attrs['driftStd']
+
+            if 'TimeStamp' in acq_info_attrs:
+                time_stamp[i] = acq_info_attrs['TimeStamp'][0]
+
+        if lazy:
+            transmission = LazyAcquisitionCube(trans_datasets, self.is_timeresolved(), cacheBytes)
+        else:
+            transmission = transmission.T
+        arrays = {self.data_name: transmission, 'timeStamp': np.array(time_stamp)}
+        if load_normalization:
+            arrays['normalizationVector'] = normalization.T
+        if load_peakStd:
+            arrays['stdPeakAcqs'] = stdPeak.T
+        if load_driftStd:
+            arrays['driftStd'] = np.array(driftStd)
+
+        return arrays
+
+    @staticmethod
+    def _complex_planes(array):
+        """
+        Returns a real view of a complex array with an additional last axis of
+        size 2 holding the real and imaginary parts, i.e. the layout in which
+        they are saved in the processed files.
+        """
+        return array.view(array.real.dtype).reshape(array.shape + (2,))
 
     def _initiateArraysInPostProcH5(self):
         pass
@@ -127,47 +312,6 @@ class PostProcessorHDF5Loader:
     def _fillArraysInPostProcH5(self, f, v):
         pass
 
-    def load_normalization(self, f, acq_order):
-        '''
-        Method to load the normalization vector of time resolved data.
-        '''
-
-        if (self.config.version >= (4, 1, 0) and self.is_timeresolved()) or (self.config.version >= (5, 0, 0)):
-            tmp_normalization = [0] * len(acq_order)
-            for i, v, in enumerate(acq_order):
-                tmp_normalization[v] = f['transmission/acquisition' + str(v)]['NormalizationVector'][()][:, 0, 0] + \
-                                       f['transmission/acquisition' + str(v)]['NormalizationVector'][()][:, 0, 1] * 1j
-
-            tmp_normalization = np.array(tmp_normalization)
-            tmp_normalization = np.transpose(tmp_normalization)
-            self.data.update({'normalizationVector': tmp_normalization})
-
-    def load_peakStd(self, f, acq_order):
-        '''
-        Method to load the stdPeak vector of long term and stepsweep data.
-        '''
-
-        if 'peakstd' in f['transmission/acquisition0'].keys():
-            tmp_stdPeak = [0] * len(acq_order)
-            for i, v, in enumerate(acq_order):
-                tmp_stdPeak[v] = f['transmission/acquisition' + str(v)]['peakstd'][()]
-
-            tmp_stdPeak = np.array(tmp_stdPeak).T
-            self.data.update({'stdPeakAcqs': tmp_stdPeak})
-
-    def load_driftStd(self, f, acq_order):
-        '''
-        Method to load the driftStd vector of long term and stepsweep data.
-        '''
-
-        if 'driftStd' in f['transmission/acquisition0/info'].attrs.keys():
-            tmp_driftStd = [0] * len(acq_order)
-            for i, v, in enumerate(acq_order):
-                tmp_driftStd[v] = (f['transmission/acquisition' + str(v)]['info'].attrs['driftStd'])
-
-            tmp_driftStd = np.array(tmp_driftStd)
-            self.data.update({'driftStd': tmp_driftStd})
-
     def data_type(self):
         if self.data is not None:
             return self.data.keys()
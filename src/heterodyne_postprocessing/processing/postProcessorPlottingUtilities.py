@@ -13,6 +13,7 @@ import matplotlib.colors as colors
 import matplotlib.cm as cmx
 from matplotlib.colors import LinearSegmentedColormap 
 from heterodyne_postprocessing.processing.postProcessorPlotTransients import PostProcessorPlotTransient
+from heterodyne_postprocessing.misc.axisIndex import AxisIndex
 
 
 class PostProcessorPlottingUtilities(PostProcessorPlotTransient):
@@ -118,7 +119,14 @@ class PostProcessorPlottingUtilities(PostProcessorPlotTransient):
         
         """
 
-        indecies = [list(axis).index(min(axis, key=lambda x:abs(x-v))) for i, v in enumerate(entries)]
+        # the cached index of the wnAxis or timeAxis of the processor, otherwise an index of the given axis
+        for name in ('wnAxis', 'timeAxis'):
+            if self.data is not None and self.data.get(name) is axis:
+                axisIndex = self.axis_index(name)
+                break
+        else:
+            axisIndex = AxisIndex(axis)
+        indecies = axisIndex.nearest(np.asarray(entries, dtype=float)).tolist()
         
         return indecies
 
@@ -416,8 +424,10 @@ class PostProcessorPlottingUtilities(PostProcessorPlotTransient):
         # apply offset to time axis and ensure that it can be done repeatedly
         self.time_axis_offset = np.array(np.subtract(self.data['timeAxis'], offset)) 
         
-        # generate transient data
-        transient = [self.getTransientWithLinTime(v,v,averaging=1,interleave=TimeMovingAverage,plotOn=False)[0] for v in centerWn]
+        # generate transient data: all the wavenumbers in one sweep of the cube, then rebinned together as
+        # getTransientWithLinTime(v,v,averaging=1,interleave=TimeMovingAverage) would for each of them
+        transient = self.getTransientsInWnRanges(centerWn)
+        transient = self.getCubeWithLinTime(1,TimeMovingAverage,cube=transient.T)[0].T
         
         # get output in correct type
         transient = self.getOutputInType(transient, plot_type) 
@@ -8,13 +8,19 @@ import os,sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
 from heterodyne_postprocessing.processing.postProcessorCalibration import PostProcessorCalibration
+from heterodyne_postprocessing.misc.timeRebinning import lin_time_bins, log_time_bins, rebin
+from heterodyne_postprocessing.misc.timeWindowIndex import TimeWindowIndex
 
 import matplotlib.pyplot as plt
 import numpy as np
+import scipy.sparse
 
 class PostProcessorTimeResolved(PostProcessorCalibration):
     def __init__(self):
         super().__init__()
+        #if True, getComplexSpectrum and getSpectrumStd are answered from prefix sums over the time axis, see time_window_index
+        self.timeWindowIndex = False
+        self._timeWindowIndex = None
     
     
     def getTransientInWnRange(self,minWn,maxWn,plotOn=False):
@@ -33,14 +39,9 @@ class PostProcessorTimeResolved(PostProcessorCalibration):
             raise RuntimeError('in PostProcessorTimeResolved.getTransientInWnRange : not available for non time-resolved measurements')
         
         
-        min_indx = np.argmin(np.abs(self.data['wnAxis']-minWn))
-        max_indx = np.argmin(np.abs(self.data['wnAxis']-maxWn))
-#        If the wnAxis was reversed, min_indx>max_indx so we exchange them !
-        if min_indx >max_indx:
-            (min_indx,max_indx)=(max_indx,min_indx)
-            
-        # Add 1 to the max index to make sure we take the last point corresponding to maxWn or minWn
-        max_indx+=1
+        # nearest lines of minWn and maxWn, exchanged if the wnAxis was reversed. The max index is one past
+        # the last line to make sure we take the last point corresponding to maxWn or minWn
+        min_indx,max_indx = self.axis_index('wnAxis').range(minWn,maxWn)
         weight = self.weights(min_indx,max_indx)
         
         transient = self.complexToReal(np.mean(self.data[self.data_name+self.last_data_type][:,min_indx:max_indx]*weight*(max_indx-min_indx),axis=-1))
@@ -54,6 +55,52 @@ class PostProcessorTimeResolved(PostProcessorCalibration):
         
         return transient
     
+    def getTransientsInWnRanges(self,wnRanges=None,plotOn=False):
+        """
+        Function that gives you the transients of many wavenumber ranges at
+        once, each one being the weighted average of the transients in its
+        range as in getTransientInWnRange. The weights of all the ranges are
+        gathered in one sparse [lines, ranges] matrix, so that the cube is
+        swept a single time whatever the number of ranges.
+        
+        Input   :   wnRanges(list) the ranges as (minWn, maxWn) pairs in [cm-1],
+                    or single wavenumbers for the transient of the nearest line.
+                    If None, the transient of every line is returned.
+                    plotOn(bool) optional param for plotting
+                    
+        Output  :   transients(ndarray) [ranges, time] one transient per range
+        """
+        if not self.is_timeresolved():
+            raise RuntimeError('in PostProcessorTimeResolved.getTransientsInWnRanges : not available for non time-resolved measurements')
+        
+        wnAxis = np.ravel(self.data['wnAxis'])
+        if wnRanges is None:
+            wnRanges = wnAxis
+        bounds = np.asarray(wnRanges, dtype=float)
+        if bounds.ndim == 1:
+            bounds = np.repeat(bounds[:,np.newaxis],2,axis=1)
+        
+        # the lines of each range, as in getTransientInWnRange
+        starts,stops = self.axis_index('wnAxis').range(bounds[:,0],bounds[:,1])
+        
+        rows,cols,values = [np.zeros(0,dtype=int)],[np.zeros(0,dtype=int)],[np.zeros(0)]
+        for i,(min_indx,max_indx) in enumerate(zip(starts,stops)):
+            rows.append(np.arange(min_indx,max_indx))
+            cols.append(np.full(max_indx-min_indx,i))
+            values.append(np.broadcast_to(self.weights(min_indx,max_indx),max_indx-min_indx))
+        weight = scipy.sparse.csr_matrix((np.concatenate(values),(np.concatenate(cols),np.concatenate(rows))),
+                                         shape=(len(bounds),len(wnAxis)))
+        
+        transients = self.complexToReal(weight @ np.asarray(self.data[self.data_name+self.last_data_type]).T)
+        
+        if plotOn:
+            plt.figure()
+            plt.plot(self.data['timeAxis'],transients.T)
+            plt.xlabel('time [s]')
+            plt.ylabel('transmission')
+        
+        return transients
+    
     def getTransientWithLinTime(self,minWn,maxWn,averaging,interleave,plotOn=False):
         """
         Function that gives you the transient corresponding to the average
@@ -73,22 +120,7 @@ class PostProcessorTimeResolved(PostProcessorCalibration):
             raise RuntimeError('in PostProcessorTimeResolved.getTransientWithLinTime : not available for non time-resolved measurements')
               
         transient = self.getTransientInWnRange(minWn,maxWn)
-        time = np.copy(self.data['timeAxis'])
-        start_time = np.min(time)
-        
-        averaging = int(averaging)
-        
-        
-        deltatime = np.abs(np.mean(np.gradient(self.data['timeAxis'])))*averaging
-        noSteps = int(np.floor(len(time)/averaging))
-        
-        lintime = np.zeros(noSteps)
-        lintrans = np.zeros(noSteps)
-        for i in np.arange(0,noSteps):
-            start = np.argmin(np.abs(time-(start_time+i*deltatime-deltatime*(interleave-1))))
-            stop = np.argmin(np.abs(time-(time[start+(averaging-1)]+2*deltatime*(interleave-1))))
-            lintime[i] = np.mean(time[start:stop+1])
-            lintrans[i] = np.mean(transient[start:stop+1])
+        lintrans,lintime = self.getCubeWithLinTime(averaging,interleave,cube=transient)
         
         
         if plotOn:
@@ -122,31 +154,7 @@ class PostProcessorTimeResolved(PostProcessorCalibration):
         
         
         transient = self.getTransientInWnRange(minWn,maxWn)
-        time = np.copy(self.data['timeAxis'])
-        
-        
-        #Make sure the time axis is increasing
-        indx = np.argsort(time)
-        time = time[indx]
-        transient=transient[indx]
-        
-        #Make sure we only take the postTrigger samples and times
-        transient = transient[time>0]
-        time = time[time>0]
-        
-        logtime = np.logspace(np.log10(time[0]),np.log10(time[-1]),noSteps)
-        logtrans = np.zeros(logtime.shape)
-        
-        noSteps = int(noSteps)
-        start=0
-        for i in np.arange(0,noSteps):
-            stop = np.argmin(np.abs(time-logtime[i]*interleave))
-            logtrans[i]=np.mean(transient[start:stop+1])
-            logtime[i]=np.sqrt(time[start]*time[stop])
-            start = np.argmin(np.abs(time-logtime[i]))
-            
-#        logtime = logtime[logtrans != np.nan]
-#        logtrans = logtrans[logtrans != np.nan]
+        logtrans,logtime = self.getCubeWithLogTime(noSteps,interleave,cube=transient)
         
         
         if plotOn:
@@ -157,6 +165,64 @@ class PostProcessorTimeResolved(PostProcessorCalibration):
             
         return logtrans,logtime
     
+    def getCubeWithLinTime(self,averaging,interleave,cube=None):
+        """
+        Rebin the whole [time, lines] cube on the linear time axis of
+        getTransientWithLinTime. The bins are computed once and every line is
+        averaged from a single cumulative sum, so that the cube gives the
+        transients of all the lines at once. Empty bins are NaN.
+        
+        Input   :   averaging how many points to use for averaging
+                    interleave(int) the amount of overlap. e.g. 2 means each
+                    point is used in two averaged values.
+                    cube(ndarray) [time, ...] the data to rebin, by default
+                    the real transmission of the last data type, e.g.
+                    transientTransSpectralAvgOfFiles
+                    
+        Output  :   lincube(ndarray) [bins, ...] the rebinned cube
+                    lintime(ndarray) [bins] the time of each bin
+        """
+        if not self.is_timeresolved():
+            raise RuntimeError('in PostProcessorTimeResolved.getCubeWithLinTime : not available for non time-resolved measurements')
+        
+        if cube is None:
+            cube = self.complexToReal(self.data[self.data_name+self.last_data_type])
+        time = self.data['timeAxis']
+        
+        starts,stops = lin_time_bins(time,averaging,interleave)
+        return rebin(cube,starts,stops),rebin(time,starts,stops)
+    
+    def getCubeWithLogTime(self,noSteps,interleave,cube=None):
+        """
+        Rebin the whole [time, lines] cube on the logarithmic time axis of
+        getTransientWithLogTime (post trigger times only). The bins are
+        computed once and every line is averaged from a single cumulative sum.
+        Empty bins are NaN.
+        
+        Input   :   noSteps(int) the number of log steps
+                    interleave(int) the amount of overlap. e.g. 2 means each
+                    point is used in two averaged log value.
+                    cube(ndarray) [time, ...] the data to rebin, by default
+                    the real transmission of the last data type
+                    
+        Output  :   logcube(ndarray) [noSteps, ...] the rebinned cube
+                    logtime(ndarray) [noSteps] the time of each bin
+        """
+        if not self.is_timeresolved():
+            raise RuntimeError('in PostProcessorTimeResolved.getCubeWithLogTime : not available for non time-resolved measurements')
+        
+        if cube is None:
+            cube = self.complexToReal(self.data[self.data_name+self.last_data_type])
+        time = self.data['timeAxis']
+        
+        #Make sure the time axis is increasing and we only take the postTrigger samples and times
+        indx = np.argsort(time)
+        indx = indx[time[indx]>0]
+        time = time[indx]
+        
+        starts,stops,logtime = log_time_bins(time,noSteps,interleave)
+        return rebin(np.asarray(cube)[indx],starts,stops),logtime
+    
     def getStartStop(self,startTime,stopTime):
         """
         This method get the start and stop index from the start and stop time
@@ -174,16 +240,9 @@ class PostProcessorTimeResolved(PostProcessorCalibration):
         if not self.is_timeresolved():
             raise RuntimeError('in PostProcessorTimeResolved.getSpectrumWithNoiseThreshold : not available for non time-resolved measurements')
         
-        start = np.argmin(np.abs(self.data['timeAxis']-startTime))
-        stop = np.argmin(np.abs(self.data['timeAxis']-stopTime))
-    
-        
-        #Inver the start - stop if necessary because the axis might have be flipped
-        if start > stop:
-            (start,stop)=(stop,start)      
-            
-        #Add 1 to stop to make sure we take all the time steps
-        stop+=1
+        #The start - stop are inverted if necessary because the axis might have be flipped, and 1 is added to stop
+        #to make sure we take all the time steps
+        start,stop = self.axis_index('timeAxis').range(startTime,stopTime)
 
         return start, stop
 
@@ -199,6 +258,9 @@ class PostProcessorTimeResolved(PostProcessorCalibration):
         """
         start,stop=self.getStartStop(startTime=startTime,stopTime=stopTime)
         
+        if self.timeWindowIndex:
+            return self.time_window_index().mean(start,stop)
+        
         complexTransmission = np.mean(self.data[self.data_name+self.last_data_type][start:stop,:],axis=0)
         
         return complexTransmission
@@ -216,11 +278,37 @@ class PostProcessorTimeResolved(PostProcessorCalibration):
         """
         start,stop=self.getStartStop(startTime=startTime,stopTime=stopTime) 
         
+        if self.timeWindowIndex:
+            return self.time_window_index().std(start,stop)/np.sqrt(stop-start)
+        
         std = np.std(self.complexToReal(self.data[self.data_name+self.last_data_type][start:stop,:]),axis=0)/np.sqrt(stop-start)
         
         return std
 
     
+    def time_window_index(self):
+        """
+        The TimeWindowIndex of the current [time, lines] data
+        (proc.data_name+proc.last_data_type). It is built on the first call and
+        kept until the last data type changes or the content of the array
+        differs, also after writing into it (e.g. unnormalizer with
+        inplace=True). The real transmission follows
+        ASC_phase_drift_correction.
+        
+        Set proc.timeWindowIndex = True to answer getComplexSpectrum and
+        getSpectrumStd (and thus plotSpectra and plot_TR) from it: each window
+        costs O(lines) plus a comparison of the array with the copy of the
+        index, instead of a mean (and a conversion to the real transmission)
+        over all its time slices.
+        
+        Output  :   index(TimeWindowIndex)
+        """
+        cube = self.data[self.data_name+self.last_data_type]
+        key = (self.data_name+self.last_data_type, self.ASC_phase_drift_correction)
+        if self._timeWindowIndex is None or self._timeWindowIndex[0] != key or not self._timeWindowIndex[1].matches(cube):
+            self._timeWindowIndex = (key, TimeWindowIndex(cube, self.complexToReal(cube)))
+        return self._timeWindowIndex[1]
+    
     def getSpectrumWithNoiseThreshold(self,startTime,stopTime,threshold,plotOn=False):
         """
         Function that gives you the spectrum corresponding to the average of 
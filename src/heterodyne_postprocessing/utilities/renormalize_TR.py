@@ -15,6 +15,7 @@ MIT license
 import numpy as np
 from itertools import islice
 from heterodyne_postprocessing.processing.postProcessor import PostProcessor
+from heterodyne_postprocessing.utilities.unnormalize import unnormalizer
 
 
 #############################
@@ -75,17 +76,8 @@ def find_overlap(wn_axis_a, wn_axis_bg):
 proc_a = make_proc(measurement_a, calibration_a)
 proc_bg = make_proc(measurement_bg, calibration_bg)
 
-# unnormalize the measurement of interest
-# initialize the list to store the unnormalized data
-unnormalized_a = []
-
-# iterate through all acquisitions and multiply each time slice by the normalization vector
-for i in range(proc_a.data['transientTrans'].shape[-1]):
-    ratio = [np.multiply(v,proc_a.data['normalizationVector'][...,i]) for v in proc_a.data['transientTrans'][...,i]] 
-    unnormalized_a.append(np.array(ratio))
-
-# restore original format
-unnormalized_a = np.moveaxis(np.array(unnormalized_a), [0,1,2],[2,0,1])
+# unnormalize the measurement of interest: every time slice is multiplied by the normalization vector
+unnormalized_a = unnormalizer(proc_a)
 
 # calculate the spectral overlap of the two measurements 
 overlap_a, overlap_bg = find_overlap(proc_a.data['wnAxis'], proc_bg.data['wnAxis'])
@@ -96,17 +88,8 @@ unnormalized_a = unnormalized_a[:,overlap_a[0]:overlap_a[-1],:]
 # cut new normalization vector to overlapping regions
 new_bg = proc_bg.data['normalizationVector'][overlap_bg[0]:overlap_bg[-1],:]
 
-# apply the new normalization vector to the measurement
-# initialize the list to store the renormalized data
-renormalized = []
-
-# iterate through all acquisitions and multiply each time slice by the normalization vector
-for i in range(unnormalized_a.shape[-1]):
-    ratio = [np.divide(v,new_bg[...,i]) for v in unnormalized_a[...,i]] 
-    renormalized.append(np.array(ratio))
-
-# reshape to match the original
-renormalized = np.moveaxis(np.array(renormalized), [0,1,2],[2,0,1])
+# apply the new normalization vector to the measurement, in place since unnormalized_a is not used afterwards
+renormalized = np.divide(unnormalized_a, new_bg[np.newaxis], out=unnormalized_a)
 
 # overwrite the old transientTrans and wnAxis arrays; 
 if overwrite_tT == True:
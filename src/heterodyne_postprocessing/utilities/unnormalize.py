@@ -12,26 +12,65 @@ MIT license
 #
 # use example:
 # unnorm_trans = unnormalizer(proc)
+# unnorm_trans = unnormalizer(proc, inplace=True)      # overwrites proc.data['transientTrans'], no copy
+# for first, chunk in iter_unnormalized(proc, 16):    # 16 acquisitions at a time, e.g. for lazily loaded files
+#     ...
 #############################
 
 import numpy as np
 
-def unnormalizer(proc):
-    
+
+def _normalization(proc):
+    """
+    The transmission of proc and its normalization vector, with an added time axis in the time resolved case so
+    that it broadcasts against the transmission.
+    """
     # check if this is a time resolved or long term measurement and process accordingly
     if proc.is_timeresolved() == True: #for time resolved
-        #initialize the list to store the unnormalized data
-        unnormalized = []
-    
-        # iterate through all acquisitions and multiply each time slice by the normalization vector
-        for i in range(proc.data['transientTrans'].shape[-1]):
-            ratio = [np.multiply(v,proc.data['normalizationVector'][...,i]) for v in proc.data['transientTrans'][...,i]] 
-            unnormalized.append(np.array(ratio))
-        
-        unnormalized = np.moveaxis(np.array(unnormalized), [0,1,2],[2,0,1])
-
-    elif proc.is_timeresolved() == False: #for long term
-        unnormalized = [proc.data['transmission'][...,i]*proc.data['normalizationVector'][...,i] for i in range(proc.data['transmission'].shape[-1])]
-        unnormalized = np.moveaxis(np.array(unnormalized), [0,1], [1,0])
+        return proc.data['transientTrans'], proc.data['normalizationVector'][np.newaxis]
+    else: #for long term
+        return proc.data['transmission'], proc.data['normalizationVector']
+
+
+def iter_unnormalized(proc, batchSize=16):
+    """
+    Yield (index of the first acquisition, unnormalized chunk) for batchSize acquisitions at a time. Only one chunk
+    is held in memory, which also works on a transmission loaded with load_transmission(lazy=True).
+    """
+    transmission, normalization = _normalization(proc)
+    for first, batch in proc._iter_acquisition_batches(transmission, 0, transmission.shape[-1], batchSize):
+        yield first, np.multiply(batch, normalization[..., first:first+batch.shape[-1]])
+
+
+def unnormalizer(proc, inplace=False, batchSize=None):
+    """
+    Multiply every time slice of every acquisition by the normalization vector of the acquisition, as a single
+    broadcast product.
+
+    Input   :   proc(PostProcessor) a processor with a loaded transmission
+                inplace(bool) if True, the transmission of proc is overwritten by the result instead of allocating
+                a new cube
+                batchSize(int) if given, the product is computed batchSize acquisitions at a time (always the case
+                for a lazily loaded transmission)
+    Output  :   unnormalized(ndarray) the unnormalized transmission, [time, lines, acquisitions] (time resolved)
+                or [lines, acquisitions] (long term)
+    """
+    transmission, normalization = _normalization(proc)
+    if inplace:
+        if not isinstance(transmission, np.ndarray):
+            raise ValueError('in unnormalizer : a lazily loaded transmission cannot be unnormalized in place.')
+        unnormalized = transmission
+    elif isinstance(transmission, np.ndarray):
+        # same memory layout as the transmission, the acquisitions stay contiguous blocks
+        unnormalized = np.empty_like(transmission, dtype=np.result_type(transmission.dtype, normalization.dtype))
+    else:
+        unnormalized = np.empty(transmission.shape, dtype=np.result_type(transmission.dtype, normalization.dtype))
+
+    if batchSize is None and isinstance(transmission, np.ndarray):
+        np.multiply(transmission, normalization, out=unnormalized)
+    else:
+        for first, batch in proc._iter_acquisition_batches(transmission, 0, transmission.shape[-1], batchSize or 16):
+            last = first+batch.shape[-1]
+            np.multiply(batch, normalization[..., first:last], out=unnormalized[..., first:last])
 
     return unnormalized
@@ -1,6 +1,8 @@
 import json
+import os
 import pickle
 
+from collections import OrderedDict
 from os import path
 
 import h5py
@@ -31,7 +33,28 @@ class HDF5Reader(FileFormat):
     SUPPORT_COMPRESSED = False
     SUPPORT_SPARSE_DATA = False
 
-    def read(self):
+    # Writer options, see write_file
+    COMPRESSION = None
+    COMPRESSION_OPTS = None
+    CHUNK_BYTES = 2**20
+    # 'columns' (one dataset per meta column, the layout of Orange) or
+    # 'blocks' (the columnar layout of write_file, which Orange can not read)
+    METAS_LAYOUT = 'columns'
+
+    def read(self, rows=None, columns=None, lazy=False):
+        """
+        Read the table. rows (a slice or indices) selects the rows to read
+        and columns (a slice or indices) the attributes, only the selected
+        part of the datasets is read from the file.
+
+        With lazy=True, contiguous uncompressed X and Y (the default of
+        write_file) are memory mapped: nothing is read before it is accessed
+        and the memory used is managed by the operating system. Like other
+        views, the arrays can only be modified after Table.copy(), and are
+        never written back to the file. Chunked or compressed datasets are
+        read normally.
+        """
+
         def read_domain(sub):
             d = f['domain']
             subdomain = d[sub].asstr() if sub in d else []
@@ -60,11 +83,19 @@ class HDF5Reader(FileFormat):
             new_var.attributes = args.get("attributes", {})
             return new_var
 
-        def read_hdf5(name, as_str=False):
+        def read_hdf5(name, as_str=False, cols=None):
             if name in f:
-                if as_str:
-                    return f[name].asstr()[:]
-                return f[name]
+                dset = f[name]
+                if lazy and not as_str:
+                    mapped = self._memmap(dset)
+                    if mapped is not None:
+                        mapped = mapped[slice(None) if rows is None else rows]
+                        if cols is not None:
+                            mapped = mapped[:, cols]
+                        return mapped
+                return self._read_selection(
+                    dset.asstr() if as_str else dset, rows, cols
+                )
             return None
 
         with h5py.File(self.filename, "r") as f:
@@ -73,17 +104,31 @@ class HDF5Reader(FileFormat):
             except KeyError:
                 assert 'domain' in f
 
-            domain = Domain(
-                *[
-                    [make_var(*args) for args in read_domain(subdomain)]
-                    for subdomain in ['attributes', 'class_vars', 'metas']
+            attributes, class_vars, metas = [
+                [make_var(*args) for args in read_domain(subdomain)]
+                for subdomain in ['attributes', 'class_vars', 'metas']
+            ]
+            if columns is not None:
+                attributes = [
+                    attributes[i] for i in np.arange(len(attributes))[columns]
                 ]
-            )
+            domain = Domain(attributes, class_vars, metas)
 
-            X = read_hdf5("X")  # noqa N806
+            X = read_hdf5("X", cols=columns)  # noqa N806
             Y = read_hdf5("Y")  # noqa N806
 
-            if len(domain.metas) > 1:
+            if f.attrs.get('metas_layout') == 'blocks' or 'metas/numeric' in f:
+                # columnar layout, see write_file
+                metas = np.empty((len(X), len(domain.metas)), dtype=object)
+                if 'metas/numeric' in f:
+                    meta_columns = f['metas/numeric'].attrs['columns']
+                    metas[:, meta_columns] = read_hdf5('metas/numeric')
+                if 'metas/string' in f:
+                    # decode each distinct string once, then index them
+                    values = f['metas/string_values'].asstr()[()]
+                    meta_columns = f['metas/string'].attrs['columns']
+                    metas[:, meta_columns] = values[read_hdf5('metas/string')]
+            elif len(domain.metas) > 1:
                 metas = np.hstack(
                     [
                         read_hdf5(f'metas/{i}', isinstance(attr, StringVariable))
@@ -103,8 +148,91 @@ class HDF5Reader(FileFormat):
         self.set_table_metadata(self.filename, table)
         return table
 
+    @staticmethod
+    def _read_selection(dset, rows=None, columns=None):
+        """
+        Read dset[rows, columns] for a 1-D or 2-D dataset, where rows and
+        columns are slices or indices. h5py only accepts one list of
+        increasing indices per read, so rows are read through their sorted
+        unique indices and columns through their bounding slice, the rest of
+        the indexing is done in memory.
+        """
+        key = []
+        post = []
+        for axis, sel in enumerate((rows, columns)[: len(dset.shape)]):
+            if isinstance(sel, slice) and (sel.step or 1) < 0:
+                sel = np.arange(dset.shape[axis])[sel]
+            if sel is None or isinstance(sel, slice):
+                key.append(slice(None) if sel is None else sel)
+                post.append(None)
+                continue
+            sel = np.arange(dset.shape[axis])[sel]
+            if sel.size == 0:
+                key.append(slice(0, 0))
+                post.append(None)
+            elif axis == 0:
+                unique, inverse = np.unique(sel, return_inverse=True)
+                key.append(unique)
+                post.append(inverse)
+            else:
+                key.append(slice(sel.min(), sel.max() + 1))
+                post.append(sel - sel.min())
+        data = dset[tuple(key)]
+        for axis, index in enumerate(post):
+            if index is not None:
+                data = np.take(data, index, axis=axis)
+        return data
+
+    @staticmethod
+    def _memmap(dset):
+        """
+        Memory map a contiguous, uncompressed numeric dataset, None if the
+        dataset can not be mapped.
+        """
+        offset = dset.id.get_offset()
+        if (
+            dset.chunks is not None
+            or offset is None
+            or dset.dtype.kind not in 'biuf'
+            or dset.size == 0
+        ):
+            return None
+        return np.memmap(
+            dset.file.filename,
+            dtype=dset.dtype,
+            mode='c',
+            offset=offset,
+            shape=dset.shape,
+        )
+
     @classmethod
-    def write_file(cls, filename, data):
+    def write_file(
+        cls,
+        filename,
+        data,
+        compression=None,
+        compression_opts=None,
+        chunk_rows=None,
+        metas_layout=None,
+    ):
+        """
+        Write data to filename. By default X and Y are written as contiguous
+        datasets. With compression ('gzip' or 'lzf') or chunk_rows, they are
+        stored in chunks of whole rows (see chunk_shape) and written one
+        chunk at a time. The table metadata is written in the same file
+        handle.
+
+        The metas are written in the layout of Orange by default, one
+        dataset metas/i per column (float32 or strings). With
+        metas_layout='blocks' (or METAS_LAYOUT), the file is marked with the
+        attribute metas_layout and numeric metas are stored in a single 2-D
+        float64 dataset metas/numeric. String metas are stored as the
+        distinct strings, metas/string_values, and a 2-D dataset of indices
+        into them, metas/string. The attribute 'columns' of metas/numeric
+        and metas/string holds the indices of their columns in domain.metas.
+        Such files can only be read by this reader.
+        """
+
         def parse(attr):
             params = (attr.name, attr.TYPE_HEADERS[1], {"attributes": attr.attributes})
             if isinstance(attr, DiscreteVariable):
@@ -115,6 +243,32 @@ class HDF5Reader(FileFormat):
                 params[2].update(number_of_decimals=attr.number_of_decimals)
             return params
 
+        if compression is None:
+            compression = cls.COMPRESSION
+            compression_opts = cls.COMPRESSION_OPTS
+        if metas_layout is None:
+            metas_layout = cls.METAS_LAYOUT
+        if metas_layout not in ('columns', 'blocks'):
+            raise ValueError(f"unknown metas layout {metas_layout!r}")
+
+        def create_dataset(name, array):
+            array = np.asarray(array)
+            # empty datasets can not be chunked
+            if (compression is None and chunk_rows is None) or not array.size:
+                return f.create_dataset(name, data=array)
+            chunks = cls.chunk_shape(array, chunk_rows)
+            dset = f.create_dataset(
+                name,
+                shape=array.shape,
+                dtype=array.dtype,
+                chunks=chunks,
+                compression=compression,
+                compression_opts=compression_opts,
+            )
+            for start in range(0, len(array), chunks[0]):
+                dset[start : start + chunks[0]] = array[start : start + chunks[0]]
+            return dset
+
         with h5py.File(filename, 'w') as f:
             f.attrs['creator'] = "Orange"
             f.attrs['Orange_version'] = ORANGE_VERSION
@@ -131,20 +285,59 @@ class HDF5Reader(FileFormat):
                 )
                 f.create_dataset(f'domain/{subdomain}', data=domain)
                 f.create_dataset(f'domain/{subdomain}_args', data=domain_args)
-            f.create_dataset("X", data=data.X)
+            create_dataset("X", data.X)
             if data.Y.size:
-                f.create_dataset("Y", data=data.Y)
-            if data.metas.size:
+                create_dataset("Y", data.Y)
+            if data.metas.size and metas_layout == 'columns':
                 for i, attr in enumerate(data.domain.metas):
                     col_type = str_dtype if isinstance(attr, StringVariable) else 'f'
                     col_data = data.metas[:, [i]].astype(col_type)
                     if col_type != 'f':
                         col_data[pd.isnull(col_data)] = ""
-                    f.create_dataset(f'metas/{i}', data=col_data, dtype=col_type)
-        cls.write_table_metadata(filename, data)
+                    create_dataset(f'metas/{i}', col_data)
+            elif data.metas.size:
+                f.attrs['metas_layout'] = metas_layout
+                is_string = np.array(
+                    [isinstance(attr, StringVariable) for attr in data.domain.metas]
+                )
+                numeric = np.flatnonzero(~is_string)
+                if numeric.size:
+                    block = data.metas[:, numeric].astype(np.float64)
+                    create_dataset('metas/numeric', block).attrs['columns'] = numeric
+                string = np.flatnonzero(is_string)
+                if string.size:
+                    block = data.metas[:, string]
+                    block = np.where(pd.isnull(block), "", block)
+                    codes, values = pd.factorize(block.ravel())
+                    values = np.array([str(v) for v in values], dtype=str_dtype)
+                    codes = codes.reshape(block.shape).astype(
+                        np.min_scalar_type(max(len(values) - 1, 0))
+                    )
+                    f.create_dataset('metas/string_values', data=values)
+                    create_dataset('metas/string', codes).attrs['columns'] = string
+            cls._write_metadata(f, data)
+
+    @classmethod
+    def chunk_shape(cls, array, chunk_rows=None):
+        """
+        Chunks of whole rows: a spectral table is read row-wise (pixels or
+        time slices), so each chunk holds complete spectra. Unless chunk_rows
+        is given, the number of rows is chosen so that a chunk is about
+        CHUNK_BYTES large.
+        """
+        row_bytes = array.dtype.itemsize * int(np.prod(array.shape[1:]))
+        if chunk_rows is None:
+            chunk_rows = cls.CHUNK_BYTES // max(row_bytes, 1)
+        chunk_rows = int(min(max(chunk_rows, 1), len(array)))
+        return (chunk_rows,) + array.shape[1:]
 
     @classmethod
     def write_table_metadata(cls, filename, data):
+        with h5py.File(filename, 'r+') as f:
+            cls._write_metadata(f, data)
+
+    @classmethod
+    def _write_metadata(cls, f, data):
         dump_dict = {}
         for key, value in data.attributes.items():
             if isinstance(value, str):
@@ -156,11 +349,10 @@ class HDF5Reader(FileFormat):
                     # value is not JSON serializable, fall back to pickle
                     dump_dict[key] = pickle.dumps(value, protocol=PICKLE_PROTOCOL).hex()
 
-        with h5py.File(filename, 'r+') as f:
-            metadata_group = f.require_group('metadata')
-            str_dtype = h5py.string_dtype()
-            for key, value in dump_dict.items():
-                metadata_group.create_dataset(key, data=value, dtype=str_dtype)
+        metadata_group = f.require_group('metadata')
+        str_dtype = h5py.string_dtype()
+        for key, value in dump_dict.items():
+            metadata_group.create_dataset(key, data=value, dtype=str_dtype)
 
     @classmethod
     def set_table_metadata(cls, filename, data):
@@ -193,41 +385,148 @@ class IRisF1HDF5Reader(FileFormat):
     DESCRIPTION = 'IRsweep IRis-F1 _processed_data'
 
     TRANSMISSION = "Transmission"
+    AVERAGED_TRANSMISSION = "Averaged transmission"
     NORMALIZATION_VECTOR = "Normalization Vector"
 
+    # probe results of the last files, see probe
+    PROBE_CACHE_SIZE = 512
+    _probe_cache = OrderedDict()
+
+    @classmethod
+    def probe(cls, filename):
+        """
+        Open the file once to find out whether it is an IRis-F1 file and
+        return the class of the reader that claims it. The result is cached
+        by path and is reused as long as the modification time and the size
+        of the file do not change, so that valid, sheets and the dispatch of
+        HDF5MetaMetaReader do not reopen the file. Reading the data still
+        opens it.
+        """
+        key = path.abspath(filename)
+        stat = os.stat(filename)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        try:
+            cached_stamp, result = cls._probe_cache[key]
+        except KeyError:
+            pass
+        else:
+            if cached_stamp == stamp:
+                cls._probe_cache.move_to_end(key)
+                return result
+
+        with h5py.File(filename, "r") as f:
+            info = f['info'].attrs if 'info' in f else {}
+            is_irisf1 = 'SoftwareVersion' in info or 'Version' in info
+        result = IRisF1HDF5Reader if is_irisf1 else HDF5MetaReader
+
+        cls._probe_cache[key] = (stamp, result)
+        while len(cls._probe_cache) > cls.PROBE_CACHE_SIZE:
+            cls._probe_cache.popitem(last=False)
+        return result
+
     @property
     def valid(self):
-        with h5py.File(self.filename, "r") as f:
-            try:
-                f['info'].attrs['SoftwareVersion'][0]
-            except KeyError:
-                try:
-                    f['info'].attrs['Version'][0]
-                except KeyError:
-                    return False
-                else:
-                    return True
-            else:
-                return True
+        return self.probe(self.filename) is IRisF1HDF5Reader
+
+    def __init__(
+        self,
+        filename,
+        acquisitions=None,
+        time_window=None,
+        time_decimation=1,
+        average=False,
+    ):
+        """
+        The options reduce the data while it is read:
+
+        acquisitions: a slice or range of the acquisitions to import
+        time_window: (start, stop) in seconds, the time slices of a
+            time-resolved measurement to import, both included
+        time_decimation: import only every time_decimation-th time slice
+        average: import the average of the acquisitions, computed with the
+            averaging rules of the measurement configuration (ASC/PSC),
+            instead of every acquisition. The acquisitions then have to be
+            a contiguous range. This is always the case for the Averaged
+            transmission sheet.
+        """
+        super().__init__(filename)
+        self.acquisitions = acquisitions
+        self.time_window = time_window
+        self.time_decimation = time_decimation
+        self.average = average
 
     @property
     def sheets(self):
         if self.valid:
-            return [self.TRANSMISSION, self.NORMALIZATION_VECTOR]
+            return [
+                self.TRANSMISSION,
+                self.AVERAGED_TRANSMISSION,
+                self.NORMALIZATION_VECTOR,
+            ]
+
+    @property
+    def _average(self):
+        if self.sheet == self.NORMALIZATION_VECTOR:
+            return False
+        return self.average or self.sheet == self.AVERAGED_TRANSMISSION
 
     def read_spectra(self):
-        from heterodyne_postprocessing.processing.postProcessorHDF5 import (
-            PostProcessorHDF5Loader,
-        )
+        if self._average:
+            from heterodyne_postprocessing.processing.postProcessorAvg import (
+                PostProcessorAvg as Processor,
+            )
+        else:
+            from heterodyne_postprocessing.processing.postProcessorHDF5 import (
+                PostProcessorHDF5Loader as Processor,
+            )
 
-        proc = PostProcessorHDF5Loader()
+        proc = Processor()
         proc.load_configuration(self.filename)
-        proc.load_transmission()
+        # time resolved transmissions are copied from the file straight into
+        # the table, see _spectra_from_time_resolved, and averages are
+        # streamed from the file, see _spectra_from_processor
+        lazy = self.sheet != self.NORMALIZATION_VECTOR and (
+            proc.is_timeresolved() or self._average
+        )
+        proc.load_transmission(lazy=lazy)
+        try:
+            return self._spectra_from_processor(proc)
+        finally:
+            proc.close()
+
+    def _acquisition_range(self, num_acq):
+        acquisitions = self.acquisitions
+        if acquisitions is None:
+            acquisitions = slice(None)
+        elif isinstance(acquisitions, range):
+            acquisitions = slice(
+                acquisitions.start, acquisitions.stop, acquisitions.step
+            )
+        return range(num_acq)[acquisitions]
+
+    def _time_slice(self, time_axis):
+        time_axis = np.asarray(time_axis)
+        if self.time_window is None:
+            start, stop = 0, len(time_axis)
+        else:
+            inside = np.flatnonzero(
+                (time_axis >= self.time_window[0]) & (time_axis <= self.time_window[1])
+            )
+            start, stop = (inside[0], inside[-1] + 1) if inside.size else (0, 0)
+        return slice(start, stop, int(self.time_decimation))
 
+    def _spectra_from_processor(self, proc):
         energy = proc.data['wnAxis']
+        acquisitions = self._acquisition_range(proc.data['numAcq'])
+        # a reversed range down to the first acquisition stops at -1, i.e. None as slice
+        acq_slice = slice(
+            acquisitions.start,
+            acquisitions.stop if acquisitions.stop >= 0 else None,
+            acquisitions.step,
+        )
 
         if self.sheet == self.NORMALIZATION_VECTOR:
-            data = proc.data['normalizationVector'].T
+            data = proc.data['normalizationVector'][:, acq_slice].T
 
             import_attrs = [
                 'stdPeak',
@@ -237,31 +536,65 @@ class IRisF1HDF5Reader(FileFormat):
 
             return (energy, data, None, var_attr_d)
 
-        elif proc.is_timeresolved():
-            data = proc.data['transientTrans']
-            time_axis = proc.data['timeAxis']
+        if proc.is_timeresolved():
+            time_slice = self._time_slice(proc.data['timeAxis'])
+            time_axis = proc.data['timeAxis'][time_slice]
+
+        if self._average:
+            if acquisitions.step != 1 or not len(acquisitions):
+                raise ValueError(
+                    'Averaging needs a non-empty contiguous range of acquisitions'
+                )
+            if proc.is_timeresolved():
+                # restrict the lazy cube to the time window, so that the
+                # streaming average only reads the selected time slices
+                proc.data['transientTrans'] = proc.data['transientTrans'][time_slice]
+                proc.data['timeAxis'] = time_axis
+                time_slice = slice(None)
+            proc.acquisition_average(
+                startIndx=acquisitions.start, stopIndx=acquisitions.stop - 1
+            )
+            average = proc.data[proc.data_name + 'AvgOfFiles']
 
+        if proc.is_timeresolved():
             import_attrs = [
                 'peakMeanAmp',
             ]
             var_attr_d = {k: proc.data[k] for k in import_attrs if k in proc.data}
 
+            if self._average:
+                add_dom = Orange.data.Domain(
+                    [], None, metas=[Orange.data.ContinuousVariable.make("Time")]
+                )
+                add_table = Orange.data.Table.from_numpy(
+                    add_dom,
+                    X=np.zeros((len(time_axis), 0)),
+                    metas=np.atleast_2d(time_axis).T,
+                )
+                return (energy, average[time_slice].real, add_table, var_attr_d)
+
+            data = proc.data['transientTrans'][time_slice, :, acq_slice]
             return (
-                *self._spectra_from_time_resolved(data, energy, time_axis),
+                *self._spectra_from_time_resolved(
+                    data, energy, time_axis, acquisition_numbers=acquisitions
+                ),
                 var_attr_d,
             )
 
         else:
-            data = proc.data['transmission'].T
-
             import_attrs = [
                 'stdPeak',
                 'peakMeanAmp',
             ]
             var_attr_d = {k: proc.data[k] for k in import_attrs if k in proc.data}
 
+            if self._average:
+                return (energy, np.atleast_2d(average).real, None, var_attr_d)
+
+            data = proc.data['transmission'][:, acq_slice].T
+
             # Time stamps
-            time_stamp = np.atleast_2d(proc.data['timeStamp']).T
+            time_stamp = np.atleast_2d(proc.data['timeStamp'][acq_slice]).T
             add_dom = Orange.data.Domain(
                 [], None, metas=[Orange.data.ContinuousVariable.make("Time")]
             )
@@ -299,24 +632,42 @@ class IRisF1HDF5Reader(FileFormat):
 
     # based on _spectra_from_image
     @staticmethod
-    def _spectra_from_time_resolved(X, features, time_axis):  # noqa N803
+    def _spectra_from_time_resolved(  # noqa N803
+        X, features, time_axis, acquisition_numbers=None, batch_size=1
+    ):
         """
         Create a spectral format (returned by SpectralFileFormat.read_spectra)
-        from 3D data organized [ time, wavelengths, acquisitions ]
+        from 3D data organized [ time, wavelengths, acquisitions ]. The
+        Acquisition meta holds acquisition_numbers (by default 0, 1, ...).
+
+        The spectra are written directly into the final float64 array, one
+        row per (acquisition, time), which is what read() passes to the
+        table without another copy. X can be an array or a
+        LazyAcquisitionCube, which is then read batch_size acquisitions at a
+        time. Only the real part of complex data is kept.
         """
-        X = np.asarray(X)  # noqa N806
-        # rearrange axes: [ acquisitions, time, wavelengths ]
-        X = X.transpose((2, 0, 1))  # noqa N806
-        time_axis = np.asarray(time_axis)
-        acq_nums = np.arange(X.shape[1])
-
-        # each spectrum has its own row
-        spectra = X.reshape((X.shape[0] * X.shape[1], X.shape[2]))
-
-        # locations
-        acq_num = np.repeat(np.arange(X.shape[0]), X.shape[1])
-        time = np.tile(np.arange(X.shape[1]), X.shape[0])
-        metas = np.array([time_axis[time], acq_nums[acq_num]]).T
+        if not hasattr(X, 'iter_acquisitions'):
+            X = np.asarray(X)  # noqa N806
+        n_time, n_lines, n_acq = X.shape
+        spectra = np.empty((n_acq * n_time, n_lines), dtype=np.float64)
+        # [ acquisitions, time, wavelengths ] view of the spectra
+        spectra_3d = spectra.reshape((n_acq, n_time, n_lines))
+        if isinstance(X, np.ndarray):
+            np.copyto(spectra_3d, np.moveaxis(X, 2, 0).real)
+        else:
+            first = 0
+            for batch in X.iter_acquisitions(batch_size):
+                last = first + batch.shape[-1]
+                np.copyto(spectra_3d[first:last], np.moveaxis(batch, 2, 0).real)
+                first = last
+
+        # locations, as floats: Orange converts them to objects only once
+        metas = np.empty((len(spectra), 2))
+        metas_3d = metas.reshape((n_acq, n_time, 2))
+        metas_3d[:, :, 0] = np.asarray(time_axis)
+        if acquisition_numbers is None:
+            acquisition_numbers = np.arange(n_acq)
+        metas_3d[:, :, 1] = np.asarray(acquisition_numbers)[:, None]
 
         domain = Orange.data.Domain(
             [],
@@ -327,7 +678,7 @@ class IRisF1HDF5Reader(FileFormat):
             ],
         )
         data = Orange.data.Table.from_numpy(
-            domain, X=np.zeros((len(spectra), 0)), metas=np.asarray(metas, dtype=object)
+            domain, X=np.zeros((len(spectra), 0)), metas=metas
         )
         return features, spectra, data
 
@@ -340,17 +691,15 @@ class HDF5MetaMetaReader(FileFormat):
     DESCRIPTION = 'HDF5 Meta-meta-reader'
     PRIORITY = HDF5MetaReader.PRIORITY - 1
 
+    def _reader(self):
+        reader = IRisF1HDF5Reader.probe(self.filename)(self.filename)
+        if self.sheet is not None:
+            reader.select_sheet(self.sheet)
+        return reader
+
     @property
     def sheets(self) -> list:
-        reader = IRisF1HDF5Reader(self.filename)
-        if reader.valid:
-            return reader.sheets
-        else:
-            return HDF5MetaReader(self.filename).sheets
+        return self._reader().sheets
 
     def read(self):
-        irisf1_reader = IRisF1HDF5Reader(filename=self.filename)
-        if irisf1_reader.valid:
-            return irisf1_reader.read()
-        else:
-            return HDF5MetaReader(filename=self.filename).read()
+        return self._reader().read()
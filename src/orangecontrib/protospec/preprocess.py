@@ -0,0 +1,88 @@
+import numpy as np
+
+
+def spectral_smoothing(X, spectral_half_width, std_peak, out=None, chunk_rows=4096):  # noqa N803
+    """
+    Spectrally average the rows of X with a window average weighted by the
+    inverse variance of each column: i-spectral_half_width:i+spectral_half_width+1 -> i.
+
+    The weighted sums of all windows are computed at once from cumulative
+    sums, so the cost does not depend on the window width. Rows are processed
+    in chunks of chunk_rows, the temporary memory is bounded by the chunk and
+    not by the table. Non-finite values (e.g. NaN in the table, or a standard
+    deviation of 0) are left out of the cumulative sums and only reach the
+    windows that contain them, as with a loop over the windows.
+
+    Input   :   X(ndarray) [rows, columns]
+                spectral_half_width(int) half of the size of the window to
+                average points together. Usually set to 5.
+                std_peak(ndarray) [columns] the standard deviation of each column
+                out(ndarray) optional output array of the shape of X, may be X itself
+                chunk_rows(int) the number of rows processed at once
+    Output  :   out(ndarray) the smoothed data
+    """
+    X = np.atleast_2d(X)  # noqa N806
+    if out is None:
+        out = np.empty(X.shape, dtype=np.result_type(X.dtype, np.float64))
+    n_columns = X.shape[-1]
+    spectral_half_width = int(spectral_half_width)
+
+    with np.errstate(divide="ignore"):
+        weight = 1 / np.asarray(std_peak, dtype=np.float64) ** 2
+    # a window with a non-finite weight is normalised to NaN
+    bad_weight = ~np.isfinite(weight)
+    weight[bad_weight] = 0
+    start = np.maximum(np.arange(n_columns) - spectral_half_width, 0)
+    stop = np.minimum(np.arange(n_columns) + spectral_half_width + 1, n_columns)
+    cum_weight = np.concatenate(([0], np.cumsum(weight)))
+    norm = cum_weight[stop] - cum_weight[start]
+    norm[_window_count(bad_weight, start, stop) > 0] = np.nan
+
+    cum_sum = np.zeros((min(chunk_rows, X.shape[0]), n_columns + 1), dtype=out.dtype)
+    for first in range(0, X.shape[0], chunk_rows):
+        rows = slice(first, min(first + chunk_rows, X.shape[0]))
+        n_rows = rows.stop - rows.start
+        products = cum_sum[:n_rows, 1:]
+        with np.errstate(invalid="ignore"):
+            np.multiply(X[rows], weight, out=products)
+        non_finite = ~np.isfinite(products)
+        extra = None
+        if non_finite.any():
+            # the sum of the non-finite products of each window: +inf, -inf or NaN
+            pos = _window_count(products == np.inf, start, stop)
+            neg = _window_count(products == -np.inf, start, stop)
+            nan = _window_count(non_finite, start, stop) - pos - neg
+            products[non_finite] = 0
+            extra = np.zeros((n_rows, n_columns))
+            extra[pos > 0] = np.inf
+            extra[neg > 0] = -np.inf
+            extra[(nan > 0) | ((pos > 0) & (neg > 0))] = np.nan
+        np.cumsum(products, axis=1, out=products)
+        np.subtract(cum_sum[:n_rows, stop], cum_sum[:n_rows, start], out=out[rows])
+        if extra is not None:
+            out[rows] += extra
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[rows] /= norm
+    return out
+
+
+def _window_count(mask, start, stop):
+    """
+    The number of True values of mask (along its last axis) in each window start:stop.
+    """
+    cum = np.zeros(mask.shape[:-1] + (mask.shape[-1] + 1,), dtype=np.intp)
+    np.cumsum(mask, axis=-1, out=cum[..., 1:])
+    return cum[..., stop] - cum[..., start]
+
+
+def std_before_time_zero(X, time_zero):  # noqa N803
+    """
+    Standard deviation of each column over the rows recorded before time
+    zero, used as std_peak for time resolved data.
+
+    Input   :   X(ndarray) [rows, columns], the time slices of the first
+                acquisition first
+                time_zero(int) the row of time zero
+    Output  :   std(ndarray) [columns]
+    """
+    return np.std(X[0:time_zero, :], axis=0)
@@ -2,6 +2,13 @@ import numpy as np
 
 from orangecontrib.spectroscopy.data import getx, build_spec_table
 
+from heterodyne_postprocessing.misc.lagEstimation import estimate_lag
+
+# search the lag among -MAX_LAG..MAX_LAG lines only, None for all lags
+MAX_LAG = None
+# refine the lag below one line
+SUBSAMPLE = False
+
 def add_lag_measurement(data, calibration_data):# calibrated_wn, peakMeanAmpCalib, flipped):
     """
     Compares the peak mean amp of the current measurement with the calibration
@@ -22,9 +29,7 @@ def add_lag_measurement(data, calibration_data):# calibrated_wn, peakMeanAmpCali
     peakMeanAmp = np.array([v.attributes['peakMeanAmp'] for v in data.domain.attributes])
     peakMeanAmpCalib = calibration_data[0]
 
-    corr = np.correlate(peakMeanAmpCalib, peakMeanAmp,'full')
-
-    lag = float(np.argmax(corr))-noLines+1
+    lag = estimate_lag(peakMeanAmpCalib, peakMeanAmp, maxLag=MAX_LAG, subsample=SUBSAMPLE)
     new_wn = np.arange(0, noLines)*wn_spacing_calibrated
     new_wn = new_wn + first_wn + lag*wn_spacing_calibrated
     if calibration_data.attributes['flipped']:
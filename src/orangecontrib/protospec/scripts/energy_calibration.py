@@ -5,22 +5,32 @@ import matplotlib.gridspec as gridspec
 
 from orangecontrib.spectroscopy.data import getx, build_spec_table
 
+from heterodyne_postprocessing.misc.wnCalibration import fit_wn_calibration
+
+# refine the automatic calibration with the sliders, False to run without figure
+MANUAL_REFINEMENT = True
+
 # data['wnAxisCalib'] is Iris PP Calibration wavenumber axis
 # data['transmissionCalib'] is Iris PP Calibration transmission data (co-added)
 # data['wnAxisReference'] is FTIR PP reference wavenumber axis
 # data['transmissionReference'] is FTIR PP reference transmission
 
 
-def manual_calibration(calib, reference, plotOn=False):
+def manual_calibration(calib, reference, plotOn=False, fit=None):
     """
     Generate a figure where you can slide the measurement so that it fits
     the reference measurement.
 
     Input   :   plotOn(bool) boolean to plot or not the calibrate measurements
+                fit(CalibrationFit) the automatic calibration the sliders start
+                from. It is returned if the figure is closed without saving.
     """
     flipped = False
     running = False
     final_wnAxisCalib = None
+    if fit is not None:
+        flipped = fit.flipped
+        final_wnAxisCalib = fit.wnAxis
 
 
     wnAxisCalib = getx(calib)
@@ -53,10 +63,11 @@ def manual_calibration(calib, reference, plotOn=False):
     p = ax1.plot(init_wn,init_transmission,'r-')
     ax1.set_ylim([-0.05,1.05])
 
-    wn_slider = Slider(ax_wnslider,'Center wavenumber',minWn,maxWn,valinit=np.mean(wnAxisCalib),valstep=wnSpacing/10,valfmt='%4.1f$\mathrm{cm}^{-1}$')
-    spacing_slider = Slider(ax_spaceslider,'Spacing wavenumber',wnSpacing*0.75,wnSpacing*1.5,valinit=wnSpacing,valfmt='%1.3f$\mathrm{cm}^{-1}$',valstep=0.0001)
-    offset_slider = Slider(ax_offslider,'Offset transmission',-0.5,0.5,valinit=0)
-    amp_slider = Slider(ax_ampslider,'Amplitude transformation',0,4,valinit=1)
+    init = (np.mean(wnAxisCalib), wnSpacing, 0, 1) if fit is None else (fit.center, fit.spacing, fit.offset, fit.amplitude)
+    wn_slider = Slider(ax_wnslider,'Center wavenumber',minWn,maxWn,valinit=init[0],valstep=wnSpacing/10,valfmt='%4.1f$\mathrm{cm}^{-1}$')
+    spacing_slider = Slider(ax_spaceslider,'Spacing wavenumber',wnSpacing*0.75,wnSpacing*1.5,valinit=init[1],valfmt='%1.3f$\mathrm{cm}^{-1}$',valstep=0.0001)
+    offset_slider = Slider(ax_offslider,'Offset transmission',-1,1,valinit=init[2])
+    amp_slider = Slider(ax_ampslider,'Amplitude transformation',0,4,valinit=init[3])
 
     button_reset = Button(ax_button_reset,'Reset',hovercolor='0.975')
     button_save = Button(ax_button_save,'Save axis')
@@ -86,6 +97,8 @@ def manual_calibration(calib, reference, plotOn=False):
     spacing_slider.on_changed(update)
     offset_slider.on_changed(update)
     amp_slider.on_changed(update)
+    if fit is not None:
+        update(None)
 
     def reset(event):
         wn_slider.reset()
@@ -106,11 +119,17 @@ def manual_calibration(calib, reference, plotOn=False):
         print('Wavenumber axis saved !')
         final_wnAxisCalib = p[0].get_xdata()
         running = False
+        fig.canvas.stop_event_loop()
 
     def handle_close(event):
         nonlocal running
-        print('Figure closed without saving wavenumber axis!')
+        nonlocal flipped
+        if running:
+            print('Figure closed without saving wavenumber axis!')
+            if fit is not None:
+                flipped = fit.flipped
         running = False
+        fig.canvas.stop_event_loop()
 
 
     closeid = fig.canvas.mpl_connect('close_event',handle_close)
@@ -119,9 +138,11 @@ def manual_calibration(calib, reference, plotOn=False):
     button_save.on_clicked(save)
     button_flip.on_clicked(flip)
 
+    # wait in the event loop of the figure until the axis is saved or the figure closed
     running = True
+    plt.show(block=False)
     while running:
-        plt.pause(0.001)
+        fig.canvas.start_event_loop(timeout=0)
 
     fig.canvas.mpl_disconnect(closeid)
     plt.close(fig.number)
@@ -130,7 +151,19 @@ def manual_calibration(calib, reference, plotOn=False):
 if in_data and in_object:
     calib = in_data
     reference = in_object
-    calibrated_wn, flipped = manual_calibration(calib, reference, plotOn=True)
+    try:
+        fit = fit_wn_calibration(getx(calib), calib.X[0], getx(reference), reference.X[0])
+        print(fit.report())
+    except ValueError as error:
+        # e.g. no overlap with the reference, the manual calibration starts from the uncalibrated axis
+        print('The automatic calibration failed:', error)
+        fit = None
+    if MANUAL_REFINEMENT:
+        calibrated_wn, flipped = manual_calibration(calib, reference, plotOn=True, fit=fit)
+    elif fit is not None:
+        calibrated_wn, flipped = fit.wnAxis, fit.flipped
+    else:
+        calibrated_wn = None
 else:
     print("Connect data to input / calibration data to object.")
     calibrated_wn = None
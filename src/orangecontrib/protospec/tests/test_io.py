@@ -2,7 +2,9 @@ import os
 import unittest
 from tempfile import NamedTemporaryFile
 
+import h5py
 import numpy as np
+import pandas as pd
 from Orange.data import (
     Domain,
     DiscreteVariable,
@@ -44,6 +46,195 @@ class TestHDF5(unittest.TestCase):
             self.assertEqual(data.metas[2, 0], "")
             np.testing.assert_equal(data.domain, self.data.domain)
 
+    def test_roundtrip_compressed(self):
+        domain = Domain(
+            [ContinuousVariable(str(i)) for i in range(20)],
+            metas=[
+                ContinuousVariable("x"),
+                StringVariable("name"),
+                ContinuousVariable("y"),
+            ],
+        )
+        rng = np.random.default_rng(0)
+        metas = np.empty((100, 3), dtype=object)
+        metas[:, 0] = np.arange(100) * 0.1
+        metas[:, 1] = [f"pixel {i}" for i in range(100)]
+        metas[:, 2] = np.arange(100) + 1e-9
+        data = Table.from_numpy(domain, rng.random((100, 20)), metas=metas)
+        data.attributes["Name"] = "compressed"
+        for compression in ("gzip", "lzf"):
+            with (
+                self.subTest(compression=compression),
+                named_file('', suffix='.hdf5') as fn,
+            ):
+                HDF5Reader.write_file(
+                    fn,
+                    data,
+                    compression=compression,
+                    chunk_rows=16,
+                    metas_layout='blocks',
+                )
+                with h5py.File(fn, 'r') as f:
+                    self.assertEqual(f['X'].compression, compression)
+                    self.assertEqual(f['X'].chunks, (16, 20))
+                    np.testing.assert_equal(f['metas/numeric'].attrs['columns'], [0, 2])
+                    np.testing.assert_equal(f['metas/string'].attrs['columns'], [1])
+                    self.assertNotIn('metas/0', f)
+                    self.assertEqual(f.attrs['metas_layout'], 'blocks')
+                table = HDF5Reader(fn).read()
+                np.testing.assert_equal(table.X, data.X)
+                np.testing.assert_equal(table.metas, data.metas)
+                self.assertEqual(table.attributes, data.attributes)
+
+    def test_string_metas(self):
+        domain = Domain(
+            [ContinuousVariable("a")],
+            metas=[StringVariable("file"), StringVariable("label")],
+        )
+        metas = np.empty((300, 2), dtype=object)
+        metas[:, 0] = [f"file{i % 3}" for i in range(300)]
+        metas[:, 1] = "ä"
+        metas[::7, 1] = np.nan
+        expected = metas.copy()
+        expected[::7, 1] = ""
+        data = Table.from_numpy(domain, np.zeros((300, 1)), metas=metas)
+        with named_file('', suffix='.hdf5') as fn:
+            HDF5Reader.write_file(fn, data, metas_layout='blocks')
+            with h5py.File(fn, 'r') as f:
+                self.assertEqual(f['metas/string'].dtype, np.uint8)
+                self.assertEqual(len(f['metas/string_values']), 5)
+            table = HDF5Reader(fn).read(rows=slice(1, None))
+            np.testing.assert_equal(table.metas, expected[1:])
+
+    def test_default_layout(self):
+        """By default the metas are written in the layout of Orange"""
+        domain = Domain(
+            [ContinuousVariable("a")],
+            metas=[ContinuousVariable("x"), StringVariable("name")],
+        )
+        metas = np.array([[0.1, "foo"], [2.5, np.nan], [np.nan, "bar"]], dtype=object)
+        data = Table.from_numpy(domain, np.zeros((3, 1)), metas=metas)
+        with named_file('', suffix='.hdf5') as fn:
+            HDF5Reader.write_file(fn, data, compression="gzip")
+            with h5py.File(fn, 'r') as f:
+                self.assertEqual(sorted(f['metas']), ['0', '1'])
+                self.assertNotIn('metas_layout', f.attrs)
+                self.assertEqual(f['metas/0'].dtype, np.float32)
+                self.assertEqual(f['metas/0'].shape, (3, 1))
+                self.assertEqual(
+                    f['metas/1'].asstr()[:, 0].tolist(), ["foo", "", "bar"]
+                )
+            table = HDF5Reader(fn).read()
+            np.testing.assert_equal(
+                table.metas[:, 0].astype(float), np.float32([0.1, 2.5, np.nan])
+            )
+            self.assertEqual(table.metas[:, 1].tolist(), ["foo", "", "bar"])
+        with self.assertRaises(ValueError):
+            HDF5Reader.write_file(fn, data, metas_layout='rows')
+
+    def test_read_baseline_layout(self):
+        """A file written by the per-column writer of Orange round trips"""
+        with named_file('', suffix='.hdf5') as fn:
+            HDF5Reader.write_file(fn, self.data, metas_layout='blocks')
+            with h5py.File(fn, 'r+') as f:
+                del f['metas']
+                del f.attrs['metas_layout']
+                col_data = self.data.metas[:, [0]].astype(h5py.string_dtype())
+                col_data[pd.isnull(col_data)] = ""
+                f.create_dataset('metas/0', data=col_data, dtype=h5py.string_dtype())
+            data = HDF5Reader(fn).read()
+            np.testing.assert_equal(data.X, self.data.X)
+            np.testing.assert_equal(data.Y, self.data.Y)
+            np.testing.assert_equal(data.domain, self.data.domain)
+            self.assertEqual(data.metas[:, 0].tolist(), ["foo", "bar", ""])
+            with named_file('', suffix='.hdf5') as fn2:
+                HDF5Reader.write_file(fn2, data)
+                with h5py.File(fn, 'r') as f, h5py.File(fn2, 'r') as f2:
+                    self.assertEqual(sorted(f['metas']), sorted(f2['metas']))
+                    self.assertEqual(
+                        f['metas/0'].asstr()[()].tolist(),
+                        f2['metas/0'].asstr()[()].tolist(),
+                    )
+
+    def test_read_per_column_metas(self):
+        """Files written with one dataset per meta column still load"""
+        with named_file('', suffix='.hdf5') as fn:
+            HDF5Reader.write_file(fn, self.data)
+            with h5py.File(fn, 'r+') as f:
+                del f['metas']
+                f['metas/0'] = np.array([["foo"], ["bar"], [""]], dtype=object).astype(
+                    h5py.string_dtype()
+                )
+            data = HDF5Reader(fn).read()
+            np.testing.assert_equal(data.X, self.data.X)
+            np.testing.assert_equal(data.metas[:2], self.data.metas[:2])
+            self.assertEqual(data.metas[2, 0], "")
+
+    def test_partial_read(self):
+        domain = Domain(
+            [ContinuousVariable(str(i)) for i in range(20)],
+            ContinuousVariable("c"),
+            [StringVariable("name"), ContinuousVariable("x")],
+        )
+        metas = np.array(
+            [[f"pixel {i}" for i in range(30)], np.arange(30) * 0.5], dtype=object
+        ).T
+        data = Table.from_numpy(
+            domain, np.random.default_rng(0).random((30, 20)), np.arange(30), metas
+        )
+        selections = [
+            (slice(5, 12), None),
+            (None, slice(3, 9)),
+            ([7, 2, 2, 29], [4, 0, 19]),
+            (np.arange(30) % 3 == 0, slice(None, None, -2)),
+        ]
+        for compression in (None, "gzip"):
+            with named_file('', suffix='.hdf5') as fn:
+                HDF5Reader.write_file(fn, data, compression=compression)
+                for lazy in (False, True):
+                    for rows, columns in selections:
+                        with self.subTest(
+                            compression=compression, lazy=lazy, rows=rows
+                        ):
+                            table = HDF5Reader(fn).read(rows, columns, lazy=lazy)
+                            rows = slice(None) if rows is None else rows
+                            columns = slice(None) if columns is None else columns
+                            expected = data[rows]
+                            np.testing.assert_equal(table.X, expected.X[:, columns])
+                            np.testing.assert_equal(table.Y, expected.Y)
+                            np.testing.assert_equal(table.metas, expected.metas)
+                            self.assertEqual(
+                                table.domain.attributes,
+                                tuple(np.array(domain.attributes)[columns]),
+                            )
+
+    def test_lazy_read(self):
+        X = np.random.default_rng(0).random((50, 20))
+        data = Table.from_numpy(
+            Domain([ContinuousVariable(str(i)) for i in range(20)]), X
+        )
+        with named_file('', suffix='.hdf5') as fn:
+            HDF5Reader.write_file(fn, data)
+            table = HDF5Reader(fn).read(lazy=True)
+            self.assertIsInstance(table.X.base, np.memmap)
+            np.testing.assert_equal(table.X, X)
+            # copy-on-write: the file is never modified
+            self.assertEqual(table.X.base.mode, 'c')
+
+            HDF5Reader.write_file(fn, data, compression="lzf")
+            table = HDF5Reader(fn).read(lazy=True)
+            self.assertNotIsInstance(table.X.base, np.memmap)
+            np.testing.assert_equal(table.X, X)
+
+    def test_chunk_shape(self):
+        X = np.zeros((10000, 1000))
+        self.assertEqual(HDF5Reader.chunk_shape(X), (131, 1000))
+        self.assertEqual(HDF5Reader.chunk_shape(X, 20000), (10000, 1000))
+        with named_file('', suffix='.hdf5') as fn:
+            empty = Table.from_numpy(Domain(self.domain.attributes), np.zeros((0, 2)))
+            HDF5Reader.write_file(fn, empty, compression="gzip")
+            self.assertEqual(len(HDF5Reader(fn).read()), 0)
+
 
 class Unserializable:
     def __init__(self, name):
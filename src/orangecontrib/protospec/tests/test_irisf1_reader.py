@@ -1,8 +1,24 @@
 import importlib.resources
 import os.path
+import shutil
+import tempfile
 import unittest
+import warnings
+from unittest import mock
 
+import h5py
+import numpy as np
 import Orange
+from orangecontrib.spectroscopy.io import HDF5MetaReader
+
+from heterodyne_postprocessing.misc.syntheticData import write_synthetic_processed_file
+from heterodyne_postprocessing.processing.postProcessorAvg import PostProcessorAvg
+from heterodyne_postprocessing.processing.postProcessorHDF5 import (
+    PostProcessorHDF5Loader,
+)
+
+from orangecontrib.protospec import data
+from orangecontrib.protospec.data import HDF5MetaMetaReader, IRisF1HDF5Reader
 
 IRISF1_FILE_3_2_3 = "temp-testdata/ATR_neatMOP_Si-2019-01-22-16-57-03_processed_data.h5"
 IRISF1_FILE_3_3_0 = (
@@ -45,3 +61,186 @@ class TestIRisF1Reader(unittest.TestCase):
 
     def test_iris_load_7_0_0_truncated(self):
         Orange.data.Table(IRISF1_FILE_7_0_0_truncated)
+
+
+class TestProbeCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.filename = os.path.join(self.tmpdir.name, "irisf1_processed_data.h5")
+        shutil.copy(IRISF1_FILE_7_0_0_truncated, self.filename)
+
+    def test_single_open(self):
+        with mock.patch.object(data.h5py, "File", wraps=h5py.File) as h5file:
+            for _ in range(3):
+                self.assertTrue(IRisF1HDF5Reader(self.filename).valid)
+                reader = HDF5MetaMetaReader(self.filename)
+                self.assertEqual(
+                    reader.sheets,
+                    [
+                        IRisF1HDF5Reader.TRANSMISSION,
+                        IRisF1HDF5Reader.AVERAGED_TRANSMISSION,
+                        IRisF1HDF5Reader.NORMALIZATION_VECTOR,
+                    ],
+                )
+            self.assertEqual(h5file.call_count, 1)
+        self.assertIs(IRisF1HDF5Reader.probe(self.filename), IRisF1HDF5Reader)
+
+    def test_file_changed(self):
+        IRisF1HDF5Reader.probe(self.filename)
+        with h5py.File(self.filename, "r+") as f:
+            del f["info"].attrs["SoftwareVersion"]
+        os.utime(self.filename, ns=(0, 0))
+        self.assertFalse(IRisF1HDF5Reader(self.filename).valid)
+        self.assertIs(IRisF1HDF5Reader.probe(self.filename), HDF5MetaReader)
+
+    def test_sheet_is_forwarded(self):
+        reader = HDF5MetaMetaReader(self.filename)
+        reader.select_sheet(IRisF1HDF5Reader.NORMALIZATION_VECTOR)
+        table = reader.read()
+        self.assertEqual(len(table), 3)
+        self.assertNotIn("Time", [m.name for m in table.domain.metas])
+
+
+class TestTimeResolved(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.filename = write_synthetic_processed_file(
+            os.path.join(self.tmpdir.name, "tr_processed_data.h5"),
+            numAcq=4,
+            noLines=15,
+            noTimes=10,
+        )
+        proc = PostProcessorHDF5Loader()
+        proc.load_configuration(self.filename)
+        proc.load_transmission()
+        self.proc = proc
+
+    def test_read(self):
+        table = IRisF1HDF5Reader(self.filename).read()
+        trans = self.proc.data['transientTrans']
+        self.assertEqual(table.X.shape, (4 * 10, 15))
+        for acq in range(4):
+            np.testing.assert_equal(
+                table.X[acq * 10 : (acq + 1) * 10], trans[:, :, acq].real
+            )
+        np.testing.assert_equal(
+            table.get_column("Time"), np.tile(self.proc.data['timeAxis'], 4)
+        )
+        np.testing.assert_equal(
+            table.get_column("Acquisition"), np.repeat(range(4), 10)
+        )
+        np.testing.assert_equal(
+            [float(v.name) for v in table.domain.attributes], self.proc.data['wnAxis']
+        )
+
+    def test_array_and_lazy_cube(self):
+        lazy = PostProcessorHDF5Loader()
+        lazy.load_configuration(self.filename)
+        lazy.load_transmission(lazy=True)
+        self.addCleanup(lazy.close)
+        args = (self.proc.data['wnAxis'], self.proc.data['timeAxis'])
+        _, expected, expected_metas = IRisF1HDF5Reader._spectra_from_time_resolved(
+            self.proc.data['transientTrans'], *args
+        )
+        for batch_size in (1, 3):
+            _, spectra, metas = IRisF1HDF5Reader._spectra_from_time_resolved(
+                lazy.data['transientTrans'], *args, batch_size=batch_size
+            )
+            np.testing.assert_equal(spectra, expected)
+            np.testing.assert_equal(metas.metas, expected_metas.metas)
+
+    def test_selection(self):
+        time_axis = self.proc.data['timeAxis']
+        reader = IRisF1HDF5Reader(
+            self.filename,
+            acquisitions=range(1, 4),
+            time_window=(time_axis[2], time_axis[8]),
+            time_decimation=2,
+        )
+        table = reader.read()
+        trans = self.proc.data['transientTrans']
+        np.testing.assert_equal(table.get_column("Time"), np.tile(time_axis[2:9:2], 3))
+        np.testing.assert_equal(
+            table.get_column("Acquisition"), np.repeat([1, 2, 3], 4)
+        )
+        np.testing.assert_equal(table.X[:4], trans[2:9:2, :, 1].real)
+        np.testing.assert_equal(table.X[-4:], trans[2:9:2, :, 3].real)
+
+    def test_reversed_selection(self):
+        trans = self.proc.data['transientTrans']
+        num_acq = trans.shape[-1]
+        table = IRisF1HDF5Reader(
+            self.filename, acquisitions=slice(None, None, -1)
+        ).read()
+        n_times = len(self.proc.data['timeAxis'])
+        self.assertEqual(len(table), num_acq * n_times)
+        np.testing.assert_equal(
+            table.get_column("Acquisition"), np.repeat(range(num_acq)[::-1], n_times)
+        )
+        np.testing.assert_equal(table.X[:n_times], trans[:, :, -1].real)
+        np.testing.assert_equal(table.X[-n_times:], trans[:, :, 0].real)
+
+    def test_average(self):
+        time_axis = self.proc.data['timeAxis']
+        table = IRisF1HDF5Reader(
+            self.filename,
+            acquisitions=slice(1, 3),
+            time_window=(time_axis[5], np.inf),
+            average=True,
+        ).read()
+        expected = self.proc.data['transientTrans'][5:, :, 1:3].mean(axis=-1).real
+        np.testing.assert_allclose(table.X, expected, rtol=1e-6)
+        np.testing.assert_equal(table.get_column("Time"), time_axis[5:])
+        self.assertEqual([m.name for m in table.domain.metas], ["Time"])
+
+        with self.assertRaises(ValueError):
+            IRisF1HDF5Reader(
+                self.filename, acquisitions=slice(0, 4, 2), average=True
+            ).read()
+
+    def test_average_time_integrated(self):
+        filename = write_synthetic_processed_file(
+            os.path.join(self.tmpdir.name, "ti_processed_data.h5"),
+            numAcq=5,
+            noLines=15,
+            configuration='PSC',
+        )
+        proc = PostProcessorAvg()
+        proc.load_configuration(filename)
+        proc.load_transmission()
+        proc.acquisition_average(startIndx=1)
+        with warnings.catch_warnings():
+            # the complex average is not cast to the float table
+            warnings.simplefilter("error", getattr(np, "exceptions", np).ComplexWarning)
+            table = IRisF1HDF5Reader(
+                filename, acquisitions=range(1, 5), average=True
+            ).read()
+        self.assertEqual(len(table), 1)
+        np.testing.assert_allclose(
+            table.X[0], proc.data['transmissionAvgOfFiles'].real, rtol=1e-6
+        )
+
+        table = IRisF1HDF5Reader(filename, acquisitions=range(3)).read()
+        np.testing.assert_equal(table.X, proc.data['transmission'][:, :3].T.real)
+        np.testing.assert_equal(table.get_column("Time"), proc.data['timeStamp'][:3])
+        table = IRisF1HDF5Reader(filename, acquisitions=slice(2, None, -1)).read()
+        np.testing.assert_equal(table.X, proc.data['transmission'][:, 2::-1].T.real)
+        np.testing.assert_equal(table.get_column("Time"), proc.data['timeStamp'][2::-1])
+
+    def test_averaged_sheet(self):
+        """The sheet gives the same as averaging the imported table by acquisition"""
+        for filename in (self.filename, IRISF1_FILE_7_0_0_truncated):
+            reader = IRisF1HDF5Reader(filename)
+            reader.select_sheet(IRisF1HDF5Reader.AVERAGED_TRANSMISSION)
+            table = reader.read()
+            full = IRisF1HDF5Reader(filename).read()
+            if "Acquisition" in full.domain:
+                num_acqs = int(full.get_column("Acquisition").max()) + 1
+            else:
+                num_acqs = len(full)
+            hypercube = full.X.reshape((num_acqs, -1, full.X.shape[1]))
+            np.testing.assert_allclose(
+                table.X, np.mean(hypercube, axis=0), rtol=1e-5, atol=1e-7
+            )
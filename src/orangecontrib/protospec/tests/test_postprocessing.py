@@ -0,0 +1,1341 @@
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import warnings
+from unittest import mock
+
+import h5py
+import numpy as np
+import scipy.io
+
+from heterodyne_postprocessing import BatchPostProcessing
+from heterodyne_postprocessing.configurations.configurationprocessed import (
+    ConfigurationProcessed,
+)
+from heterodyne_postprocessing.misc.acquisitionIndex import AcquisitionIndex
+from heterodyne_postprocessing.misc.axisIndex import AxisIndex
+from heterodyne_postprocessing.misc.hdf5Class import HDF5Class
+from heterodyne_postprocessing.misc.lagEstimation import (
+    cross_correlation,
+    estimate_lag,
+    lagged_wn_axis,
+)
+from heterodyne_postprocessing.misc.syntheticData import write_synthetic_processed_file
+from heterodyne_postprocessing.misc.timeRebinning import nearest_index, rebin
+from heterodyne_postprocessing.misc.wnCalibration import (
+    calibration_axis,
+    fit_wn_calibration,
+)
+from heterodyne_postprocessing.processing.postProcessor import PostProcessor
+from heterodyne_postprocessing.processing.postProcessorCalibration import (
+    PostProcessorCalibration,
+)
+from heterodyne_postprocessing.utilities.unnormalize import (
+    iter_unnormalized,
+    unnormalizer,
+)
+
+
+def load_proc(filename):
+    proc = PostProcessor()
+    proc.load_configuration(filename)
+    proc.load_transmission()
+    return proc
+
+
+class SyntheticFilesTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.tr_file = write_synthetic_processed_file(
+            os.path.join(cls.tmpdir.name, 'tr_processed_data.h5'),
+            numAcq=12,
+            noLines=30,
+            noTimes=20,
+        )
+        cls.ti_file = write_synthetic_processed_file(
+            os.path.join(cls.tmpdir.name, 'ti_processed_data.h5'),
+            numAcq=12,
+            noLines=30,
+            configuration='PSC',
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+
+class TestLoadTransmission(SyntheticFilesTestCase):
+    def test_time_resolved(self):
+        proc = load_proc(self.tr_file)
+        trans = proc.data['transientTrans']
+        self.assertEqual(trans.shape, (20, 30, 12))
+        with h5py.File(self.tr_file, 'r') as f:
+            for v in (0, 2, 11):
+                acq = f[f'transmission/acquisition{v}']
+                amp = acq['amp'][()]
+                np.testing.assert_equal(
+                    trans[..., v], (amp[..., 0] + amp[..., 1] * 1j).T
+                )
+                norm = acq['NormalizationVector'][()]
+                np.testing.assert_equal(
+                    proc.data['normalizationVector'][:, v],
+                    norm[:, 0, 0] + norm[:, 0, 1] * 1j,
+                )
+                np.testing.assert_equal(
+                    proc.data['stdPeakAcqs'][:, v], acq['peakstd'][()]
+                )
+                np.testing.assert_equal(
+                    proc.data['driftStd'][v], acq['info'].attrs['driftStd']
+                )
+            np.testing.assert_equal(
+                proc.data['timeAxis'], f['transmission/acquisition0/time'][()]
+            )
+        np.testing.assert_allclose(proc.data['timeStamp'], np.arange(12))
+
+    def test_time_integrated(self):
+        proc = load_proc(self.ti_file)
+        trans = proc.data['transmission']
+        self.assertEqual(trans.shape, (30, 12))
+        with h5py.File(self.ti_file, 'r') as f:
+            y = f['transmission/acquisition5/y'][()]
+        np.testing.assert_equal(trans[:, 5], y[:, 0, 0] + y[:, 0, 1] * 1j)
+        self.assertEqual(proc.data['stdPeakAcqs'].shape, (30, 12))
+        self.assertEqual(proc.data['normalizationVector'].shape, (30, 12))
+        np.testing.assert_allclose(proc.data['timeAxis'], np.arange(12))
+
+
+class TestSingleOpen(SyntheticFilesTestCase):
+    def test_single_open(self):
+        for filename in (self.tr_file, self.ti_file):
+            with mock.patch('h5py.File', wraps=h5py.File) as h5file:
+                proc = load_proc(filename)
+                self.assertEqual(h5file.call_count, 1)
+            self.assertIsNone(proc._h5file)
+            expected = PostProcessor()
+            expected.config = ConfigurationProcessed()
+            expected.config.filename = filename
+            expected.config.read_from_h5_v5_0_0()
+            for key in ('noLines', 'maxPeakNo', 'numSamp', 'numDaqAcq', 'model'):
+                np.testing.assert_equal(
+                    getattr(proc.config, key), getattr(expected.config, key)
+                )
+            self.assertEqual(proc.config.numSamp, 12)
+
+    def test_reload(self):
+        proc = PostProcessor()
+        proc.load_configuration(self.ti_file)
+        handle = proc._h5file
+        self.assertTrue(handle.id.valid)
+        proc.load_configuration(self.tr_file)
+        self.assertFalse(handle.id.valid)
+        proc.load_transmission()
+        self.assertEqual(proc.data['transientTrans'].shape, (20, 30, 12))
+        # a second load opens the file again
+        proc.load_transmission(lazy=True)
+        self.addCleanup(proc.close)
+        self.assertTrue(proc._h5file.id.valid)
+
+    def test_closed_after_load(self):
+        proc = PostProcessor()
+        proc.load_configuration(self.tr_file)
+        handle = proc._h5file
+        proc.load_transmission()
+        self.assertFalse(handle.id.valid)
+        self.assertIsNone(proc._h5file)
+
+    def test_closed_on_error(self):
+        proc = PostProcessor()
+        proc.load_configuration(self.tr_file)
+        handle = proc._h5file
+        with mock.patch.object(
+            PostProcessor, "_load_acquisitions", side_effect=KeyError("broken")
+        ):
+            with self.assertRaises(KeyError):
+                proc.load_transmission()
+        self.assertFalse(handle.id.valid)
+
+    def test_closed_on_exit(self):
+        with PostProcessor() as proc:
+            proc.load_configuration(self.tr_file)
+            handle = proc._h5file
+            self.assertTrue(handle.id.valid)
+        self.assertFalse(handle.id.valid)
+
+    def test_closed_on_del(self):
+        proc = PostProcessor()
+        proc.load_configuration(self.tr_file)
+        handle = proc._h5file
+        del proc
+        self.assertFalse(handle.id.valid)
+
+    def test_lazy_outlives_processor(self):
+        proc = PostProcessor()
+        proc.load_configuration(self.tr_file)
+        proc.load_transmission(lazy=True)
+        cube = proc.data["transientTrans"]
+        expected = cube[:, :, 3]
+        del proc
+        np.testing.assert_equal(cube[:, :, 3], expected)
+
+
+class TestAcquisitionIndex(SyntheticFilesTestCase):
+    def test_index(self):
+        with h5py.File(self.tr_file, 'r') as f:
+            index = AcquisitionIndex(f['transmission'], prefix='acquisition')
+            # h5py lists the keys alphabetically, acquisition10 before acquisition2
+            self.assertEqual(list(f['transmission'].keys())[2], 'acquisition10')
+            np.testing.assert_equal(index.numbers, np.arange(12))
+            self.assertEqual(len(index), 12)
+            self.assertIn(11, index)
+            self.assertNotIn(12, index)
+            self.assertIs(index[3], index[3])
+            self.assertEqual(index[3].name, '/transmission/acquisition3')
+            self.assertEqual(
+                [v for v, _ in index], [int(g.name[25:]) for _, g in index]
+            )
+
+    def test_hdf5class(self):
+        helper = HDF5Class()
+        with h5py.File(self.tr_file, 'r') as f:
+            group = f['transmission']
+            expected = sorted(
+                int(re.search(r'\d+', name).group(0))
+                for name in group.keys()
+                if re.search(r'\d+', name)
+            )
+            for i, v in enumerate(expected):
+                self.assertEqual(helper.get_name_from_index(group, i), v)
+            self.assertEqual(helper.get_entries(group), len(expected))
+            self.assertIs(
+                helper.acquisition_index(group), helper.acquisition_index(group)
+            )
+            self.assertEqual(helper.get_entries(f['info']), 0)
+            self.assertEqual(helper.get_name_from_index(f['info'], 0), 0)
+
+    def test_cached_on_processor(self):
+        proc = PostProcessor()
+        proc.load_configuration(self.tr_file)
+        proc.load_transmission(lazy=True)
+        self.addCleanup(proc.close)
+        index = proc.acqIndex
+        self.assertIs(proc.acquisition_index(), index)
+        self.assertEqual(proc._acq_order, list(range(12)))
+        proc.close()
+        self.assertIsNone(proc.acqIndex)
+
+    def test_gaps(self):
+        filename = os.path.join(self.tmpdir.name, 'gaps_processed_data.h5')
+        write_synthetic_processed_file(filename, numAcq=4, noLines=30, noTimes=20)
+        expected = load_proc(filename).data['transientTrans']
+        with h5py.File(filename, 'a') as f:
+            for v in (3, 2, 1):
+                f.move(
+                    f'transmission/acquisition{v}', f'transmission/acquisition{5 * v}'
+                )
+        proc = load_proc(filename)
+        self.assertEqual(proc._acq_order, [0, 5, 10, 15])
+        np.testing.assert_equal(proc.data['transientTrans'], expected)
+
+
+class TestLazyTransmission(SyntheticFilesTestCase):
+    def load_lazy(self, filename, **kwargs):
+        proc = PostProcessor()
+        proc.load_configuration(filename)
+        proc.load_transmission(lazy=True, **kwargs)
+        self.addCleanup(proc.close)
+        return proc
+
+    def test_indexing(self):
+        eager = load_proc(self.tr_file).data['transientTrans']
+        lazy = self.load_lazy(self.tr_file, cacheBytes=20000).data['transientTrans']
+        self.assertEqual(lazy.shape, eager.shape)
+        self.assertEqual(lazy.dtype, eager.dtype)
+        for key in [
+            np.s_[..., 3],
+            np.s_[2:9, 4],
+            np.s_[::-2, 1::3, [5, 0, 2]],
+            np.s_[-1],
+        ]:
+            np.testing.assert_equal(np.asarray(lazy[key]), eager[key])
+        np.testing.assert_equal(np.asarray(lazy[5:][..., 2:4]), eager[5:][..., 2:4])
+        np.testing.assert_equal(np.array(lazy), eager)
+        self.assertLessEqual(lazy._cache.nbytes, 20000)
+
+    def test_mean(self):
+        eager = load_proc(self.tr_file).data['transientTrans']
+        lazy = self.load_lazy(self.tr_file).data['transientTrans']
+        for axis in (None, 0, 1, -1):
+            np.testing.assert_allclose(
+                np.mean(lazy[:, :, 2:7], axis=axis),
+                np.mean(eager[:, :, 2:7], axis=axis),
+                rtol=1e-6,
+            )
+
+    def test_mean_complex_1d(self):
+        # older files store the time integrated transmission as a complex 1-D 'y'
+        for numAcq in (1, 4):
+            filename = write_synthetic_processed_file(
+                os.path.join(self.tmpdir.name, f'complex{numAcq}_processed_data.h5'),
+                numAcq=numAcq,
+                noLines=30,
+                configuration='PSC',
+            )
+            with h5py.File(filename, 'a') as f:
+                for v in range(numAcq):
+                    acq = f[f'transmission/acquisition{v}']
+                    y = acq['y'][()]
+                    del acq['y']
+                    acq['y'] = (y[:, 0, 0] + y[:, 0, 1] * 1j).astype(np.complex64)
+            eager = load_proc(filename)
+            lazy = self.load_lazy(filename)
+            with warnings.catch_warnings():
+                warnings.simplefilter(
+                    'error', getattr(np, 'exceptions', np).ComplexWarning
+                )
+                mean = lazy.data['transmission'].mean(axis=-1)
+            np.testing.assert_allclose(
+                mean, np.mean(eager.data['transmission'], axis=-1), rtol=1e-6
+            )
+            self.assertTrue(np.any(mean.imag != 0))
+            for proc in (eager, lazy):
+                proc.acquisition_average(batchSize=3)
+            np.testing.assert_allclose(
+                lazy.data['transmissionAvgOfFiles'],
+                eager.data['transmissionAvgOfFiles'],
+                rtol=1e-6,
+            )
+
+    def test_processing_chain(self):
+        for filename in (self.tr_file, self.ti_file):
+            eager = load_proc(filename)
+            lazy = self.load_lazy(filename)
+            for proc in (eager, lazy):
+                proc.acquisition_average(startIndx=1, stopIndx=8)
+                proc.spectral_smoothing()
+            name = eager.data_name
+            for key in ('AvgOfFiles', 'SpectralAvgOfFiles'):
+                np.testing.assert_allclose(
+                    lazy.data[name + key], eager.data[name + key], rtol=1e-5
+                )
+
+
+class TestStreamingAverage(SyntheticFilesTestCase):
+    def assert_same_average(self, reference, proc):
+        name = reference.data_name
+        for key in (name + 'AvgOfFiles', 'stdAvgOfFiles'):
+            self.assertEqual(proc.data[key].dtype, reference.data[key].dtype)
+            np.testing.assert_allclose(proc.data[key], reference.data[key], rtol=1e-5)
+
+    def test_configurations(self):
+        for noTimes in (None, 20):
+            for configuration in ('ASC', 'PSC'):
+                filename = write_synthetic_processed_file(
+                    os.path.join(
+                        self.tmpdir.name, f'{configuration}_{noTimes}_processed_data.h5'
+                    ),
+                    numAcq=7,
+                    noLines=30,
+                    noTimes=noTimes,
+                    configuration=configuration,
+                )
+                reference = load_proc(filename)
+                reference.acquisition_average(startIndx=1, stopIndx=5)
+                for batchSize in (1, 3, 16):
+                    with self.subTest(
+                        noTimes=noTimes,
+                        configuration=configuration,
+                        batchSize=batchSize,
+                    ):
+                        proc = load_proc(filename)
+                        proc.acquisition_average(
+                            startIndx=1, stopIndx=5, batchSize=batchSize
+                        )
+                        self.assert_same_average(reference, proc)
+
+    def test_lazy(self):
+        for filename in (self.tr_file, self.ti_file):
+            reference = load_proc(filename)
+            reference.acquisition_average()
+            proc = PostProcessor()
+            proc.load_configuration(filename)
+            proc.load_transmission(lazy=True)
+            self.addCleanup(proc.close)
+            proc.acquisition_average(batchSize=5)
+            self.assert_same_average(reference, proc)
+            # a streaming pass does not go through the block cache
+            self.assertEqual(len(proc.data[proc.data_name]._cache), 0)
+
+
+def legacy_std_average(proc, startIndx, stopIndx):
+    temp = 0
+    for i in range(startIndx, stopIndx):
+        if proc.is_timeintegrated():
+            temp += np.power(
+                proc.data['stdPeakAcqs'][:, i]
+                * proc.complexToReal(proc.data[proc.data_name][:, i]),
+                2,
+            )
+        else:
+            temp += np.power(proc.data['stdPeakAcqs'][:, i], 2)
+    return np.sqrt(temp) / (stopIndx - startIndx)
+
+
+class TestVectorisedAverage(SyntheticFilesTestCase):
+    def test_std_average(self):
+        for filename in (self.tr_file, self.ti_file):
+            proc = load_proc(filename)
+            expected = legacy_std_average(proc, 2, 11)
+            for batchSize in (1, 4, 64):
+                with self.subTest(filename=filename, batchSize=batchSize):
+                    std, stdIsAbsolute = proc.std_average(2, 11, batchSize=batchSize)
+                    self.assertEqual(stdIsAbsolute, proc.is_timeintegrated())
+                    self.assertEqual(std.dtype, expected.dtype)
+                    np.testing.assert_allclose(std, expected, rtol=1e-6)
+
+    def test_unnormalizer(self):
+        for filename in (self.tr_file, self.ti_file):
+            proc = load_proc(filename)
+            trans = proc.data[proc.data_name]
+            norm = proc.data['normalizationVector']
+            expected = np.stack(
+                [
+                    np.array([v * norm[..., i] for v in trans[..., i]])
+                    if proc.is_timeresolved()
+                    else trans[..., i] * norm[..., i]
+                    for i in range(trans.shape[-1])
+                ],
+                axis=-1,
+            )
+            with self.subTest(filename=filename):
+                np.testing.assert_equal(unnormalizer(proc), expected)
+                np.testing.assert_equal(unnormalizer(proc, batchSize=5), expected)
+                chunks = [chunk for _, chunk in iter_unnormalized(proc, 5)]
+                np.testing.assert_equal(np.concatenate(chunks, axis=-1), expected)
+                self.assertIs(unnormalizer(proc, inplace=True), trans)
+                np.testing.assert_allclose(trans, expected, rtol=1e-6)
+
+            lazy = PostProcessor()
+            lazy.load_configuration(filename)
+            lazy.load_transmission(lazy=True)
+            self.addCleanup(lazy.close)
+            np.testing.assert_allclose(unnormalizer(lazy), expected, rtol=1e-6)
+            with self.assertRaises(ValueError):
+                unnormalizer(lazy, inplace=True)
+
+
+def legacy_lin_time(time, transient, averaging, interleave):
+    deltatime = np.abs(np.mean(np.gradient(time))) * averaging
+    noSteps = int(np.floor(len(time) / averaging))
+    lintime, lintrans = np.zeros(noSteps), np.zeros(noSteps)
+    for i in range(noSteps):
+        start = np.argmin(
+            np.abs(time - (np.min(time) + i * deltatime - deltatime * (interleave - 1)))
+        )
+        stop = np.argmin(
+            np.abs(
+                time
+                - (time[start + (averaging - 1)] + 2 * deltatime * (interleave - 1))
+            )
+        )
+        lintime[i] = np.mean(time[start : stop + 1])
+        lintrans[i] = np.mean(transient[start : stop + 1])
+    return lintrans, lintime
+
+
+def legacy_log_time(time, transient, noSteps, interleave):
+    indx = np.argsort(time)
+    time, transient = time[indx], transient[indx]
+    transient, time = transient[time > 0], time[time > 0]
+    logtime = np.logspace(np.log10(time[0]), np.log10(time[-1]), noSteps)
+    logtrans = np.zeros(noSteps)
+    start = 0
+    for i in range(noSteps):
+        stop = np.argmin(np.abs(time - logtime[i] * interleave))
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            logtrans[i] = np.mean(transient[start : stop + 1])
+        logtime[i] = np.sqrt(time[start] * time[stop])
+        start = np.argmin(np.abs(time - logtime[i]))
+    return logtrans, logtime
+
+
+class TestTimeRebinning(SyntheticFilesTestCase):
+    def test_nearest_index(self):
+        rng = np.random.default_rng(0)
+        values = np.concatenate([rng.uniform(-2, 12, 50), np.arange(-1, 11, 0.5)])
+        for axis in (
+            np.arange(10.0),
+            np.arange(10.0)[::-1],
+            np.sort(rng.uniform(0, 10, 10)),
+            rng.uniform(0, 10, 10),
+            np.array([3.0]),
+        ):
+            with self.subTest(axis=axis):
+                expected = [np.argmin(np.abs(axis - v)) for v in values]
+                np.testing.assert_equal(nearest_index(axis, values), expected)
+                self.assertEqual(nearest_index(axis, values[0]), expected[0])
+
+    def test_rebin(self):
+        values = np.arange(12.0).reshape(6, 2)
+        rebinned = rebin(values, [0, 2, 4], [1, 4, 3])
+        np.testing.assert_equal(rebinned[:2], [[1, 2], [6, 7]])
+        self.assertTrue(np.all(np.isnan(rebinned[2])))
+
+    def test_transients(self):
+        proc = load_proc(self.tr_file)
+        proc.acquisition_average()
+        time = proc.data['timeAxis']
+        for minWn, maxWn in ((1000, 1000), (1003, 1012)):
+            transient = proc.getTransientInWnRange(minWn, maxWn)
+            for averaging, interleave in ((1, 1), (1, 3), (2, 2), (3, 1.5)):
+                with self.subTest(averaging=averaging, interleave=interleave):
+                    expected = legacy_lin_time(time, transient, averaging, interleave)
+                    result = proc.getTransientWithLinTime(
+                        minWn, maxWn, averaging, interleave
+                    )
+                    for r, e in zip(result, expected, strict=True):
+                        np.testing.assert_allclose(r, e, rtol=1e-9, atol=1e-15)
+            for noSteps, interleave in ((5, 1), (12, 2), (30, 1)):
+                with self.subTest(noSteps=noSteps, interleave=interleave):
+                    expected = legacy_log_time(time, transient, noSteps, interleave)
+                    result = proc.getTransientWithLogTime(
+                        minWn, maxWn, noSteps, interleave
+                    )
+                    np.testing.assert_allclose(result[0], expected[0], rtol=1e-9)
+                    np.testing.assert_equal(result[1], expected[1])
+
+    def test_cube(self):
+        proc = load_proc(self.tr_file)
+        proc.acquisition_average()
+        cube, lintime = proc.getCubeWithLinTime(2, 2)
+        self.assertEqual(cube.shape, (10, 30))
+        for line in (0, 7, 29):
+            wn = proc.data['wnAxis'][line]
+            transient, time = proc.getTransientWithLinTime(wn, wn, 2, 2)
+            np.testing.assert_allclose(cube[:, line], transient, rtol=1e-9)
+            np.testing.assert_allclose(lintime, time, rtol=1e-9)
+        cube, logtime = proc.getCubeWithLogTime(8, 2)
+        self.assertEqual(cube.shape, (8, 30))
+        wn = proc.data['wnAxis'][3]
+        transient, time = proc.getTransientWithLogTime(wn, wn, 8, 2)
+        np.testing.assert_allclose(cube[:, 3], transient, rtol=1e-9)
+        np.testing.assert_equal(logtime, time)
+
+
+class TestTimeWindowIndex(SyntheticFilesTestCase):
+    def windows(self, proc):
+        time = proc.data['timeAxis']
+        return [(time[3], time[3]), (time[0], time[-1]), (time[12], time[4])]
+
+    def test_same_spectra(self):
+        for configuration in ('ASC', 'PSC'):
+            filename = write_synthetic_processed_file(
+                os.path.join(
+                    self.tmpdir.name, f'window_{configuration}_processed_data.h5'
+                ),
+                numAcq=3,
+                noLines=30,
+                noTimes=40,
+                configuration=configuration,
+            )
+            proc = load_proc(filename)
+            proc.acquisition_average()
+            for drift in (False, True):
+                proc.ASC_phase_drift_correction = drift
+                for start, stop in self.windows(proc):
+                    with self.subTest(configuration=configuration, drift=drift):
+                        proc.timeWindowIndex = False
+                        mean = proc.getComplexSpectrum(start, stop)
+                        std = proc.getSpectrumStd(start, stop)
+                        proc.timeWindowIndex = True
+                        indexed = proc.getComplexSpectrum(start, stop)
+                        self.assertEqual(indexed.dtype, mean.dtype)
+                        np.testing.assert_allclose(indexed, mean, rtol=1e-6)
+                        np.testing.assert_allclose(
+                            proc.getSpectrumStd(start, stop), std, rtol=1e-5, atol=1e-9
+                        )
+
+    def test_invalidation(self):
+        proc = load_proc(self.tr_file)
+        proc.acquisition_average()
+        proc.timeWindowIndex = True
+        index = proc.time_window_index()
+        self.assertIs(proc.time_window_index(), index)
+        # an array with the same content keeps the index
+        name = proc.data_name + proc.last_data_type
+        proc.data[name] = proc.data[name].copy()
+        self.assertIs(proc.time_window_index(), index)
+        # a new array or another data type rebuild it
+        proc.data[name] = proc.data[name] * 2
+        start, stop = self.windows(proc)[1]
+        np.testing.assert_allclose(
+            proc.getComplexSpectrum(start, stop),
+            np.mean(proc.data[name], axis=0),
+            rtol=1e-6,
+        )
+        self.assertIsNot(proc.time_window_index(), index)
+        index = proc.time_window_index()
+        proc.spectral_smoothing()
+        self.assertIsNot(proc.time_window_index(), index)
+        index = proc.time_window_index()
+        proc.ASC_phase_drift_correction = True
+        self.assertIsNot(proc.time_window_index(), index)
+
+    def test_invalidation_in_place(self):
+        proc = load_proc(self.tr_file)
+        proc.acquisition_average()
+        proc.timeWindowIndex = True
+        name = proc.data_name + proc.last_data_type
+        start, stop = self.windows(proc)[1]
+        proc.getComplexSpectrum(start, stop)
+        index = proc.time_window_index()
+        proc.data[name] *= 2
+        np.testing.assert_allclose(
+            proc.getComplexSpectrum(start, stop),
+            np.mean(proc.data[name], axis=0),
+            rtol=1e-6,
+        )
+        self.assertIsNot(proc.time_window_index(), index)
+        # a single time slice of a single line
+        proc.data[name][5, 7] += 1
+        np.testing.assert_allclose(
+            proc.getSpectrumStd(start, stop),
+            np.std(proc.complexToReal(proc.data[name]), axis=0)
+            / np.sqrt(len(proc.data[name])),
+            rtol=1e-5,
+            atol=1e-9,
+        )
+
+
+class TestAxisIndex(SyntheticFilesTestCase):
+    def test_nearest_and_range(self):
+        rng = np.random.default_rng(1)
+        targets = np.concatenate([rng.uniform(1590, 1620, 100), [1600.15, 1600.3]])
+        wn = 1600 + 0.3 * np.arange(40)
+        for axis in (wn, wn[::-1], wn[np.newaxis], rng.permutation(wn)):
+            with self.subTest(axis=axis):
+                index = AxisIndex(axis)
+                flat = np.ravel(axis)
+                expected = np.array([np.argmin(np.abs(flat - v)) for v in targets])
+                np.testing.assert_equal(index.nearest(targets), expected)
+                np.testing.assert_equal(
+                    index.nearest(targets.reshape(2, -1)), expected.reshape(2, -1)
+                )
+                self.assertEqual(index.nearest(targets[5]), expected[5])
+                start, stop = index.range(targets[:50], targets[50:100])
+                np.testing.assert_equal(
+                    start, np.minimum(expected[:50], expected[50:100])
+                )
+                np.testing.assert_equal(
+                    stop, np.maximum(expected[:50], expected[50:100]) + 1
+                )
+
+    def test_processor(self):
+        proc = load_proc(self.tr_file)
+        index = proc.axis_index('wnAxis')
+        self.assertIs(proc.axis_index('wnAxis'), index)
+        wn = np.ravel(proc.data['wnAxis'])
+        entries = [wn[3] + 0.01, wn[10], wn[0] - 5]
+        legacy = [list(wn).index(min(wn, key=lambda x: abs(x - v))) for v in entries]
+        self.assertEqual(proc.find_idx(entries, proc.data['wnAxis']), legacy)
+        self.assertEqual(proc.find_idx(entries, list(wn)), legacy)
+        # a calibrated (flipped) axis gives a new index
+        proc.data['wnAxis'] = proc.data['wnAxis'][::-1] + 10
+        self.assertIsNot(proc.axis_index('wnAxis'), index)
+        time = proc.data['timeAxis']
+        self.assertEqual(proc.getStartStop(time[7], time[2]), (2, 8))
+
+
+class TestTransientsInWnRanges(SyntheticFilesTestCase):
+    def setUp(self):
+        self.proc = load_proc(self.tr_file)
+        self.proc.acquisition_average()
+        self.proc.spectral_smoothing()
+        self.wn = np.ravel(self.proc.data['wnAxis'])
+
+    def test_ranges(self):
+        wn = self.wn
+        ranges = [(wn[2], wn[9]), (wn[20], wn[5]), (wn[4], wn[4]), (wn[0] - 50, wn[3])]
+        transients = self.proc.getTransientsInWnRanges(ranges)
+        self.assertEqual(transients.shape, (4, 20))
+        for transient, (minWn, maxWn) in zip(transients, ranges, strict=True):
+            np.testing.assert_allclose(
+                transient, self.proc.getTransientInWnRange(minWn, maxWn), rtol=1e-12
+            )
+        np.testing.assert_allclose(
+            self.proc.getTransientsInWnRanges(wn[[4, 7]]),
+            self.proc.getTransientsInWnRanges([(wn[4], wn[4]), (wn[7], wn[7])]),
+        )
+        self.assertEqual(self.proc.getTransientsInWnRanges([]).shape, (0, 20))
+
+    def test_all_lines(self):
+        transients = self.proc.getTransientsInWnRanges()
+        self.assertEqual(transients.shape, (30, 20))
+        for line in (0, 13, 29):
+            np.testing.assert_allclose(
+                transients[line],
+                self.proc.getTransientInWnRange(self.wn[line], self.wn[line]),
+                rtol=1e-12,
+            )
+
+    def test_transient_plotter(self):
+        centerWn = list(self.wn[[1, 5, 9]])
+        interleave = 3
+        transients, _ = self.proc.transient_plotter(
+            centerWn,
+            time_resolution=interleave * self.proc.config.interleaveTimeStep * 1e3,
+            plot_type='transmission',
+        )
+        expected = [
+            self.proc.getTransientWithLinTime(v, v, averaging=1, interleave=interleave)[
+                0
+            ]
+            for v in centerWn
+        ]
+        np.testing.assert_allclose(transients, expected, rtol=1e-12)
+
+
+def legacy_csv_export(proc, export, ToReal=True, transpose=False):
+    """csv_export before the exporters, np.insert and csv.writer row by row."""
+    data = proc.complexToReal(np.array(export)) if ToReal else np.array(export)
+    WNAxis = np.squeeze(proc.data['wnAxis'])
+    if data.ndim == 1:
+        tables = [(np.insert([data], [0], [WNAxis], axis=0), '_export.csv')]
+    elif data.ndim == 2:
+        if data.shape[0] == len(WNAxis):
+            data = data.T
+        data = np.insert(data, 0, WNAxis, 0)
+        try:
+            tsi = np.array(np.insert(proc.data['timeAxis'], 0, 0, 0))
+        except KeyError:
+            tsi = np.array(np.insert(proc.data['timeStamp'], 0, 0, 0))
+        tables = [(np.insert(data, 0, tsi, 1), '_export.csv')]
+    else:
+        tsi = np.array(np.insert(proc.data['timeAxis'], 0, 0, 0))
+        tables = [
+            (
+                np.insert(np.insert(data[:, :, i], 0, WNAxis, axis=0), 0, tsi, axis=1),
+                f'_export_acquisition{i + 1}.csv',
+            )
+            for i in range(data.shape[-1])
+        ]
+    contents = {}
+    for table, suffix in tables:
+        if transpose:
+            table = np.transpose(table)
+        buffer = io.StringIO(newline='')
+        wr = csv.writer(
+            buffer, dialect='excel', quoting=csv.QUOTE_NONE, escapechar='\\'
+        )
+        for v in table:
+            wr.writerow(v)
+        contents[proc.config.filename[:-18] + suffix] = buffer.getvalue()
+    return contents
+
+
+class TestExporters(SyntheticFilesTestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tr = load_proc(
+            shutil.copy(self.tr_file, os.path.join(tmpdir.name, 'tr_processed_data.h5'))
+        )
+        self.tr.acquisition_average()
+        self.ti = load_proc(
+            shutil.copy(self.ti_file, os.path.join(tmpdir.name, 'ti_processed_data.h5'))
+        )
+        self.ti.acquisition_average()
+
+    def assert_same_csv(self, proc, export, **kwargs):
+        expected = legacy_csv_export(proc, export, **kwargs)
+        filenames = proc.csv_export(export, chunkRows=7, **kwargs)
+        self.assertEqual(filenames, list(expected))
+        for filename in filenames:
+            with open(filename, newline='') as f:
+                self.assertEqual(f.read(), expected[filename])
+            os.remove(filename)
+
+    def test_csv_same_as_before(self):
+        tr, ti = self.tr, self.ti
+        for transpose in (False, True):
+            self.assert_same_csv(
+                tr, tr.data['transientTransAvgOfFiles'], transpose=transpose
+            )
+            self.assert_same_csv(ti, ti.data['transmission'], transpose=transpose)
+            self.assert_same_csv(
+                ti, ti.data['transmissionAvgOfFiles'], transpose=transpose
+            )
+            self.assert_same_csv(
+                tr, tr.data['transientTransAvgOfFiles'][3], transpose=transpose
+            )
+        # float64 and complex values
+        real = tr.complexToReal(tr.data['transientTransAvgOfFiles'])
+        self.assert_same_csv(tr, real.astype(np.float64), ToReal=False)
+        self.assert_same_csv(ti, ti.data['transmission'], ToReal=False)
+        # one file per acquisition
+        self.assert_same_csv(tr, tr.data['transientTrans'])
+        self.assert_same_csv(tr, tr.data['transientTrans'][..., :2], transpose=True)
+        self.assert_same_csv(tr, tr.data['transientTrans'][..., :3], ToReal=False)
+
+    def test_binary(self):
+        tr = self.tr
+        data = tr.complexToReal(tr.data['transientTrans'])
+        (filename,) = tr.csv_export(tr.data['transientTrans'], fileFormat='npz')
+        self.assertTrue(filename.endswith('tr_export.npz'))
+        with np.load(filename) as f:
+            np.testing.assert_equal(f['data'], data)
+            np.testing.assert_equal(f['wnAxis'], np.squeeze(tr.data['wnAxis']))
+            np.testing.assert_equal(f['timeAxis'], tr.data['timeAxis'])
+
+        tr.exportFormat = 'hdf5'
+        (filename,) = tr.csv_export(tr.data['transientTrans'])
+        self.assertTrue(filename.endswith('tr_export.h5'))
+        with h5py.File(filename, 'r') as f:
+            np.testing.assert_equal(f['data'][()], data)
+            np.testing.assert_equal(f['wnAxis'][()], np.squeeze(tr.data['wnAxis']))
+            np.testing.assert_equal(f['timeAxis'][()], tr.data['timeAxis'])
+
+        (filename,) = self.ti.csv_export(self.ti.data['transmission'], fileFormat='npz')
+        with np.load(filename) as f:
+            self.assertEqual(f['data'].shape, (12, 30))
+            self.assertIn('timeAxis', f)
+
+        with self.assertRaises(ValueError):
+            tr.csv_export(tr.data['transientTrans'], fileFormat='xlsx')
+
+    def test_parquet(self):
+        tr = self.tr
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            with self.assertRaises(ImportError):
+                tr.csv_export(tr.data['transientTrans'], fileFormat='parquet')
+            self.skipTest('pyarrow is not installed')
+        (filename,) = tr.csv_export(tr.data['transientTrans'], fileFormat='parquet')
+        table = pq.read_table(filename)
+        self.assertEqual(table.num_rows, 20 * 12)
+        self.assertEqual(table.column_names[:2], ['acquisition', 'timeAxis'])
+        data = tr.complexToReal(tr.data['transientTrans'])
+        np.testing.assert_equal(
+            np.array(table.columns[2 + 5]).reshape(12, 20), data[:, 5].T
+        )
+
+
+def legacy_spectral_smoothing(
+    proc, spectralHalfWidth, gaussianConvolve, gaussianWNsigma, threshold
+):
+    """The per-line loop spectral_smoothing used before it was vectorised."""
+    old_avg = np.copy(proc.data[proc.data_name + 'AvgOfFiles'])
+    new_avg = np.copy(old_avg)
+    old_avg_indiv = np.copy(proc.data[proc.data_name])
+    new_avg_indiv = np.copy(old_avg_indiv)
+    noLines = old_avg.shape[-1]
+    if gaussianConvolve:
+        sigma = abs(gaussianWNsigma / (proc.data['wnAxis'][1] - proc.data['wnAxis'][0]))
+        spectralHalfWidth = int(np.ceil(sigma)) * 3
+    for i in range(noLines):
+        start = max(0, i - spectralHalfWidth)
+        stop = min(i + spectralHalfWidth + 1, noLines)
+        if gaussianConvolve:
+            args = (start, stop, i, sigma, threshold)
+        else:
+            args = (start, stop, threshold)
+        weight = proc.weights(*args)
+        if proc.is_timeresolved():
+            new_avg[:, i] = proc.smoothingAvg(old_avg, start, stop, weight)
+        else:
+            new_avg[i] = proc.smoothingAvg(old_avg, start, stop, weight)
+            new_avg_indiv[i, :] = proc.smoothingAvgIndiv(
+                old_avg_indiv, start, stop, proc.weights(*args, individual=True)
+            )
+    return new_avg, new_avg_indiv.T
+
+
+class TestSpectralSmoothing(SyntheticFilesTestCase):
+    def test_matches_per_line_loop(self):
+        for filename in (self.tr_file, self.ti_file):
+            proc = load_proc(filename)
+            proc.acquisition_average()
+            # a few noisy lines, so that the threshold removes whole windows
+            proc.data['stdAvgOfFiles'][8:24] = 0.5
+            proc.data['stdPeakAcqs'][:14, :4] = 0.5
+            for kwargs in (
+                dict(spectralHalfWidth=0, gaussianConvolve=False),
+                dict(spectralHalfWidth=3, gaussianConvolve=False, threshold=0.1),
+                dict(gaussianConvolve=True, gaussianWNsigma=0.6),
+                dict(gaussianConvolve=True, gaussianWNsigma=0.4, threshold=0.1),
+            ):
+                with self.subTest(filename=filename, **kwargs):
+                    expected, expected_indiv = legacy_spectral_smoothing(
+                        proc,
+                        kwargs.get('spectralHalfWidth', 0),
+                        kwargs['gaussianConvolve'],
+                        kwargs.get('gaussianWNsigma', 0.6),
+                        kwargs.get('threshold', 1),
+                    )
+                    proc.spectral_smoothing(**kwargs)
+                    name = proc.data_name
+                    result = proc.data[name + 'SpectralAvgOfFiles']
+                    self.assertEqual(result.dtype, expected.dtype)
+                    np.testing.assert_allclose(result, expected, rtol=1e-6)
+                    if proc.is_timeintegrated():
+                        np.testing.assert_allclose(
+                            proc.data[name + 'SpectralAvgOfIndividualFiles'],
+                            expected_indiv,
+                            rtol=1e-6,
+                        )
+
+    def test_weights_cache(self):
+        proc = load_proc(self.ti_file)
+        proc.acquisition_average()
+        proc.spectral_smoothing(gaussianWNsigma=0.6)
+        weights = proc.smoothing_weights(30, 6, 2.0)
+        self.assertIs(proc.smoothing_weights(30, 6, 2.0), weights)
+        self.assertIsNot(proc.smoothing_weights(30, 6, 2.0, threshold=0.1), weights)
+
+        first = proc.data[proc.data_name + 'SpectralAvgOfFiles'].copy()
+        proc.data['stdAvgOfFiles'][5] = 1e3
+        self.assertIsNot(proc.smoothing_weights(30, 6, 2.0), weights)
+        proc.spectral_smoothing(gaussianWNsigma=0.6)
+        self.assertFalse(
+            np.allclose(proc.data[proc.data_name + 'SpectralAvgOfFiles'], first)
+        )
+
+        proc.smoothingCacheSize = 2
+        for sigma in (1.0, 2.0, 3.0):
+            proc.smoothing_weights(30, 6, sigma)
+        self.assertEqual(len(proc._smoothingCache), 2)
+
+
+def read_csv(filename):
+    with open(filename, newline='') as f:
+        return np.array([[float(v) for v in row] for row in csv.reader(f)])
+
+
+class TestBatchPostProcessing(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        folder = os.path.join(self.tmpdir.name, 'day')
+        os.mkdir(folder)
+        self.files = [
+            write_synthetic_processed_file(
+                os.path.join(folder, f'm{v}_processed_data.h5'),
+                numAcq=4,
+                noLines=30,
+                noTimes=8 if v == 2 else None,
+                seed=v,
+            )
+            for v in range(3)
+        ]
+        self.calib_file = os.path.join(folder, 'calib_calibrated_processed_data.h5')
+        write_synthetic_processed_file(self.calib_file, numAcq=3, noLines=30, seed=9)
+        with h5py.File(self.calib_file, 'a') as f:
+            f['info/calibrationFlipped'] = False
+            f['info/first_wn_axis'][...] += 2.1
+        self.broken = os.path.join(folder, 'broken_processed_data.h5')
+        with open(self.broken, 'w') as f:
+            f.write('not an hdf5 file')
+
+        self.parameters = BatchPostProcessing.read_parameters()
+        self.parameters['calibration']['calibFilename'] = self.calib_file
+        self.folder = folder
+
+    def expected(self, filename):
+        proc = load_proc(filename)
+        proc.calibrateWNaxisOfMeasurement(calibFilename=self.calib_file)
+        proc.acquisition_average()
+        proc.spectral_smoothing()
+        return proc
+
+    def test_import_keeps_backend(self):
+        # only the CLI and the pool processes switch matplotlib to Agg
+        code = (
+            'import matplotlib\n'
+            'from heterodyne_postprocessing import BatchPostProcessing\n'
+            'print(matplotlib.get_backend())\n'
+        )
+        src = os.path.dirname(os.path.dirname(BatchPostProcessing.__file__))
+        env = dict(os.environ, MPLBACKEND='svg', PYTHONPATH=src)
+        output = subprocess.run(
+            [sys.executable, '-c', code],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        self.assertEqual(output.strip().splitlines()[-1], 'svg')
+
+    def test_find_measurements(self):
+        found = BatchPostProcessing.find_measurements(
+            [self.folder, os.path.join(self.folder, 'm*_processed_data.h5')],
+            exclude=[self.calib_file],
+        )
+        self.assertEqual(found, sorted(self.files + [self.broken]))
+
+    def test_read_parameters(self):
+        filename = os.path.join(self.tmpdir.name, 'parameters.json')
+        with open(filename, 'w') as f:
+            json.dump({'smoothing': {'gaussianWNsigma': 1.2}}, f)
+        parameters = BatchPostProcessing.read_parameters(filename)
+        self.assertEqual(parameters['smoothing']['gaussianWNsigma'], 1.2)
+        self.assertEqual(parameters['smoothing']['threshold'], 1)
+        with open(filename, 'w') as f:
+            json.dump({'smoothing': {'sigma': 1.2}}, f)
+        with self.assertRaises(ValueError):
+            BatchPostProcessing.read_parameters(filename)
+
+    def test_process_files(self):
+        calibration = BatchPostProcessing.load_calibration(self.parameters)
+        filenames = self.files + [self.broken]
+        for workers in (1, 2):
+            lines = []
+            results = BatchPostProcessing.process_files(
+                filenames,
+                self.parameters,
+                workers=workers,
+                calibration=calibration,
+                report=lines.append,
+            )
+            self.assertEqual([v.filename for v in results], filenames)
+            self.assertEqual([v.ok for v in results], [True, True, True, False])
+            self.assertEqual(len(lines), 4)
+            self.assertIn('1 failed', BatchPostProcessing.summary(results, 1.0))
+
+        for filename in self.files[:2]:
+            proc = self.expected(filename)
+            exported = read_csv(filename[:-18] + '_export.csv')
+            np.testing.assert_allclose(exported[0], proc.data['wnAxis'])
+            np.testing.assert_allclose(
+                exported[1],
+                proc.complexToReal(proc.data['transmissionSpectralAvgOfFiles']),
+                rtol=1e-6,
+            )
+        self.assertTrue(os.path.exists(self.files[2][:-18] + '_export.csv'))
+
+    def test_main(self):
+        filename = os.path.join(self.tmpdir.name, 'parameters.json')
+        with open(filename, 'w') as f:
+            json.dump({'export': {'data': 'AvgOfFiles'}}, f)
+        os.remove(self.broken)
+        shutil.copy(
+            self.files[0], os.path.join(self.tmpdir.name, 'x_processed_data.h5')
+        )
+        self.assertEqual(
+            BatchPostProcessing.main([self.folder, filename, '--workers', '1']), 0
+        )
+        for filename in self.files:
+            self.assertTrue(os.path.exists(filename[:-18] + '_export.csv'))
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, 'x_export.csv')))
+
+
+class TestCalibrationCache(SyntheticFilesTestCase):
+    def setUp(self):
+        self.calib_file = os.path.join(
+            self.tmpdir.name, 'calib_calibrated_processed_data.h5'
+        )
+        write_synthetic_processed_file(self.calib_file, numAcq=3, noLines=30, seed=9)
+        with h5py.File(self.calib_file, 'a') as f:
+            f['info/calibrationFlipped'] = True
+        PostProcessorCalibration._calibrationCache.clear()
+        self.addCleanup(PostProcessorCalibration._calibrationCache.clear)
+
+    def read_uncached(self, **kwargs):
+        proc = PostProcessor()
+        proc.data = {}
+        proc.read_preCalibratedMeasurement(self.calib_file, **kwargs)
+        return proc.calibration_data()
+
+    def assert_calibration_equal(self, calibration, expected):
+        self.assertEqual(calibration.keys(), expected.keys())
+        for key, value in expected.items():
+            np.testing.assert_equal(calibration[key], value)
+
+    def test_memory_cache(self):
+        expected = self.read_uncached()
+        with mock.patch.object(
+            PostProcessorCalibration,
+            'read_preCalibratedMeasurement',
+            autospec=True,
+            side_effect=PostProcessorCalibration.read_preCalibratedMeasurement,
+        ) as read:
+            for _ in range(3):
+                proc = load_proc(self.ti_file)
+                proc.calibrateWNaxisOfMeasurement(calibFilename=self.calib_file)
+                self.assertTrue(proc.flipped)
+            self.assertEqual(read.call_count, 1)
+            calibration = proc.read_calibration(self.calib_file)
+            self.assertEqual(read.call_count, 1)
+            self.assert_calibration_equal(calibration, expected)
+
+            proc.read_calibration(self.calib_file, start=1)
+            self.assertEqual(read.call_count, 2)
+            os.utime(self.calib_file, ns=(0, 0))
+            proc.read_calibration(self.calib_file)
+            self.assertEqual(read.call_count, 3)
+
+        # the arrays handed out are not shared with the cache
+        proc.read_calibration(self.calib_file)['wnAxisCalib'][:] = 0
+        self.assert_calibration_equal(proc.read_calibration(self.calib_file), expected)
+
+        reference = load_proc(self.ti_file)
+        reference.read_preCalibratedMeasurement(self.calib_file)
+        reference.add_lag_measurement(plotOn=False)
+        proc = load_proc(self.ti_file)
+        proc.calibrateWNaxisOfMeasurement(calibFilename=self.calib_file)
+        np.testing.assert_equal(proc.data['wnAxis'], reference.data['wnAxis'])
+
+    def test_sidecar(self):
+        expected = self.read_uncached(specHalfWidth=2)
+        proc = PostProcessor()
+        proc.read_calibration(self.calib_file, specHalfWidth=2, sidecar=True)
+        sidecar = self.calib_file[:-3] + '.calibcache.h5'
+        self.assertTrue(os.path.exists(sidecar))
+
+        PostProcessorCalibration._calibrationCache.clear()
+        with mock.patch.object(
+            PostProcessorCalibration, 'read_preCalibratedMeasurement'
+        ) as read:
+            calibration = proc.read_calibration(
+                self.calib_file, specHalfWidth=2, sidecar=True
+            )
+            read.assert_not_called()
+        self.assert_calibration_equal(calibration, expected)
+
+        # a recalibrated file does not use the sidecar anymore
+        PostProcessorCalibration._calibrationCache.clear()
+        with h5py.File(self.calib_file, 'a') as f:
+            f['info/calibrationFlipped'][()] = False
+        os.utime(self.calib_file, ns=(0, 0))
+        calibration = proc.read_calibration(
+            self.calib_file, specHalfWidth=2, sidecar=True
+        )
+        self.assertFalse(calibration['flipped'])
+
+
+class TestLagEstimation(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.reference = rng.uniform(0, 1, 200)
+        self.signals = rng.uniform(0, 1, (20, 200))
+
+    def test_cross_correlation(self):
+        for signal in (self.signals[0], self.signals[1][:150]):
+            lags, corr = cross_correlation(self.reference, signal)
+            expected = np.correlate(self.reference, signal, 'full')
+            np.testing.assert_allclose(corr, expected, rtol=1e-10, atol=1e-10)
+            np.testing.assert_equal(lags, np.arange(len(expected)) - len(signal) + 1)
+
+            lags, corr = cross_correlation(self.reference, signal, maxLag=5)
+            np.testing.assert_equal(lags, np.arange(-5, 6))
+            np.testing.assert_allclose(
+                corr, expected[len(signal) - 6 : len(signal) + 5], rtol=1e-10
+            )
+
+    def test_integer_lag(self):
+        """The default is the lag of the previous np.correlate implementation"""
+        # shifted copies of the reference with some noise
+        rng = np.random.default_rng(1)
+        shifts = rng.integers(-30, 30, len(self.signals))
+        signals = np.array([np.roll(self.reference, -v) for v in shifts])
+        signals += 0.05 * self.signals
+        lags = estimate_lag(self.reference, signals)
+        expected = [
+            float(np.argmax(np.correlate(self.reference, v, 'full'))) - len(v) + 1
+            for v in signals
+        ]
+        np.testing.assert_equal(lags, expected)
+        np.testing.assert_equal(lags, shifts)
+        self.assertEqual(estimate_lag(self.reference, signals[3]), expected[3])
+        self.assertIsInstance(estimate_lag(self.reference, signals[3]), float)
+
+        # a larger peak outside of the window is ignored
+        lags = estimate_lag(self.reference, signals, maxLag=10)
+        inside = np.abs(shifts) <= 10
+        np.testing.assert_equal(lags[inside], shifts[inside])
+        self.assertTrue(np.all(np.abs(lags) <= 10))
+
+    def test_subsample(self):
+        x = np.arange(300.0)
+        reference = np.exp(-(((x - 150) / 8) ** 2))
+        for shift in (-12.3, 0.0, 4.4, 20.5):
+            signal = np.exp(-(((x - 150 + shift) / 8) ** 2))
+            self.assertEqual(estimate_lag(reference, signal), np.round(shift))
+            self.assertAlmostEqual(
+                estimate_lag(reference, signal, subsample=True), shift, delta=0.05
+            )
+
+    def test_lagged_wn_axis(self):
+        wn_calib = 1600.0 + 0.3 * np.arange(50)
+        axis = lagged_wn_axis(wn_calib, 2.0, 50)
+        np.testing.assert_allclose(axis, wn_calib + 0.6)
+        axes = lagged_wn_axis(wn_calib[:, np.newaxis], np.array([0.0, -1.5]), 50)
+        self.assertEqual(axes.shape, (2, 50))
+        np.testing.assert_allclose(axes[1], wn_calib - 0.45)
+
+
+def synthetic_reference(seed=0):
+    """Transmission of an FTIR reference with 60 Lorentzian absorption lines"""
+    rng = np.random.default_rng(seed)
+    wn = np.linspace(1500, 1800, 6000)
+    transmission = np.ones_like(wn)
+    for center, width, depth in zip(
+        rng.uniform(1500, 1800, 60),
+        rng.uniform(0.3, 1.5, 60),
+        rng.uniform(0.1, 0.6, 60),
+        strict=True,
+    ):
+        transmission -= depth / (1 + ((wn - center) / width) ** 2)
+    return wn, np.clip(transmission, 0, 1)
+
+
+class TestWnCalibration(unittest.TestCase):
+    def setUp(self):
+        self.wn_ref, self.tr_ref = synthetic_reference()
+        self.rng = np.random.default_rng(1)
+
+    def measured(self, center, spacing, flipped, noise=0.002, n=150):
+        wn = calibration_axis(n, center, spacing, flipped)
+        transmission = 0.8 * np.interp(wn, self.wn_ref, self.tr_ref) + 0.05
+        return wn, transmission + noise * self.rng.standard_normal(n)
+
+    def test_fit(self):
+        initial = calibration_axis(150, 1650.0, 0.3)
+        for center, spacing, flipped in ((1652.3, 0.31, True), (1630.7, 0.29, False)):
+            wn, transmission = self.measured(center, spacing, flipped)
+            # the reference is given decreasing and as column, like in the .mat file
+            fit = fit_wn_calibration(
+                initial, transmission, self.wn_ref[::-1, None], self.tr_ref[::-1, None]
+            )
+            self.assertTrue(fit.success)
+            self.assertEqual(fit.flipped, flipped)
+            self.assertAlmostEqual(fit.center, center, delta=0.02)
+            self.assertAlmostEqual(fit.spacing, spacing, delta=5e-4)
+            self.assertAlmostEqual(fit.amplitude, 1 / 0.8, delta=0.02)
+            np.testing.assert_allclose(fit.wnAxis, wn, atol=0.05)
+            self.assertGreater(fit.r2, 0.99)
+            self.assertEqual(fit.overlap, 1)
+            self.assertIn(f'flipped   : {flipped}', fit.report())
+
+        fit = fit_wn_calibration(
+            initial, transmission, self.wn_ref, self.tr_ref, flipped=True
+        )
+        self.assertTrue(fit.flipped)
+        self.assertLess(fit.r2, 0.9)
+
+        with self.assertRaises(ValueError):
+            fit_wn_calibration(initial + 1000, transmission, self.wn_ref, self.tr_ref)
+
+    def test_partial_overlap(self):
+        """The reference ends inside the measured lines and repeats a pattern of 10 cm-1:
+        the axis shifted by +10 cm-1 fits its smaller overlap as well as the true one."""
+        rng = np.random.default_rng(3)
+        wn_ref = np.linspace(1500, 1620, 4800)
+        tr_ref = np.ones_like(wn_ref)
+        for center, width, depth in zip(
+            rng.uniform(1500, 1560, 20),
+            rng.uniform(0.3, 1.5, 20),
+            rng.uniform(0.1, 0.6, 20),
+            strict=True,
+        ):
+            tr_ref -= depth / (1 + ((wn_ref - center) / width) ** 2)
+        for center, depth in ((1554.5, 0.6), (1556, 0.5), (1557.5, 0.6), (1559, 0.5)):
+            tr_ref -= depth / (1 + ((wn_ref - center) / 0.3) ** 2)
+        for period in range(7):
+            for offset, depth, width in (
+                (2, 0.5, 0.6),
+                (5.5, 0.25, 1.0),
+                (7, 0.35, 0.4),
+            ):
+                tr_ref -= depth / (
+                    1 + ((wn_ref - (1560 + 10 * period + offset)) / width) ** 2
+                )
+        tr_ref = np.clip(tr_ref, 0, 1)
+
+        # 80 % of the lines are inside the reference, 58 % for the shifted axis
+        wn = calibration_axis(150, 1586.5, 0.3)
+        transmission = 0.8 * np.interp(wn, wn_ref, tr_ref) + 0.05
+        transmission += 0.01 * rng.standard_normal(150)
+        inside = wn_ref <= 1600
+        initial = calibration_axis(150, 1590.0, 0.3)
+        fit = fit_wn_calibration(
+            initial, transmission, wn_ref[inside], tr_ref[inside], flipped=False
+        )
+        self.assertAlmostEqual(fit.center, 1586.5, delta=0.05)
+        self.assertAlmostEqual(fit.overlap, 0.8, delta=0.01)
+
+        fit = fit_wn_calibration(
+            initial,
+            transmission,
+            wn_ref[inside],
+            tr_ref[inside],
+            flipped=False,
+            minOverlap=0.9,
+        )
+        self.assertGreaterEqual(fit.overlap, 0.9)
+
+    def test_calibrate_calibration_headless(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        calib_file = write_synthetic_processed_file(
+            os.path.join(tmpdir.name, 'calib_processed_data.h5'), numAcq=3, noLines=150
+        )
+        wn, transmission = self.measured(1652.3, 0.31, False, noise=0)
+        with h5py.File(calib_file, 'a') as f:
+            f['info/first_wn_axis'][...] = calibration_axis(150, 1650.0, 0.3)
+            for v in range(3):
+                f[f'transmission/acquisition{v}/y'][:, 0, 0] = transmission
+                f[f'transmission/acquisition{v}/y'][:, 0, 1] = 0
+        ref_file = os.path.join(tmpdir.name, 'reference.mat')
+        scipy.io.savemat(
+            ref_file, {'calibWn': self.wn_ref[:, None], 'calibTr': self.tr_ref[:, None]}
+        )
+
+        proc = load_proc(calib_file)
+        proc.calibrateWNaxisOfCalibration(
+            calibFilename=calib_file, refFilename=ref_file, manual=False
+        )
+        self.assertGreater(proc.calibrationFit.r2, 0.99)
+        calibrated = calib_file.replace(
+            'processed_data.h5', 'calibrated_processed_data.h5'
+        )
+        with h5py.File(calibrated, 'r') as f:
+            np.testing.assert_allclose(f['info/first_wn_axis'][()], wn, atol=0.01)
+            self.assertFalse(f['info/calibrationFlipped'][()])
+
+    def test_calibrate_calibration_no_overlap(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        calib_file = write_synthetic_processed_file(
+            os.path.join(tmpdir.name, 'calib_processed_data.h5'), numAcq=3, noLines=150
+        )
+        ref_file = os.path.join(tmpdir.name, 'reference.mat')
+        scipy.io.savemat(
+            ref_file,
+            {
+                'calibWn': self.wn_ref[:, None] + 1000,
+                'calibTr': self.tr_ref[:, None],
+            },
+        )
+
+        proc = load_proc(calib_file)
+        with self.assertRaises(ValueError):
+            proc.calibrateWNaxisOfCalibration(
+                calibFilename=calib_file, refFilename=ref_file, manual=False
+            )
+        # the manual calibration starts from the uncalibrated axis
+        with mock.patch.object(PostProcessor, 'manual_calibration') as manual:
+            with self.assertWarnsRegex(UserWarning, 'does not overlap'):
+                proc.calibrateWNaxisOfCalibration(
+                    calibFilename=calib_file, refFilename=ref_file
+                )
+        manual.assert_called_once_with(None)
+        self.assertIsNone(proc.calibrationFit)
@@ -0,0 +1,93 @@
+import os
+import unittest
+
+import numpy as np
+import Orange.data
+
+from orangecontrib.protospec.preprocess import spectral_smoothing
+
+
+def legacy_spectral_smoothing(data, spectralHalfWidth, stdPeak):
+    """The per-column loop of scripts/spectral_smoothing.py before it was vectorised."""
+    new_avg = np.copy(data)
+    std_inv_sq = 1 / stdPeak**2
+    for i in range(data.shape[-1]):
+        start = max(0, i - spectralHalfWidth)
+        stop = min(i + spectralHalfWidth + 1, data.shape[-1])
+        weight = std_inv_sq[start:stop] / np.sum(std_inv_sq[start:stop])
+        new_avg[:, i] = np.mean(data[:, start:stop] * weight * (stop - start), axis=-1)
+    return new_avg
+
+
+class TestSpectralSmoothing(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = 1 + 0.01 * rng.standard_normal((50, 40))
+        self.std = rng.uniform(0.001, 0.05, 40)
+
+    def test_matches_per_column_loop(self):
+        for half_width in (0, 1, 5, 60):
+            np.testing.assert_allclose(
+                spectral_smoothing(self.X, half_width, self.std),
+                legacy_spectral_smoothing(self.X, half_width, self.std),
+                rtol=1e-12,
+            )
+
+    def test_chunks_and_in_place(self):
+        expected = spectral_smoothing(self.X, 5, self.std)
+        np.testing.assert_allclose(
+            spectral_smoothing(self.X, 5, self.std, chunk_rows=7), expected, rtol=1e-14
+        )
+        X = self.X.copy()
+        self.assertIs(spectral_smoothing(X, 5, self.std, out=X, chunk_rows=7), X)
+        np.testing.assert_allclose(X, expected, rtol=1e-14)
+
+    def test_non_finite(self):
+        X = self.X.copy()
+        X[3, 10] = np.nan
+        X[7, 20] = np.inf
+        X[7, 22] = -np.inf
+        X[9, 30] = np.inf
+        with np.errstate(invalid="ignore"):
+            expected = legacy_spectral_smoothing(X, 5, self.std)
+        smoothed = spectral_smoothing(X, 5, self.std, chunk_rows=4)
+        np.testing.assert_allclose(smoothed, expected, rtol=1e-12)
+        # the NaN only reaches the columns of its window
+        np.testing.assert_equal(np.nonzero(np.isnan(smoothed[3]))[0], np.arange(5, 16))
+        self.assertEqual(np.isnan(smoothed).sum(), 11 + 9)
+        self.assertEqual(np.isposinf(smoothed[9]).sum(), 11)
+
+    def test_zero_std(self):
+        std = self.std.copy()
+        std[12] = 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            expected = legacy_spectral_smoothing(self.X, 5, std)
+        smoothed = spectral_smoothing(self.X, 5, std)
+        np.testing.assert_allclose(smoothed, expected, rtol=1e-12)
+        np.testing.assert_equal(
+            np.nonzero(np.isnan(smoothed).all(axis=0))[0], np.arange(7, 18)
+        )
+        self.assertFalse(np.isnan(np.delete(smoothed, np.s_[7:18], axis=1)).any())
+
+    def test_script(self):
+        domain = Orange.data.Domain(
+            [Orange.data.ContinuousVariable(str(i)) for i in range(40)],
+            metas=[Orange.data.ContinuousVariable("Time")],
+        )
+        time = np.tile(np.arange(-5, 5), 5)[:, None]
+        in_data = Orange.data.Table.from_numpy(domain, self.X, metas=time)
+        script = os.path.join(
+            os.path.dirname(__file__), "..", "scripts", "spectral_smoothing.py"
+        )
+        with open(script) as f:
+            source = f.read().replace("TIME_RESOLVED = False", "TIME_RESOLVED = True")
+        namespace = {"in_data": in_data}
+        exec(compile(source, script, "exec"), namespace)
+        std = np.std(self.X[:5], axis=0)
+        np.testing.assert_allclose(
+            namespace["out_data"].X,
+            legacy_spectral_smoothing(self.X, 5, std),
+            rtol=1e-12,
+        )
+        np.testing.assert_equal(namespace["out_data"].metas, in_data.metas)
+        np.testing.assert_equal(namespace["out_object"].X, std[None])